@@ -0,0 +1,26 @@
+from rest_framework import mixins, status, viewsets
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import ApiToken
+from .serializers import ApiTokenSerializer
+from .tokens import create_token
+
+
+class ApiTokenViewSet(mixins.ListModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """/api/tokens/ 自分のAPIのトークンの一覧、発行(POST)、削除(DELETE)
+
+    トークンそのものは発行したときのレスポンス(key)にしか含まれない。
+    """
+    serializer_class = ApiTokenSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = None
+
+    def get_queryset(self):
+        return ApiToken.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token, key = create_token(request.user, serializer.validated_data.get("name", ""))
+        return Response({**self.get_serializer(token).data, "key": key}, status=status.HTTP_201_CREATED)
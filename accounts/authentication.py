@@ -0,0 +1,33 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from .tokens import authenticate_key
+
+
+class ApiTokenAuthentication(BaseAuthentication):
+    """Authorization: Token <トークン> で認証する。request.auth は ApiToken のid
+
+    セッションを使わないので、CSRFトークンは必要ない。
+    """
+    keyword = "Token"
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_("Invalid token header. No credentials provided."))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _("Invalid token header. Token string should not contain invalid characters.")
+            )
+        result = authenticate_key(key)
+        if result is None:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+        return result
+
+    def authenticate_header(self, request):
+        return self.keyword
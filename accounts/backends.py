@@ -0,0 +1,49 @@
+"""ログインしているユーザーをキャッシュから読む認証バックエンド(AUTH_CACHE=True)
+
+AuthenticationMiddleware はリクエストのたびにセッションのユーザーをDBから読むので、読んだユーザーをキャッシュに入れる。
+ユーザーを保存・削除したとき(ニックネームやパスワードの変更、無効化など)はシグナルでキャッシュを消す。
+キャッシュを消してもほかのワーカーに届くのは共有のキャッシュ(CACHE_SHARED)だけなので、なければキャッシュせずにDBから読む。
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+
+USER_KEY = "accounts:user:{user_id}"
+
+
+def forget_user(user_id):
+    """user_idのキャッシュを消す
+
+    コミット前に別のリクエストが読んだ古いユーザーがキャッシュされないように、コミットしたあとにもう一度消す。
+    """
+    key = USER_KEY.format(user_id=user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not settings.CACHE_SHARED:
+            return super().get_user(user_id)
+        key = USER_KEY.format(user_id=user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        if not settings.CACHE_SHARED:
+            return await super().aget_user(user_id)
+        key = USER_KEY.format(user_id=user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is None:
+                return None
+            await cache.aset(key, user, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
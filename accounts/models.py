@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
@@ -7,3 +8,22 @@ class CustomUser(AbstractUser):
     nickname = models.CharField(max_length=50, blank=True)
     class Meta:
         verbose_name_plural = "CustomUser"
+
+
+class ApiToken(models.Model):
+    """APIのトークン(Authorization: Token <トークン>)
+
+    トークンそのものは保存せず、SHA-256のハッシュを保存する。削除すると使えなくなる。
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="api_tokens")
+    name = models.CharField(max_length=50, blank=True)
+    # 一覧でトークンを見分けるための先頭の文字
+    prefix = models.CharField(max_length=8)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+
+    def __str__(self):
+        return f"{self.user} {self.prefix}… {self.name}"
@@ -0,0 +1,10 @@
+from rest_framework import serializers
+
+from .models import ApiToken
+
+
+class ApiTokenSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ApiToken
+        fields = ["id", "name", "prefix", "created_at"]
+        read_only_fields = ["prefix", "created_at"]
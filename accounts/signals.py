@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import tokens
+from .backends import forget_user
+from .models import ApiToken
+
+
+@receiver(post_delete, sender=ApiToken)
+def revoke_token(sender, instance, **kwargs):
+    tokens.forget(instance.key_hash)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, raw=False, created=False, update_fields=None, **kwargs):
+    """無効にしたユーザーなどのトークンが、キャッシュから認証されないようにする"""
+    if raw or created:
+        return
+    # ログインのたびの last_login の更新では認証の結果は変わらない
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    tokens.bump_epoch()
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, raw=False, **kwargs):
+    """CachedModelBackend のキャッシュを消す"""
+    if not raw:
+        forget_user(instance.pk)
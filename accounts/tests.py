@@ -1,3 +1,160 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient, APITestCase
+
+from accounts import tokens
+from accounts.models import ApiToken
+from memo.models import Memo
+
+
+@override_settings(CACHE_SHARED=True)
+class TestApiToken(APITestCase):
+    def setUp(self):
+        cache.clear()
+        tokens.reset_token_cache_stats()
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.other = User.objects.create_user(username="other", password="password")
+        self.token, self.key = tokens.create_token(self.user, "sync")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.key}")
+
+    def test_issue_list_and_revoke(self):
+        session = APIClient()
+        session.force_login(self.user)
+        res = session.post("/api/tokens/", {"name": "laptop"}, format="json")
+        self.assertEqual(res.status_code, 201)
+        key = res.data["key"]
+        self.assertEqual(res.data["prefix"], key[:tokens.PREFIX_LENGTH])
+        # トークンそのものは保存しない
+        self.assertFalse(ApiToken.objects.filter(key_hash=key).exists())
+        res = session.get("/api/tokens/")
+        self.assertEqual([token["name"] for token in res.data], ["laptop", "sync"])
+        self.assertNotIn("key", res.data[0])
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {key}")
+        self.assertEqual(client.get("/api/memo/").status_code, 200)
+        # ほかのユーザーのトークンは削除できない
+        other = APIClient()
+        other.force_login(self.other)
+        self.assertEqual(other.delete(f"/api/tokens/{res.data[0]['id']}/").status_code, 404)
+        self.assertEqual(session.delete(f"/api/tokens/{res.data[0]['id']}/").status_code, 204)
+        self.assertEqual(client.get("/api/memo/").status_code, 403)
+
+    def test_token_auth_without_csrf(self):
+        res = self.client.post("/api/memo/", {"title": "会議", "content": "内容"}, format="json")
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data["user"], self.user.pk)
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token wrong")
+        self.assertEqual(self.client.get("/api/memo/").status_code, 403)
+        self.client.credentials(HTTP_AUTHORIZATION="Token")
+        self.assertEqual(self.client.get("/api/memo/").status_code, 403)
+
+    def test_hot_token_skips_database(self):
+        self.client.get("/api/memo/")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get("/api/memo/").status_code, 200)
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("accounts_apitoken", sql)
+        self.assertNotIn("accounts_customuser", sql)
+        self.assertNotIn("django_session", sql)
+        self.assertEqual(tokens.token_cache_stats()["db"], 1)
+        # 別のプロセス(プロセス内のキャッシュが空)では共有のキャッシュから読む
+        tokens.reset_token_cache_stats()
+        self.client.get("/api/memo/")
+        self.assertEqual(tokens.token_cache_stats(), {"local": 0, "shared": 1, "db": 0, "invalid": 0})
+
+    def test_revocation_invalidates_cache(self):
+        self.assertEqual(self.client.get("/api/memo/").status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get("/api/memo/").status_code, 403)
+
+    def test_other_workers_see_revocation(self):
+        self.client.get("/api/memo/")
+        # 別のワーカーで削除された(このプロセスのキャッシュは残っていて、世代だけが上がる)
+        ApiToken.objects.filter(pk=self.token.pk)._raw_delete(connection.alias)
+        self.assertEqual(tokens.authenticate_key(self.key)[1], self.token.pk)
+        cache.incr(tokens.EPOCH_KEY)
+        self.assertIsNone(tokens.authenticate_key(self.key))
+
+    def test_deactivated_user(self):
+        self.client.get("/api/memo/")
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/memo/").status_code, 403)
+
+    def test_local_entries_expire(self):
+        tokens.authenticate_key(self.key)
+        tokens.authenticate_key(self.key)
+        self.assertEqual(tokens.token_cache_stats()["local"], 1)
+        with mock.patch("accounts.tokens.time.monotonic", return_value=time.monotonic() + tokens.LOCAL_TIMEOUT + 1):
+            tokens.authenticate_key(self.key)
+        self.assertEqual(tokens.token_cache_stats(), {"local": 1, "shared": 1, "db": 1, "invalid": 0})
+
+    @override_settings(CACHE_SHARED=False)
+    def test_without_shared_cache(self):
+        # ほかのワーカーの削除が見えないので、キャッシュせずに毎回DBで照合する
+        self.assertEqual(tokens.authenticate_key(self.key)[1], self.token.pk)
+        ApiToken.objects.filter(pk=self.token.pk)._raw_delete(connection.alias)
+        self.assertIsNone(tokens.authenticate_key(self.key))
+        self.assertEqual(tokens.token_cache_stats(), {"local": 0, "shared": 0, "db": 1, "invalid": 1})
+
+
+@override_settings(
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+    AUTHENTICATION_BACKENDS=["accounts.backends.CachedModelBackend"],
+    CACHE_SHARED=True,
+)
+class TestAuthCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="user", password="password")
+        Memo.objects.create(title="会議", content="内容", user=self.user)
+        self.client.login(username="user", password="password")
+        self.client.get(reverse("memo:memo"))
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(reverse("memo:memo") + "?category=work")
+        self.assertEqual(res.status_code, 200)
+        return res, [q["sql"] for q in ctx.captured_queries]
+
+    def test_list_page_reads_only_memos(self):
+        _, queries = self.list_queries()
+        self.assertTrue(queries)
+        self.assertEqual([sql for sql in queries if "memo_memo" not in sql], [])
+
+    def test_user_changes_are_seen(self):
+        self.user.nickname = "たろう"
+        self.user.save()
+        res, queries = self.list_queries()
+        self.assertEqual(res.context["user"].nickname, "たろう")
+        self.assertTrue(any("accounts_customuser" in sql for sql in queries))
+        # 読み直したあとはキャッシュから
+        _, queries = self.list_queries()
+        self.assertFalse(any("accounts_customuser" in sql for sql in queries))
+
+    def test_password_change_and_deactivation_log_out(self):
+        self.user.set_password("changed")
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("memo:memo")).status_code, 302)
+        self.client.login(username="user", password="changed")
+        self.assertEqual(self.client.get(reverse("memo:memo")).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("memo:memo")).status_code, 302)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_without_shared_cache(self):
+        # ほかのワーカーでの無効化(シグナルでキャッシュを消せない)もすぐに反映されるように、DBから読む
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse("memo:memo")).status_code, 302)
@@ -0,0 +1,146 @@
+"""APIのトークンの発行と照合
+
+照合した結果(トークンのid とユーザー)はプロセス内のLRUと共有のキャッシュに入れるので、
+よく使われるトークンはDBを読まずに認証できる。
+
+トークンの削除やユーザーの変更のたびに「世代」(キャッシュの EPOCH_KEY)を1つ上げ、照合の結果は
+読んだときの世代と一緒に保存する。世代が違う結果は使わないので、どのワーカーのキャッシュでもすぐに無効になる。
+世代はDBを読む前に取得するので、照合と削除が同時に起きても削除前の結果が新しい世代で保存されることはない。
+プロセス内のLRUの結果は、世代が同じでも LOCAL_TIMEOUT 秒たったら共有のキャッシュから読み直す。
+
+世代はすべてのワーカーから見える必要があるので、共有のキャッシュ(CACHE_SHARED)がなければキャッシュせず、
+毎回DBで照合する。
+"""
+import copy
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ApiToken
+
+
+TOKEN_KEY = "accounts:token:{digest}"
+EPOCH_KEY = "accounts:token:epoch"
+PREFIX_LENGTH = 8
+LOCAL_MAX_SIZE = 1024
+# プロセス内のLRUの結果を使う秒数
+LOCAL_TIMEOUT = 5
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+_stats = {"local": 0, "shared": 0, "db": 0, "invalid": 0}
+
+
+def hash_key(key):
+    # トークンは推測できない長さの乱数なので、パスワードのような遅いハッシュは使わない
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_token(user, name=""):
+    """トークンを発行して (ApiToken, トークン) を返す。トークンはここでしか分からない"""
+    key = secrets.token_urlsafe(32)
+    token = ApiToken.objects.create(user=user, name=name, prefix=key[:PREFIX_LENGTH], key_hash=hash_key(key))
+    return token, key
+
+
+def get_epoch():
+    epoch = cache.get(EPOCH_KEY)
+    if epoch is None:
+        # キャッシュから消えたあとに作り直しても、以前の値と重ならないように時刻から作る
+        cache.add(EPOCH_KEY, time.time_ns(), timeout=None)
+        epoch = cache.get(EPOCH_KEY)
+    return epoch
+
+
+def _incr_epoch():
+    try:
+        cache.incr(EPOCH_KEY)
+    except ValueError:
+        cache.set(EPOCH_KEY, time.time_ns(), timeout=None)
+    with _local_lock:
+        _local.clear()
+
+
+def bump_epoch():
+    """キャッシュしたすべての照合の結果を無効にする
+
+    コミット前に別のリクエストが読んだ古い結果が残らないように、コミットしたあとにもう一度上げる。
+    """
+    _incr_epoch()
+    transaction.on_commit(_incr_epoch)
+
+
+def forget(key_hash):
+    """削除したトークンの共有のキャッシュを消す"""
+    cache.delete(TOKEN_KEY.format(digest=key_hash))
+    bump_epoch()
+
+
+def _count(source):
+    with _local_lock:
+        _stats[source] += 1
+
+
+def _lookup(digest):
+    """DBで照合して ApiToken を返す。使えないトークンはNone"""
+    token = ApiToken.objects.select_related("user").filter(key_hash=digest).first()
+    if token is None or not token.user.is_active:
+        _count("invalid")
+        return None
+    _count("db")
+    return token
+
+
+def authenticate_key(key):
+    """トークンのユーザーと ApiToken のidを (user, token_id) で返す。使えないトークンはNone"""
+    digest = hash_key(key)
+    if not settings.CACHE_SHARED:
+        token = _lookup(digest)
+        return None if token is None else (token.user, token.pk)
+
+    epoch = get_epoch()
+    now = time.monotonic()
+    with _local_lock:
+        entry = _local.get(digest)
+        if entry is not None and entry[0][0] == epoch and entry[1] > now:
+            _local.move_to_end(digest)
+            _stats["local"] += 1
+            return copy.copy(entry[0][1]), entry[0][2]
+
+    shared_key = TOKEN_KEY.format(digest=digest)
+    entry = cache.get(shared_key)
+    if entry is not None and entry[0] == epoch:
+        _count("shared")
+    else:
+        token = _lookup(digest)
+        if token is None:
+            return None
+        entry = (epoch, token.user, token.pk)
+        cache.set(shared_key, entry, timeout=settings.API_TOKEN_CACHE_TIMEOUT)
+
+    with _local_lock:
+        _local[digest] = (entry, now + LOCAL_TIMEOUT)
+        _local.move_to_end(digest)
+        while len(_local) > LOCAL_MAX_SIZE:
+            _local.popitem(last=False)
+    # キャッシュのユーザーをリクエストごとに変更されないように、コピーを返す
+    return copy.copy(entry[1]), entry[2]
+
+
+def token_cache_stats():
+    """このプロセスで照合したトークンの、どこで見つかったかの件数"""
+    with _local_lock:
+        return dict(_stats)
+
+
+def reset_token_cache_stats():
+    with _local_lock:
+        for source in _stats:
+            _stats[source] = 0
+        _local.clear()
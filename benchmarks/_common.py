@@ -0,0 +1,41 @@
+"""ベンチマーク共通の処理
+
+各ベンチマークは `python -m benchmarks.<name>` で実行する。
+テスト用DBを作成して実行し、終了時に破棄するので開発用のDBは汚さない。
+"""
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "my_memo.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database(verbosity=0):
+    """テスト用DBを作成して、終了時に破棄する"""
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def create_user(username="bench", password="password"):
+    from django.contrib.auth import get_user_model
+
+    return get_user_model().objects.create_user(username=username, password=password)
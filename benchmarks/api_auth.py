@@ -0,0 +1,58 @@
+"""APIをセッションで認証した場合とトークンで認証した場合の、リクエスト数/秒とクエリ数を比較する
+
+    python -m benchmarks.api_auth --requests 2000
+
+トークンの照合は共有のキャッシュ(CACHE_URL)を設定したときだけキャッシュする。
+"""
+import argparse
+import time
+
+from ._common import create_user, setup_django, test_database
+
+
+def measure(client, url, requests):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        for _ in range(requests):
+            assert client.get(url).status_code == 200
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, len(ctx.captured_queries) / requests
+
+
+def run(requests):
+    from rest_framework.test import APIClient
+    from accounts.tokens import create_token, reset_token_cache_stats, token_cache_stats
+    from memo.models import Memo
+
+    user = create_user()
+    memo = Memo.objects.create(user=user, title="会議", content="内容")
+    session = APIClient()
+    session.login(username=user.username, password="password")
+    token = APIClient()
+    _, key = create_token(user)
+    token.credentials(HTTP_AUTHORIZATION=f"Token {key}")
+
+    print(f"{'url':<20} {'auth':<8} {'req/s':>8} {'queries/req':>12}")
+    for url in ("/api/memo/", f"/api/memo/{memo.pk}/"):
+        for name, client in (("session", session), ("token", token)):
+            client.get(url)  # キャッシュを温める
+            rps, queries = measure(client, url, requests)
+            print(f"{url:<20} {name:<8} {rps:>8.1f} {queries:>12.2f}")
+    print(token_cache_stats())
+    reset_token_cache_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        run(args.requests)
+
+
+if __name__ == "__main__":
+    main()
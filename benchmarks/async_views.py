@@ -0,0 +1,89 @@
+"""同期のビューと非同期のビュー(/async/, /api/async/memo/)を、ASGIで同時にリクエストしたときの
+リクエスト数/秒とp99のレイテンシで比較する
+
+ASGIアプリケーション(my_memo.asgi と同じASGIHandler)をプロセス内で直接呼び出し、
+uvicornなどのサーバーと同じようにリクエストごとに同期のビューをスレッドで、非同期のビューをイベントループで実行する。
+
+    python -m benchmarks.async_views --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from ._common import create_user, setup_django, test_database
+
+
+PAIRS = [
+    ("list", "/", "/async/"),
+    ("api list", "/api/memo/", "/api/async/memo/"),
+]
+
+
+async def load(clients, url, requests):
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(url)
+
+    async def worker(client):
+        while not queue.empty():
+            target = queue.get_nowait()
+            start = time.perf_counter()
+            res = await client.get(target)
+            latencies.append(time.perf_counter() - start)
+            assert res.status_code == 200, res.status_code
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(client) for client in clients))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return requests / elapsed, statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+async def create_user_async():
+    from asgiref.sync import sync_to_async
+    return await sync_to_async(create_user)()
+
+
+async def run(memos, requests, concurrency):
+    from django.test import AsyncClient
+    from memo.models import Memo
+
+    user = await create_user_async()
+    await Memo.objects.abulk_create([
+        Memo(user=user, title=f"メモ{i}", slug=f"memo{i}", content="内容" * 100, priority=i % 3 + 1)
+        for i in range(memos)
+    ])
+    clients = []
+    for _ in range(concurrency):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        clients.append(client)
+
+    print(f"{'case':<10} {'view':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, sync_url, async_url in PAIRS:
+        for view, url in (("sync", sync_url), ("async", async_url)):
+            # 1回目の読み込みなどを除くために先に数回リクエストしておく
+            await load(clients[:1], url, 5)
+            rps, p50, p99 = await load(clients, url, requests)
+            print(f"{name:<10} {view:<6} {rps:>8.1f} {p50:>8.2f} {p99:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--memos", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    setup_django()
+    from django.test.utils import override_settings
+
+    with test_database():
+        # キャッシュではなくビューとDBの処理を比べる
+        with override_settings(MEMO_LIST_CACHE_TIMEOUT=0):
+            asyncio.run(run(args.memos, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""500件のメモを1件ずつPOSTした場合と /api/memo/bulk/ で一括作成した場合を比較する
+
+    python -m benchmarks.bulk --items 500
+"""
+import argparse
+import time
+
+from ._common import create_user, setup_django, test_database
+
+
+def run(items):
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+    from memo.models import Memo
+
+    user = create_user()
+    client = APIClient()
+    client.force_login(user)
+    data = [{"title": f"会議メモ{i % 20}", "content": f"内容 {i}"} for i in range(items)]
+
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        for item in data:
+            assert client.post("/api/memo/", item, format="json").status_code == 201
+        single = time.perf_counter() - start
+    single_queries = len(ctx.captured_queries)
+    Memo.objects.all().delete()
+    reset_queries()
+
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        res = client.post("/api/memo/bulk/", data, format="json")
+        bulk = time.perf_counter() - start
+    assert all(result["status"] == 201 for result in res.data["results"])
+
+    print(f"{'':<10} {'seconds':>10} {'queries':>10}")
+    print(f"{'single':<10} {single:>10.3f} {single_queries:>10}")
+    print(f"{'bulk':<10} {bulk:>10.3f} {len(ctx.captured_queries):>10}")
+    print(f"speedup: {single / bulk:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=500)
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        run(args.items)
+
+
+if __name__ == "__main__":
+    main()
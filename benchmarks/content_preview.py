@@ -0,0 +1,73 @@
+"""内容が長い(約100KB)メモの一覧を、内容すべてを読む場合と先頭だけを読む場合で比較する
+
+    python -m benchmarks.content_preview --memos 200 --size 100000
+"""
+import argparse
+import statistics
+import time
+
+from ._common import create_user, setup_django, test_database
+
+
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, size
+
+
+def run(memos, size, repeat):
+    from django.test import Client
+    from django.test.utils import override_settings
+    from memo.models import Memo
+
+    user = create_user()
+    body = ("長い文書を貼り付けたメモ。" * (size // 13 + 1))[:size]
+    Memo.objects.bulk_create([
+        Memo(user=user, title=f"メモ{i}", slug=f"memo{i}", content=body) for i in range(memos)
+    ])
+    client = Client()
+    client.force_login(user)
+
+    def orm(qs, field):
+        return lambda: sum(len(getattr(memo, field)) for memo in qs.ordered()[:50])
+
+    def http(url):
+        def get():
+            res = client.get(url)
+            assert res.status_code == 200
+            return len(res.content)
+        return get
+
+    qs = Memo.objects.for_user(user)
+    cases = [
+        ("ORM 50 rows", "content", orm(qs, "content")),
+        ("ORM 50 rows", "preview", orm(qs.with_content_preview(), "content_preview")),
+        ("GET /", "preview", http("/")),
+        ("GET /api/memo/", "content", http("/api/memo/")),
+        ("GET /api/memo/", "compact", http("/api/memo/?compact=1")),
+    ]
+    # size: ORMは読んだ文字数、HTTPはレスポンスのバイト数
+    print(f"{'case':<18} {'mode':<8} {'median ms':>10} {'size':>10}")
+    # キャッシュなしでDBから読む時間を測る
+    with override_settings(MEMO_LIST_CACHE_TIMEOUT=0):
+        for name, mode, func in cases:
+            median, length = measure(func, repeat)
+            print(f"{name:<18} {mode:<8} {median:>10.2f} {length:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--memos", type=int, default=200)
+    parser.add_argument("--size", type=int, default=100_000, help="1件の内容の文字数")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        run(args.memos, args.size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""PostgreSQLで、リクエストごとの接続・接続の使い回し(CONN_MAX_AGE)・コネクションプール(DB_POOL)を比較する
+
+    python -m benchmarks.db_pool --requests 500 --threads 8
+
+.env の DB に PostgreSQL を設定して実行する。それぞれの設定で別のプロセスを起動し、
+メモの詳細をWSGIのハンドラーに直接送る(リクエストの終わりに接続を閉じる・返す処理も含めて計測する)。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from ._common import BASE_DIR, create_user, setup_django, test_database
+
+
+MODES = {
+    "connect": {"DB_POOL": "False", "DB_CONN_MAX_AGE": "0"},
+    "persistent": {"DB_POOL": "False", "DB_CONN_MAX_AGE": "600"},
+    "pool": {"DB_POOL": "True"},
+}
+
+
+def run(requests, threads):
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db.backends.base.base import BaseDatabaseWrapper
+    from django.test import Client, RequestFactory
+    from django.urls import reverse
+    from memo.models import Memo
+    from memo.pool import pool_stats
+
+    user = create_user()
+    memo = Memo.objects.create(user=user, title="会議", content="内容")
+    client = Client()
+    client.force_login(user)
+    cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    # 接続(プールでは取り出し)にかかった時間
+    connect_times = []
+    original_connect = BaseDatabaseWrapper.connect
+
+    def connect(self):
+        start = time.perf_counter()
+        original_connect(self)
+        connect_times.append(time.perf_counter() - start)
+    BaseDatabaseWrapper.connect = connect
+
+    handler = WSGIHandler()
+    path = reverse("memo:detail", kwargs={"slug": memo.slug})
+    times = []
+    lock = threading.Lock()
+
+    def worker(count):
+        for _ in range(count):
+            environ = RequestFactory().get(path, HTTP_COOKIE=cookie).environ
+            start = time.perf_counter()
+            response = handler(environ, lambda status, headers: None)
+            b"".join(response)
+            response.close()  # request_finished で接続を閉じる・プールに返す
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.status_code
+            with lock:
+                times.append(elapsed)
+
+    per_thread = [requests // threads + (i < requests % threads) for i in range(threads)]
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(count,)) for count in per_thread]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    total = time.perf_counter() - started
+
+    times.sort()
+    return {
+        "rps": len(times) / total,
+        "p50_ms": statistics.median(times) * 1000,
+        "p95_ms": times[int(len(times) * 0.95)] * 1000,
+        "connects": len(connect_times),
+        "connect_ms_per_request": sum(connect_times) / len(times) * 1000,
+        "pool": pool_stats().get("default"),
+    }
+
+
+def require_postgresql():
+    setup_django()
+    from django.db import connection
+
+    if connection.vendor != "postgresql":
+        sys.exit("DB_ENGINE に PostgreSQL を設定してください")
+
+
+def child(requests, threads):
+    require_postgresql()
+    with test_database():
+        result = run(requests, threads)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        child(args.requests, args.threads)
+        return
+    require_postgresql()
+
+    print(f"{'mode':<12} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'connects':>9} {'connect ms/req':>15}")
+    for mode, env in MODES.items():
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.db_pool", "--mode", mode,
+             "--requests", str(args.requests), "--threads", str(args.threads)],
+            cwd=BASE_DIR, env={**os.environ, **env}, capture_output=True, text=True,
+        )
+        if proc.returncode:
+            sys.exit(proc.stderr.strip())
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(
+            f"{mode:<12} {result['rps']:>8.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+            f"{result['connects']:>9} {result['connect_ms_per_request']:>15.3f}"
+        )
+        if result["pool"]:
+            print(f"{'':<12} {result['pool']}")
+
+
+if __name__ == "__main__":
+    main()
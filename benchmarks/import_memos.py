@@ -0,0 +1,44 @@
+"""NDJSONのインポートの速さ(行/秒)をバッチサイズごとに計測する
+
+    python -m benchmarks.import_memos --rows 20000 --batch-size 100 1000
+"""
+import argparse
+import json
+import time
+
+from ._common import create_user, setup_django, test_database
+
+
+def run(rows, batch_sizes):
+    from memo.importer import MemoImporter, read_rows
+    from memo.models import Memo
+
+    user = create_user()
+    # タイトルの重複が多いほどslugの番号の解決が効く
+    lines = [
+        json.dumps({"title": f"会議メモ{i % 50}", "content": f"内容 {i}", "priority": i % 3 + 1}, ensure_ascii=False)
+        for i in range(rows)
+    ]
+
+    print(f"{'batch':>8} {'seconds':>10} {'rows/s':>10}")
+    for batch_size in batch_sizes:
+        Memo.objects.all().delete()
+        start = time.perf_counter()
+        result = MemoImporter(user, batch_size=batch_size).run(read_rows(lines, "ndjson"))
+        elapsed = time.perf_counter() - start
+        assert result.imported == rows, result.errors[:3]
+        print(f"{batch_size:>8} {elapsed:>10.3f} {rows / elapsed:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[100, 1000])
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        run(args.rows, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
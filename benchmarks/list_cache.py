@@ -0,0 +1,60 @@
+"""メモ一覧とAPIの一覧をキャッシュなし、キャッシュありで表示したときの時間を比較する
+
+    python -m benchmarks.list_cache --memos 10000 --requests 200
+"""
+import argparse
+import statistics
+import time
+
+from ._common import create_user, setup_django, test_database
+
+
+def measure(client, url, requests):
+    times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        assert client.get(url).status_code == 200
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, sorted(times)[int(len(times) * 0.95)] * 1000
+
+
+def run(memos, requests):
+    from django.core.cache import cache
+    from django.test import Client
+    from django.test.utils import override_settings
+    from memo.cache import cache_stats, reset_cache_stats
+    from memo.models import Memo
+
+    user = create_user()
+    Memo.objects.bulk_create([
+        Memo(user=user, title=f"メモ{i}", slug=f"memo{i}", content="内容 " * 50, priority=i % 3 + 1)
+        for i in range(memos)
+    ])
+    client = Client()
+    client.force_login(user)
+
+    print(f"{'url':<20} {'cache':<6} {'median ms':>10} {'p95 ms':>10}")
+    for url in ("/?page=3", "/api/memo/?page=3"):
+        with override_settings(MEMO_LIST_CACHE_TIMEOUT=0):
+            median, p95 = measure(client, url, requests)
+        print(f"{url:<20} {'off':<6} {median:>10.2f} {p95:>10.2f}")
+        cache.clear()
+        reset_cache_stats()
+        with override_settings(MEMO_LIST_CACHE_TIMEOUT=300):
+            median, p95 = measure(client, url, requests)
+        print(f"{url:<20} {'on':<6} {median:>10.2f} {p95:>10.2f}")
+        print(f"{'':<20} {cache_stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--memos", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        run(args.memos, args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""ローカルで起動したサーバーに、ログインしたユーザーとして一覧・詳細・作成・編集・APIのリクエストを同時に送り、
+エンドポイントごとのスループット、p50/p95/p99のレイテンシ、エラー率を表示する
+
+セッション認証、CSRF、ミドルウェア、テンプレート、DRFを含めたアプリ全体を計測する。
+標準ライブラリだけで動き、外部への通信はしない。
+
+    # 一時的なSQLiteのDBを作り、seed_memosでユーザーとメモを作成して runserver で起動する
+    python -m benchmarks.loadtest --users 20 --memos-per-user 200 --concurrency 16 --duration 30
+
+    # .env の設定のDB(ローカルのPostgreSQLなど)を使う。作成済みのユーザーを使うときは --skip-seed
+    python -m benchmarks.loadtest --db env --skip-seed
+
+    # gunicornなど別のサーバーで起動する({host}と{port}は置き換える)
+    python -m benchmarks.loadtest --server-cmd "gunicorn my_memo.wsgi -w 4 -b {host}:{port}"
+
+リクエストの割合は --mix list=50,detail=20,create=5,edit=5,api_list=15,api_detail=5 のように指定する。
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from ._common import BASE_DIR
+
+
+DEFAULT_MIX = "list=50,detail=20,create=5,edit=5,api_list=15,api_detail=5"
+CSRF_INPUT_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """リダイレクトは1回のリクエストとして計測するので、たどらない"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Session:
+    """1人のユーザーのクッキー(セッション、CSRF)を持つHTTPクライアント"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect)
+        self.slugs = []
+        self.ids = []
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        return ""
+
+    def request(self, method, path, data=None, json_body=None):
+        """(ステータス, 本文) を返す。3xx, 4xx, 5xxも例外にしない"""
+        headers = {"X-CSRFToken": self.csrf_token(), "Referer": self.base_url + path}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as res:
+                return res.status, res.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read()
+
+    def login(self, username, password):
+        """ログインページのフォームからCSRFトークンを取り出してログインする"""
+        status, body = self.request("GET", "/accounts/login/")
+        match = CSRF_INPUT_RE.search(body.decode())
+        if status != 200 or not match:
+            raise RuntimeError(f"ログインページを取得できません: {status}")
+        status, _ = self.request("POST", "/accounts/login/", data={
+            "csrfmiddlewaretoken": match.group(1), "username": username, "password": password,
+        })
+        if status != 302:
+            raise RuntimeError(f"{username} でログインできません: {status}")
+        # 詳細・編集で使うメモ
+        status, body = self.request("GET", "/api/memo/?page=1")
+        results = json.loads(body)["results"]
+        self.slugs = [memo["slug"] for memo in results]
+        self.ids = [memo["id"] for memo in results]
+
+
+def _memo_form(rng):
+    return {
+        "title": rng.choice(["会議", "買い物", "日報", "TODO", "読書"]) + str(rng.randrange(100)),
+        "content": "負荷試験で作成したメモ。" * rng.randrange(1, 10),
+        "category": rng.choice(["work", "personal", "study", "hobby", "other"]),
+        "priority": rng.choice([1, 2, 3]),
+    }
+
+
+# エンドポイントごとに (リクエストを送る関数, 成功とみなすステータス)
+def _list(session, rng):
+    return session.request("GET", f"/?page={rng.randrange(1, 4)}")[0], (200,)
+
+
+def _detail(session, rng):
+    return session.request("GET", f"/detail/{rng.choice(session.slugs)}/")[0], (200,)
+
+
+def _create(session, rng):
+    return session.request("POST", "/create/", data=_memo_form(rng))[0], (302,)
+
+
+def _edit(session, rng):
+    data = _memo_form(rng)
+    return session.request("POST", f"/edit/{rng.choice(session.slugs)}/", data=data)[0], (302,)
+
+
+def _api_list(session, rng):
+    return session.request("GET", f"/api/memo/?page={rng.randrange(1, 4)}")[0], (200,)
+
+
+def _api_detail(session, rng):
+    return session.request("GET", f"/api/memo/{rng.choice(session.ids)}/")[0], (200,)
+
+
+def _api_create(session, rng):
+    return session.request("POST", "/api/memo/", json_body=_memo_form(rng))[0], (201,)
+
+
+ENDPOINTS = {
+    "list": _list,
+    "detail": _detail,
+    "create": _create,
+    "edit": _edit,
+    "api_list": _api_list,
+    "api_detail": _api_detail,
+    "api_create": _api_create,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"不明なエンドポイントです: {name} ({', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, name, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def worker(session, mix, deadline, remaining, recorder, seed):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        if remaining is not None:
+            with remaining["lock"]:
+                if remaining["count"] <= 0:
+                    return
+                remaining["count"] -= 1
+        name = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            status, expected = ENDPOINTS[name](session, rng)
+            ok = status in expected
+        except (OSError, urllib.error.URLError):
+            ok = False
+        recorder.add(name, time.perf_counter() - start, ok)
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def report(recorder, elapsed):
+    rows = {}
+    print(f"{'endpoint':<12} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    everything = []
+    for name in sorted(recorder.latencies):
+        latencies = sorted(recorder.latencies[name])
+        everything.extend(latencies)
+        rows[name] = _row(latencies, recorder.errors.get(name, 0), elapsed)
+    everything.sort()
+    total = _row(everything, sum(recorder.errors.values()), elapsed) if everything else None
+    for name, row in list(rows.items()) + ([("total", total)] if total else []):
+        print(
+            f"{name:<12} {row['requests']:>9} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} "
+            f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['error_rate']:>6.1%}"
+        )
+    return {"elapsed": elapsed, "endpoints": rows, "total": total}
+
+
+def _row(latencies, errors, elapsed):
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+        "error_rate": errors / len(latencies),
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _manage(env, *args):
+    subprocess.run([sys.executable, "manage.py", *args], cwd=BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def _wait_until_ready(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("サーバーが終了しました。ログを確認してください")
+        try:
+            with urllib.request.urlopen(base_url + "/accounts/login/", timeout=2):
+                return
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.2)
+    raise RuntimeError("サーバーが起動しません")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="ログインするユーザーの数")
+    parser.add_argument("--memos-per-user", type=int, default=200)
+    parser.add_argument("--prefix", default="load", help="seed_memosのユーザー名の先頭")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時にリクエストするスレッドの数")
+    parser.add_argument("--duration", type=float, default=30, help="計測する秒数")
+    parser.add_argument("--requests", type=int, help="送るリクエストの総数(指定すると--durationより先に終わることがある)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--db", choices=["sqlite", "env"], default="sqlite",
+                        help="sqlite: 一時的なSQLiteのDBを作る、env: .envや環境変数のDBの設定を使う")
+    parser.add_argument("--skip-seed", action="store_true", help="migrateとseed_memosを実行しない")
+    parser.add_argument("--server-cmd", help="サーバーを起動するコマンド({host}, {port}を置き換える)。省略時はrunserver")
+    parser.add_argument("--url", help="起動済みのサーバーのURL(指定するとサーバーを起動しない)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="my_memo.settings")
+    env.setdefault("SECRET_KEY", "loadtest")
+    if args.db == "sqlite":
+        env.update(DB_ENGINE="django.db.backends.sqlite3", DB_NAME=os.path.join(tmpdir.name, "loadtest.sqlite3"))
+    process = None
+    try:
+        if not args.skip_seed and not args.url:
+            print("DBを準備しています...")
+            _manage(env, "migrate", "--noinput")
+            _manage(env, "seed_memos", "--users", str(args.users), "--memos-per-user", str(args.memos_per_user),
+                    "--prefix", args.prefix, "--password", args.password, "--seed", str(args.seed))
+        base_url = args.url
+        if base_url is None:
+            host, port = "127.0.0.1", _free_port()
+            command = (
+                shlex.split(args.server_cmd.format(host=host, port=port)) if args.server_cmd
+                else [sys.executable, "manage.py", "runserver", f"{host}:{port}", "--noreload"]
+            )
+            log = open(os.path.join(tmpdir.name, "server.log"), "w")
+            process = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+            base_url = f"http://{host}:{port}"
+            _wait_until_ready(base_url, process)
+        base_url = base_url.rstrip("/")
+
+        sessions = []
+        for i in range(args.concurrency):
+            session = Session(base_url)
+            session.login(f"{args.prefix}{i % args.users:04d}", args.password)
+            sessions.append(session)
+
+        print(f"{args.concurrency}スレッドで計測しています...")
+        recorder = Recorder()
+        remaining = {"count": args.requests, "lock": threading.Lock()} if args.requests else None
+        start = time.monotonic()
+        threads = [
+            threading.Thread(
+                target=worker,
+                args=(session, args.mix, start + args.duration, remaining, recorder, args.seed + i),
+            )
+            for i, session in enumerate(sessions)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result = report(recorder, time.monotonic() - start)
+        if args.output:
+            result["config"] = {
+                "users": args.users, "concurrency": args.concurrency, "mix": args.mix,
+                "db": args.db, "server": args.server_cmd or ("external" if args.url else "runserver"),
+            }
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""タイトルからslugを作る速さを、キャッシュなし(cold)、キャッシュあり(warm)、まとめて変換(batch)で比較する
+
+    python -m benchmarks.romaji --titles 20000 --distinct 200
+"""
+import argparse
+import random
+import time
+
+from ._common import setup_django
+
+
+WORDS = ["議事録", "買い物", "会議", "TODO", "日報", "週報", "読書", "勉強", "旅行", "献立", "メモ", "予定"]
+
+
+def run(titles, distinct):
+    from memo.models import generate_slug, generate_slugs, romaji_cache_stats, to_romaji
+
+    rng = random.Random(0)
+    pool = [f"{rng.choice(WORDS)}{rng.choice(WORDS)}{i}" for i in range(distinct)]
+    # よく使われるタイトルほど多く出るようにする
+    data = rng.choices(pool, weights=[1 / (i + 1) for i in range(distinct)], k=titles)
+
+    def cold():
+        for title in data:
+            to_romaji.cache_clear()
+            generate_slug(title, 1)
+
+    def warm():
+        for title in data:
+            generate_slug(title, 1)
+
+    def batch():
+        generate_slugs(data, 1)
+
+    print(f"{'mode':<6} {'seconds':>10} {'titles/s':>12} hit_rate")
+    to_romaji.cache_clear()
+    # 1回目の変換でpykakasiの辞書を読み込む
+    generate_slug(pool[0], 1)
+    for name, func in (("cold", cold), ("warm", warm), ("batch", batch)):
+        to_romaji.cache_clear()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<6} {elapsed:>10.3f} {titles / elapsed:>12.0f} {romaji_cache_stats()['hit_rate']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--titles", type=int, default=20000)
+    parser.add_argument("--distinct", type=int, default=200, help="タイトルの種類")
+    args = parser.parse_args()
+    setup_django()
+    run(args.titles, args.distinct)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""全文検索とicontainsによる部分一致の検索時間を比較する
+
+    python -m benchmarks.search --memos 1000000
+
+コーパスの作成(一括insertと索引)に時間がかかるので、まずは --memos 50000 などで試すとよい。
+"""
+import argparse
+import random
+import statistics
+import time
+
+from ._common import create_user, setup_django, test_database
+
+
+KANJI = "日本人年大十二本中長出三時行見月分後前生五間上東四今金九入学高円子外八六下来気小七山話女北午百書先名川千水半男西電校語土木聞食車何南万毎白天母火右読友左休父雨"
+WORDS = [
+    "会議", "議事録", "買い物", "牛乳", "予定", "旅行", "勉強", "英語", "プログラミング", "映画",
+    "読書", "ランニング", "レシピ", "カレー", "予算", "請求書", "引っ越し", "病院", "誕生日", "プレゼント",
+    "Django", "Python", "TODO", "review", "deploy", "memo", "idea", "bug", "release", "meeting",
+]
+QUERIES = ["会議", "かいぎ", "kaigi", "議事録 予定", "プレゼント", "python", "引っ越し", "存在しない語"]
+
+
+def make_text(rng, words):
+    """よく使う語を1割、残りはランダムな漢字の熟語にした文"""
+    parts = []
+    for _ in range(words):
+        if rng.random() < 0.1:
+            parts.append(rng.choice(WORDS))
+        else:
+            parts.append("".join(rng.choice(KANJI) for _ in range(rng.randint(2, 3))))
+    return "、".join(parts)
+
+
+def build_corpus(user, count, batch_size, seed):
+    from django.db import connection
+    from memo.models import Memo
+    from memo.search import build_document, get_backend
+
+    rng = random.Random(seed)
+    backend = get_backend(connection)
+    # 同じ文面の読みを何度も変換しないように、文面の種類を絞って使い回す
+    samples = [(make_text(rng, 2)[:20], make_text(rng, 30)) for _ in range(5000)]
+    documents = {}
+    start = time.perf_counter()
+    for offset in range(0, count, batch_size):
+        memos = []
+        for i in range(offset, min(offset + batch_size, count)):
+            title, content = rng.choice(samples)
+            memos.append(Memo(user=user, title=title, content=content, slug=f"memo-{i}"))
+        Memo.objects.bulk_create(memos)
+        if backend is not None:
+            rows = []
+            for memo in memos:
+                key = (memo.title, memo.content)
+                if key not in documents:
+                    documents[key] = build_document(memo.title, memo.content)
+                rows.append((memo.pk, memo.user_id, documents[key]))
+            with connection.cursor() as cursor:
+                backend.index(cursor, rows)
+        print(f"\r{offset + len(memos)}/{count} 件作成", end="", flush=True)
+    print(f"\nコーパス作成: {time.perf_counter() - start:.1f}s")
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def run(count, batch_size, repeat, seed):
+    from django.db.models import Q
+    from memo.models import Memo
+    from memo.search import search_memos
+
+    user = create_user()
+    build_corpus(user, count, batch_size, seed)
+    qs = Memo.objects.for_user(user)
+
+    def naive(query):
+        result = qs
+        for word in query.split():
+            result = result.filter(Q(title__icontains=word) | Q(content__icontains=word))
+        return list(result.ordered()[:20])
+
+    print(f"{'query':<16} {'fts ms':>10} {'hits':>6} {'icontains ms':>14} {'hits':>6}")
+    for query in QUERIES:
+        fts_ms, fts_result = timed(lambda: search_memos(qs, user, query)[:20], repeat)
+        naive_ms, naive_result = timed(lambda: naive(query), repeat)
+        print(f"{query:<16} {fts_ms:>10.2f} {len(fts_result):>6} {naive_ms:>14.2f} {len(naive_result):>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--memos", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        run(args.memos, args.batch_size, args.repeat, args.seed)
+
+
+if __name__ == "__main__":
+    main()
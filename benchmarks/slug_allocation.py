@@ -0,0 +1,38 @@
+"""同じタイトルのメモを連続で作成し、1件あたりのクエリ数と時間を計測する
+
+    python -m benchmarks.slug_allocation --count 1000
+"""
+import argparse
+import time
+
+from ._common import create_user, setup_django, test_database
+
+
+def run(count, report_every):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from memo.models import Memo
+
+    user = create_user()
+    print(f"{'n':>6} {'queries':>8} {'ms':>8} slug")
+    for n in range(1, count + 1):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            memo = Memo.objects.create(title="会議メモ", content="content", user=user)
+            elapsed = (time.perf_counter() - start) * 1000
+        if n == 1 or n % report_every == 0:
+            print(f"{n:>6} {len(ctx.captured_queries):>8} {elapsed:>8.2f} {memo.slug}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--report-every", type=int, default=100)
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        run(args.count, args.report_every)
+
+
+if __name__ == "__main__":
+    main()
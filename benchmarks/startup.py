@@ -0,0 +1,56 @@
+"""django.setup() にかかる時間と、その後のメモリ使用量(RSS)を、pykakasiの辞書の読み込みあり・なしで比較する
+
+ワーカーの起動と同じ条件にするため、毎回新しいプロセスで計測する。
+
+    python -m benchmarks.startup --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from ._common import BASE_DIR
+
+
+SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "pykakasi": "pykakasi" in sys.modules,
+}))
+"""
+
+
+def measure(warmup, repeat):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="my_memo.settings", MEMO_KAKASI_WARMUP=str(warmup))
+    env.setdefault("SECRET_KEY", "benchmark")
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", SCRIPT], cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        results.append(json.loads(out.stdout))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(f"{'warmup':<8} {'setup s':>10} {'max RSS MB':>12} pykakasi")
+    for warmup in (False, True):
+        results = measure(warmup, args.repeat)
+        seconds = statistics.median(r["seconds"] for r in results)
+        rss = statistics.median(r["max_rss_mb"] for r in results)
+        print(f"{str(warmup):<8} {seconds:>10.3f} {rss:>12.1f} {results[0]['pykakasi']}")
+
+
+if __name__ == "__main__":
+    main()
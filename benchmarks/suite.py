@@ -0,0 +1,227 @@
+"""画面、API、slugの割り当て、シリアライザの時間・クエリ数・メモリの確保量をまとめて計測する
+
+seed_memosと同じデータ(同じ--seedなら同じ内容)で計測し、結果をJSONに書き出すので、変更の前後で比べられる。
+
+    python -m benchmarks.suite --memos 2000 --iterations 50 -o before.json
+    python -m benchmarks.suite --memos 2000 --iterations 50 -o after.json
+    python -m benchmarks.suite --compare before.json after.json
+
+一覧のキャッシュ(MEMO_LIST_CACHE_TIMEOUT)はDBの処理を計測するために無効にする。--with-cache で有効にできる。
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from ._common import BASE_DIR, setup_django, test_database
+
+
+# メモリの確保量はtracemallocで計測する。遅くなるので時間とは別に数回だけ実行する
+ALLOC_ITERATIONS = 5
+
+
+class Case:
+    """func(*setup()) の1回を計測する。setupの時間は含めない"""
+
+    def __init__(self, name, func, setup=None):
+        self.name = name
+        self.func = func
+        self.setup = setup or (lambda: ())
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def measure(case, iterations, warmup):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for _ in range(warmup):
+        case.func(*case.setup())
+    times = []
+    queries = []
+    for _ in range(iterations):
+        args = case.setup()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            case.func(*args)
+            times.append((time.perf_counter() - start) * 1000)
+        queries.append(len(ctx.captured_queries))
+
+    peaks = []
+    blocks = []
+    tracemalloc.start()
+    try:
+        for _ in range(ALLOC_ITERATIONS):
+            args = case.setup()
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            allocated = sys.getallocatedblocks()
+            case.func(*args)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+            blocks.append(sys.getallocatedblocks() - allocated)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "wall_ms": {
+            "mean": statistics.mean(times),
+            "p50": _percentile(times, 0.50),
+            "p95": _percentile(times, 0.95),
+            "p99": _percentile(times, 0.99),
+            "min": min(times),
+            "max": max(times),
+        },
+        "queries": statistics.mean(queries),
+        # 1回の実行で一時的に確保したメモリの最大量と、実行後に残ったメモリブロックの数
+        "alloc_peak_kb": statistics.median(peaks) / 1024,
+        "alloc_blocks": statistics.median(blocks),
+    }
+
+
+def build_cases(user):
+    from django.test import Client
+    from rest_framework.test import APIClient
+    from memo.models import Memo
+    from memo.serializers import MemoSerializer
+
+    client = Client()
+    client.force_login(user)
+    api = APIClient()
+    api.force_login(user)
+    memo = Memo.objects.for_user(user).ordered().first()
+    page = list(Memo.objects.for_user(user).ordered()[:5])
+    counter = iter(range(10 ** 9))
+
+    def ok(res, status=200):
+        assert res.status_code == status, (res.status_code, getattr(res, "data", None))
+        # ストリーミングのレスポンスは最後まで読む
+        if getattr(res, "streaming", False):
+            for _ in res.streaming_content:
+                pass
+
+    def new_memo():
+        return (Memo.objects.create(user=user, title="削除用", content="content"),)
+
+    def body():
+        return {"title": f"会議{next(counter)}", "content": "内容", "category": "work", "priority": 2}
+
+    def ndjson():
+        return ("\n".join(json.dumps(body(), ensure_ascii=False) for _ in range(100)).encode(),)
+
+    return [
+        Case("view:list", lambda: ok(client.get("/"))),
+        Case("view:list_category_page2", lambda: ok(client.get("/?category=work&page=2"))),
+        Case("view:detail", lambda: ok(client.get(f"/detail/{memo.slug}/"))),
+        Case("view:create", lambda: ok(client.post("/create/", body()), 302)),
+        Case("model:save_slug", lambda: Memo.objects.create(user=user, title="会議", content="content")),
+        Case("serializer:list", lambda: MemoSerializer(page, many=True).data),
+        Case("serializer:validate", lambda: MemoSerializer(data=body()).is_valid(raise_exception=True)),
+        Case("api:list", lambda: ok(api.get("/api/memo/"))),
+        Case("api:retrieve", lambda: ok(api.get(f"/api/memo/{memo.pk}/"))),
+        Case("api:create", lambda: ok(api.post("/api/memo/", body(), format="json"), 201)),
+        Case("api:update", lambda: ok(api.put(f"/api/memo/{memo.pk}/", body(), format="json"))),
+        Case("api:partial_update", lambda: ok(api.patch(f"/api/memo/{memo.pk}/", {"priority": 3}, format="json"))),
+        Case("api:destroy", lambda m: ok(api.delete(f"/api/memo/{m.pk}/"), 204), setup=new_memo),
+        Case("api:search", lambda: ok(api.get("/api/memo/search/", {"q": "会議"}))),
+        Case("api:bulk_create_100", lambda: ok(api.post("/api/memo/bulk/", [body() for _ in range(100)], format="json"))),
+        Case("api:export", lambda: ok(api.get("/api/memo/export/"))),
+        Case(
+            "api:import_100",
+            lambda data: ok(api.generic("POST", "/api/memo/import/", data, "application/x-ndjson")),
+            setup=ndjson,
+        ),
+    ]
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    import django
+    from django.db import connection
+    from django.test.utils import override_settings
+    from memo.seeding import seed
+
+    user = seed(1, args.memos, seed=args.seed, prefix="bench")[0]
+    cases = [case for case in build_cases(user) if not args.filter or args.filter in case.name]
+    results = {}
+    print(f"{'case':<28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak KB':>9} {'blocks':>7}")
+    with override_settings(MEMO_LIST_CACHE_TIMEOUT=300 if args.with_cache else 0):
+        for case in cases:
+            result = measure(case, args.iterations, args.warmup)
+            results[case.name] = result
+            wall = result["wall_ms"]
+            print(
+                f"{case.name:<28} {wall['p50']:>8.2f} {wall['p95']:>8.2f} {wall['p99']:>8.2f} "
+                f"{result['queries']:>8.1f} {result['alloc_peak_kb']:>9.1f} {result['alloc_blocks']:>7.0f}"
+            )
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "memos": args.memos,
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "with_cache": args.with_cache,
+        },
+        "results": results,
+    }
+
+
+def compare(before_path, after_path):
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)["results"]
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)["results"]
+    print(f"{'case':<28} {'p50 before':>11} {'p50 after':>10} {'change':>8} {'queries':>14}")
+    for name in before:
+        if name not in after:
+            continue
+        b, a = before[name], after[name]
+        change = (a["wall_ms"]["p50"] - b["wall_ms"]["p50"]) / b["wall_ms"]["p50"] * 100
+        queries = f"{b['queries']:.1f} -> {a['queries']:.1f}"
+        print(f"{name:<28} {b['wall_ms']['p50']:>11.2f} {a['wall_ms']['p50']:>10.2f} {change:>+7.1f}% {queries:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--memos", type=int, default=2000, help="計測するユーザーのメモの件数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--filter", help="名前にこの文字列を含むものだけ計測する(例: api:)")
+    parser.add_argument("--with-cache", action="store_true", help="一覧のキャッシュを有効にする")
+    parser.add_argument("-o", "--output", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="2つの結果のJSONを比べる")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    setup_django()
+    with test_database():
+        results = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"結果を {args.output} に書き出しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,37 @@
 from django.contrib import admin
+from django.core.exceptions import ValidationError
 from .models import Memo
+from .sharding import is_sharded, shards
 
-admin.site.register(Memo)
 
+class ShardFilter(admin.SimpleListFilter):
+    """シャーディングしているときに一覧を表示するシャードを選ぶ(選ばなければ default)"""
+    title = "シャード"
+    parameter_name = "shard"
 
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shards()] if is_sharded() else []
+
+    def queryset(self, request, queryset):
+        if self.value() in shards():
+            return queryset.using(self.value())
+        return queryset
+
+
+@admin.register(Memo)
+class MemoAdmin(admin.ModelAdmin):
+    list_filter = [ShardFilter]
+
+    def get_object(self, request, object_id, from_field=None):
+        # メモのidはシャードをまたいで重ならないので、シャードを順に探す
+        queryset = self.get_queryset(request)
+        field = Memo._meta.pk if from_field is None else Memo._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+        except (ValidationError, ValueError):
+            return None
+        for alias in shards():
+            obj = queryset.using(alias).filter(**{field.name: object_id}).first()
+            if obj is not None:
+                return obj
+        return None
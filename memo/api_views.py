@@ -1,18 +1,242 @@
-from rest_framework import viewsets, filters
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import viewsets, filters, serializers, status
+from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from .serializers import MemoSerializer 
+from .serializers import MemoSerializer, MemoListSerializer
 from .models import Memo
+from .pagination import MemoCursorPagination
+from .search import search_memos
+from .bulk import BULK_MAX_ITEMS, bulk_create_memos, bulk_update_memos, bulk_delete_memos
+from .export import EXPORT_FORMATS, export_filename, export_memos
+from .importer import IMPORT_FORMATS, MemoImporter, decode_lines, read_rows
+from .cache import get_or_compute
+from .stats import user_stats
+from .changes import CHANGES_MAX_PAGE_SIZE, CHANGES_PAGE_SIZE, DELETE, InvalidCursor, changes, decode_cursor
+from .conditional import conditional_response, list_etag, memo_etag, set_validators
+from . import routers
 
 class MemoViewSet(viewsets.ModelViewSet):
     serializer_class = MemoSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ["priority", "updated_at", "created_at"]
-    ordering = ["-priority", "-updated_at", "-created_at"]
+    ordering = list(Memo.LIST_ORDERING)
+    # GET(一覧、詳細、検索、エクスポートなど)はレプリカから読む(ReplicaMiddleware)
+    read_from_replica = True
+
+    @property
+    def pagination_class(self):
+        # MEMO_CURSOR_PAGINATION=True のときはカーソルで取得する(?orderingは使えない)
+        if settings.MEMO_CURSOR_PAGINATION:
+            return MemoCursorPagination
+        return api_settings.DEFAULT_PAGINATION_CLASS
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # トークンで認証したユーザーはReplicaMiddlewareでは分からないので、書き込んだあとかをここで確かめる
+        # トークンのクライアントはクッキーを送らないので、共有のキャッシュがなければ書き込んだあとか分からない
+        state = routers.current_state()
+        if state is not None and state.replica and request.auth is not None and (
+            not settings.CACHE_SHARED or routers.is_pinned(request.user.pk)
+        ):
+            state.replica = False
 
     def get_queryset(self):
-        return Memo.objects.filter(user=self.request.user)
+        qs = Memo.objects.for_user(self.request.user)
+        if self.action in ("list", "search"):
+            qs = qs.in_category(self.request.query_params.get("category"))
+            if self.is_compact():
+                qs = qs.with_content_preview()
+        elif self.action in ("update", "partial_update") and self.is_conditional():
+            # If-Matchなどと比べてから保存するまで、ほかのリクエストが更新できないように行をロックする
+            qs = qs.select_for_update()
+        return qs
+
+    def get_serializer_class(self):
+        if self.action in ("list", "search") and self.is_compact():
+            return MemoListSerializer
+        return super().get_serializer_class()
+
+    def is_conditional(self):
+        return "HTTP_IF_MATCH" in self.request.META or "HTTP_IF_UNMODIFIED_SINCE" in self.request.META
+
+    def is_compact(self):
+        """?compact=1 のときは一覧で内容の先頭だけを返す"""
+        return self.request.query_params.get("compact") in ("1", "true")
     
+    def list(self, request, *args, **kwargs):
+        # 変更がなければ、件数とmax(updated_at)だけで304を返す
+        category = request.query_params.get("category")
+        etag = list_etag(request.user, self.get_queryset(), request.accepted_renderer.format, category=category)
+        response = conditional_response(request, etag=etag)
+        if response is not None:
+            return set_validators(response, etag=etag)
+        # next, previousのURLにホスト名が入るので、クエリパラメータと一緒にキーに含める
+        params = {"host": request.get_host(), "cursor_pagination": settings.MEMO_CURSOR_PAGINATION}
+        params.update(request.query_params.items())
+        data = get_or_compute(
+            request.user.pk, "api", params, lambda: super(MemoViewSet, self).list(request, *args, **kwargs).data
+        )
+        return set_validators(Response(data), etag=etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = memo_etag(instance, request.accepted_renderer.format)
+        response = conditional_response(request, etag=etag, last_modified=instance.updated_at)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        return set_validators(response, etag=etag, last_modified=instance.updated_at)
+
+    def update(self, request, *args, **kwargs):
+        """If-Match、If-Unmodified-Sinceがあれば、取得したときから変更されていないときだけ更新する(違えば412)
+
+        比べてから保存するまでメモの行をロックするので、同じETagで同時に更新しても片方は412になる。
+        """
+        if self.is_conditional():
+            with transaction.atomic(using=self.get_queryset().db):
+                instance = self.get_object()
+                response = conditional_response(
+                    request, etag=memo_etag(instance, request.accepted_renderer.format),
+                    last_modified=instance.updated_at,
+                )
+                if response is not None:
+                    return response
+                response = super().update(request, *args, **kwargs)
+        else:
+            response = super().update(request, *args, **kwargs)
+        instance = self.updated_instance
+        return set_validators(
+            response, etag=memo_etag(instance, request.accepted_renderer.format), last_modified=instance.updated_at
+        )
+
+    def perform_update(self, serializer):
+        # 更新後のETagを返すために保存したメモを残しておく
+        self.updated_instance = serializer.save()
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
\ No newline at end of file
+        serializer.save(user=self.request.user)
+
+    @action(detail=False)
+    def search(self, request):
+        """/api/memo/search/?q=検索語 関連度の高い順に返す"""
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise serializers.ValidationError({"q": ["検索語を入力してください"]})
+        memos = search_memos(self.get_queryset(), request.user, query)
+        # 結果はリストなのでページ番号で分ける
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(memos, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+    @action(detail=False)
+    def stats(self, request):
+        """/api/memo/stats/ カテゴリー別・重要度別のメモの件数"""
+        return Response(user_stats(request.user))
+
+    @action(detail=False)
+    def changes(self, request):
+        """/api/memo/changes/?cursor=&since=&page_size= 前回から作成・更新・削除されたメモを古い順に返す
+
+        最初はcursorなし(すべて)か、since(ISO 8601の日時。その日時以降)で取得する。
+        レスポンスの next_cursor を保存して次の取得で渡す。has_more が true の間は続けて取得する。
+        """
+        position = None
+        cursor = request.query_params.get("cursor")
+        since = request.query_params.get("since")
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except InvalidCursor:
+                raise serializers.ValidationError({"cursor": ["不正なカーソルです"]})
+        elif since:
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is None:
+                raise serializers.ValidationError({"since": ["ISO 8601の日時を指定してください"]})
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            # idは1以上なので、sinceと同じ日時の変更も含まれる
+            position = (since, 0)
+        try:
+            page_size = min(int(request.query_params.get("page_size", CHANGES_PAGE_SIZE)), CHANGES_MAX_PAGE_SIZE)
+        except ValueError:
+            page_size = CHANGES_PAGE_SIZE
+        page = changes(request.user, position, max(page_size, 1))
+        context = self.get_serializer_context()
+        results = [
+            {
+                "id": pk,
+                "deleted": kind == DELETE,
+                "changed_at": timestamp,
+                "memo": None if kind == DELETE else MemoSerializer(memo, context=context).data,
+            }
+            for kind, timestamp, pk, memo in page.items
+        ]
+        return Response({"results": results, "next_cursor": page.next_cursor, "has_more": page.has_more})
+
+    @action(detail=False, methods=["post", "patch", "delete"])
+    def bulk(self, request):
+        """/api/memo/bulk/ 一括作成(POST)、部分更新(PATCH)、削除(DELETE)
+
+        POST, PATCHはメモのリスト(PATCHは"id"が必要)、DELETEはidのリストを受け取る。
+        レスポンスは入力と同じ順番で1件ずつの結果(statusとdata、またはerrors)を返す。
+        """
+        items = request.data
+        if not isinstance(items, list):
+            raise serializers.ValidationError({"non_field_errors": ["リストを送信してください"]})
+        if len(items) > BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                {"non_field_errors": [f"一度に送信できるのは{BULK_MAX_ITEMS}件までです"]}
+            )
+        context = self.get_serializer_context()
+        if request.method == "POST":
+            results = bulk_create_memos(request.user, items, context=context)
+        elif request.method == "PATCH":
+            results = bulk_update_memos(request.user, items, context=context)
+        else:
+            results = bulk_delete_memos(request.user, items)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+    @action(detail=False)
+    def export(self, request):
+        """/api/memo/export/?fmt=ndjson|csv|json&gzip=1 すべてのメモをストリーミングで返す
+
+        ?formatはDRFがレスポンスの形式の指定に使うので、形式はfmtで指定する。
+        """
+        export_format = request.query_params.get("fmt", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            raise serializers.ValidationError({"fmt": [f"{', '.join(EXPORT_FORMATS)} のどれかを指定してください"]})
+        compress = request.query_params.get("gzip") in ("1", "true")
+        response = StreamingHttpResponse(
+            export_memos(Memo.objects.for_user(request.user), export_format, compress=compress),
+            content_type="application/gzip" if compress else f"{EXPORT_FORMATS[export_format]}; charset=utf-8",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{export_filename(export_format, compress)}"'
+        return response
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_memos(self, request):
+        """/api/memo/import/?fmt=ndjson|csv リクエストの本文(NDJSONまたはCSV)をまとめてインポートする
+
+        本文はパースせずに1行ずつ読むので、大きなファイルもそのまま送信できる。
+        """
+        import_format = request.query_params.get("fmt", "ndjson")
+        if import_format not in IMPORT_FORMATS:
+            raise serializers.ValidationError({"fmt": [f"{', '.join(IMPORT_FORMATS)} のどちらかを指定してください"]})
+        if request.stream is None:
+            raise serializers.ValidationError({"non_field_errors": ["本文が空です"]})
+        result = MemoImporter(request.user).run(read_rows(decode_lines(request.stream), import_format))
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MemoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'memo'
+
+    def ready(self):
+        # シグナルの受信関数を登録する
+        from . import signals  # noqa: F401
+        if settings.MEMO_KAKASI_WARMUP:
+            # 最初のリクエストで辞書の読み込みを待たないように、起動時に読み込んでおく
+            from .models import get_kakasi
+            get_kakasi()
@@ -0,0 +1,98 @@
+"""ASGIで動かすときの一覧・詳細API(/api/async/memo/)
+
+DRFのビューは同期なので、Djangoの非同期ビューで MemoViewSet の list, retrieve と同じJSONを返す。
+認証はセッションだけに対応する。
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.exceptions import NotAuthenticated, NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import Memo
+from .serializers import MemoSerializer, MemoListSerializer
+from .api_views import MemoViewSet
+from .sharding import is_sharded, shard_for
+
+
+def _json(data, status=200):
+    # DRFのJSONRendererと同じく日本語はエスケープしない
+    return JsonResponse(data, status=status, json_dumps_params={"ensure_ascii": False})
+
+
+def _error(exc, status=None):
+    return _json({"detail": str(exc.detail)}, status=status or exc.status_code)
+
+
+class AsyncMemoAPIView(View):
+    read_from_replica = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            # DRFのSessionAuthenticationと同じく、WWW-Authenticateを返せないので403にする
+            return _error(NotAuthenticated(), status=403)
+        request.user = user
+        if is_sharded():
+            # get_queryset() でシャードの記録をDBから読まないように、先にキャッシュに入れておく
+            await sync_to_async(shard_for)(user)
+        return await super().dispatch(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Memo.objects.for_user(self.request.user)
+
+
+class AsyncMemoListAPIView(AsyncMemoAPIView):
+    """GET /api/async/memo/?page=&category=&ordering=&compact=1"""
+    page_size = api_settings.PAGE_SIZE
+
+    def get_ordering(self):
+        ordering = [
+            field for field in self.request.GET.get("ordering", "").split(",")
+            if field.lstrip("-") in MemoViewSet.ordering_fields
+        ]
+        return ordering or MemoViewSet.ordering
+
+    def page_link(self, number, num_pages):
+        if number < 1 or number > num_pages:
+            return None
+        url = self.request.build_absolute_uri()
+        if number == 1:
+            return remove_query_param(url, "page")
+        return replace_query_param(url, "page", number)
+
+    async def get(self, request):
+        compact = request.GET.get("compact") in ("1", "true")
+        qs = self.get_queryset().in_category(request.GET.get("category"))
+        if compact:
+            qs = qs.with_content_preview()
+        count = await qs.acount()
+        num_pages = max(1, -(-count // self.page_size))
+        try:
+            number = int(request.GET.get("page") or 1)
+        except ValueError:
+            number = 0
+        if not 1 <= number <= num_pages:
+            return _error(NotFound(PageNumberPagination.invalid_page_message))
+        start = (number - 1) * self.page_size
+        memos = [memo async for memo in qs.order_by(*self.get_ordering())[start:start + self.page_size]]
+        serializer_class = MemoListSerializer if compact else MemoSerializer
+        return _json({
+            "count": count,
+            "next": self.page_link(number + 1, num_pages),
+            "previous": self.page_link(number - 1, num_pages),
+            "results": serializer_class(memos, many=True, context={"request": request}).data,
+        })
+
+
+class AsyncMemoDetailAPIView(AsyncMemoAPIView):
+    """GET /api/async/memo/<id>/"""
+
+    async def get(self, request, pk):
+        try:
+            memo = await self.get_queryset().aget(pk=pk)
+        except Memo.DoesNotExist:
+            return _error(NotFound())
+        return _json(MemoSerializer(memo, context={"request": request}).data)
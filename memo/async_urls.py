@@ -0,0 +1,16 @@
+from django.urls import path
+
+from .async_views import (
+    AsyncMemoListView, AsyncMemoDetailView, AsyncMemoCreateView, AsyncMemoEditView, AsyncMemoDeleteView,
+)
+
+
+# urls.py と同じ名前にして、名前空間 "memo" の別のインスタンスとして /async/ にincludeする
+app_name = "memo"
+urlpatterns = [
+    path("", AsyncMemoListView.as_view(), name="memo"),
+    path("detail/<slug:slug>/", AsyncMemoDetailView.as_view(), name="detail"),
+    path("create/", AsyncMemoCreateView.as_view(), name="create"),
+    path("edit/<slug:slug>/", AsyncMemoEditView.as_view(), name="edit"),
+    path("delete/<slug:slug>/", AsyncMemoDeleteView.as_view(), name="delete"),
+]
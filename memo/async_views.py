@@ -0,0 +1,159 @@
+"""ASGIで動かすときのメモの画面(/async/)
+
+views.py と同じ画面を非同期のORM(aget, acount, async for)で返す。
+同期のビューはASGIではリクエストごとにスレッドプールで実行されるが、こちらはイベントループ上で実行される。
+URLは名前空間 "memo" の別のインスタンス(async_memo)なので、テンプレートの {% url 'memo:...' %} は /async/ のURLになる。
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.paginator import Page, Paginator, InvalidPage
+from django.http import Http404
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.views import View
+
+from .models import Memo
+from .forms import MemoForm
+from .pagination import paginate_keyset
+from .search import search_memos
+from .sharding import is_sharded, shard_for
+from .stats import user_stats
+
+
+class AsyncLoginRequiredMixin:
+    """LoginRequiredMixinの非同期版。ユーザーはrequest.auser()で取得する"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        # テンプレートなどから同期で読み込まないように、取得したユーザーに置き換える
+        request.user = user
+        if is_sharded():
+            # get_queryset() でシャードの記録をDBから読まないように、先にキャッシュに入れておく
+            await sync_to_async(shard_for)(user)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncMemoMixin(AsyncLoginRequiredMixin):
+    def get_queryset(self):
+        return Memo.objects.for_user(self.request.user)
+
+    async def get_object(self):
+        try:
+            return await self.get_queryset().aget(slug=self.kwargs["slug"])
+        except Memo.DoesNotExist:
+            raise Http404("メモが見つかりません")
+
+    def reverse(self, name, **kwargs):
+        # /async/ から来たときは /async/ のURLを返す
+        return reverse(name, kwargs=kwargs, current_app=self.request.resolver_match.namespace)
+
+
+class AsyncMemoListView(AsyncMemoMixin, View):
+    """MemoListViewの非同期版"""
+    template_name = "memo.html"
+    read_from_replica = True
+    paginate_by = 9
+    paginate_orphans = 2
+
+    async def get(self, request):
+        qs = self.get_queryset().in_category(request.GET.get("category")).with_content_preview()
+        query = request.GET.get("q", "").strip()
+        if query:
+            # 全文検索は同期のカーソルを使うのでスレッドで実行する
+            object_list = await sync_to_async(search_memos)(qs, request.user, query)
+            paginator, page_obj = await sync_to_async(self.paginate)(object_list)
+        elif settings.MEMO_CURSOR_PAGINATION:
+            paginator = None
+            page_obj = await sync_to_async(paginate_keyset)(
+                qs, request.GET.get("cursor"), self.paginate_by, orphans=self.paginate_orphans
+            )
+        else:
+            paginator, page_obj = await self.apaginate(qs.ordered())
+        counts = (await sync_to_async(user_stats)(request.user))["category"]
+        context = {
+            "category_choices": [(value, label, counts.get(value, 0)) for value, label in Memo.CATEGORY],
+            "memo_total": sum(counts.values()),
+            "paginator": paginator,
+            "page_obj": page_obj,
+            "is_paginated": page_obj.has_other_pages(),
+            "object_list": page_obj.object_list,
+        }
+        return TemplateResponse(request, self.template_name, context)
+
+    def paginate(self, object_list):
+        paginator = Paginator(object_list, self.paginate_by, orphans=self.paginate_orphans)
+        try:
+            return paginator, paginator.page(self.request.GET.get("page") or 1)
+        except InvalidPage:
+            return paginator, paginator.page(1)
+
+    async def apaginate(self, queryset):
+        """COUNTと1ページ分を非同期で取得する。存在しないページのときは1ページ目"""
+        paginator = Paginator(queryset, self.paginate_by, orphans=self.paginate_orphans)
+        paginator.count = await queryset.acount()
+        try:
+            number = paginator.validate_number(self.request.GET.get("page") or 1)
+        except InvalidPage:
+            number = 1
+        bottom = (number - 1) * self.paginate_by
+        top = bottom + self.paginate_by
+        if top + self.paginate_orphans >= paginator.count:
+            top = paginator.count
+        object_list = [memo async for memo in queryset[bottom:top]]
+        return paginator, Page(object_list, number, paginator)
+
+
+class AsyncMemoDetailView(AsyncMemoMixin, View):
+    read_from_replica = True
+
+    async def get(self, request, slug):
+        memo = await self.get_object()
+        return TemplateResponse(request, "detail.html", {"memo": memo, "object": memo})
+
+
+class AsyncMemoCreateView(AsyncMemoMixin, View):
+    template_name = "create.html"
+
+    async def get(self, request):
+        return TemplateResponse(request, self.template_name, {"form": MemoForm()})
+
+    async def post(self, request):
+        form = MemoForm(request.POST)
+        if not form.is_valid():
+            return TemplateResponse(request, self.template_name, {"form": form})
+        form.instance.user = request.user
+        await form.instance.asave()
+        return redirect(self.reverse("memo:memo"))
+
+
+class AsyncMemoEditView(AsyncMemoMixin, View):
+    template_name = "edit.html"
+
+    async def get(self, request, slug):
+        memo = await self.get_object()
+        return TemplateResponse(request, self.template_name, {"form": MemoForm(instance=memo), "memo": memo})
+
+    async def post(self, request, slug):
+        memo = await self.get_object()
+        form = MemoForm(request.POST, instance=memo)
+        if not form.is_valid():
+            return TemplateResponse(request, self.template_name, {"form": form, "memo": memo})
+        await memo.asave()
+        return redirect(self.reverse("memo:detail", slug=memo.slug))
+
+
+class AsyncMemoDeleteView(AsyncMemoMixin, View):
+    template_name = "delete.html"
+
+    async def get(self, request, slug):
+        memo = await self.get_object()
+        return TemplateResponse(request, self.template_name, {"memo": memo, "object": memo})
+
+    async def post(self, request, slug):
+        memo = await self.get_object()
+        await memo.adelete()
+        return redirect(self.reverse("memo:memo"))
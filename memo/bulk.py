@@ -0,0 +1,197 @@
+"""APIからの一括作成・更新・削除
+
+どの処理も1件ずつの結果(成功したデータ、またはエラー)を入力と同じ順番のリストで返す。
+エラーのない項目はまとめて1つのトランザクションで書き込む。
+"""
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from rest_framework import status, serializers
+
+from .models import Memo, SLUG_RETRY_LIMIT, allocate_slugs, generate_slugs, reserve_slug, slug_usage
+from .sharding import shard_for_write
+from .serializers import MemoSerializer
+from .signals import memos_bulk_created, memos_bulk_deleted, memos_bulk_updated
+
+
+# 1回のリクエストで扱える最大件数
+BULK_MAX_ITEMS = 1000
+
+
+def _error(index, status_code, errors):
+    return {"index": index, "status": status_code, "errors": errors}
+
+
+def _is_id(value):
+    # boolはintのサブクラスなので除く
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _invalid_id(index):
+    return _error(index, status.HTTP_400_BAD_REQUEST, {"id": ["idは整数で指定してください"]})
+
+
+def validate_item(serializer, item):
+    """1つのシリアライザを使い回して検証する(項目ごとに作るとフィールドの構築が重い)
+
+    戻り値: (validated_data, errors)
+    """
+    try:
+        return serializer.run_validation(item), None
+    except serializers.ValidationError as exc:
+        return None, serializers.as_serializer_error(exc)
+
+
+def _duplicate_id(index):
+    return _error(index, status.HTTP_400_BAD_REQUEST, {"id": ["同じidがほかの項目で指定されています"]})
+
+
+def _duplicate_slug(index):
+    return _error(index, status.HTTP_400_BAD_REQUEST, {"slug": ["同じslugがほかの項目で指定されています"]})
+
+
+def _serialize(memos, context):
+    return MemoSerializer([memo for _, memo in memos], many=True, context=context).data
+
+
+def bulk_create_memos(user, items, context=None):
+    """slugの指定がなければタイトルから生成する(1件ずつの作成と同じ)。指定したslugの重複は400"""
+    results = [None] * len(items)
+    memos = []
+    requested = set()
+    serializer = MemoSerializer(context=context)
+    for index, item in enumerate(items):
+        validated_data, errors = validate_item(serializer, item)
+        if errors:
+            results[index] = _error(index, status.HTTP_400_BAD_REQUEST, errors)
+            continue
+        slug = validated_data.get("slug")
+        if slug:
+            if slug in requested:
+                results[index] = _duplicate_slug(index)
+                continue
+            requested.add(slug)
+        memos.append((index, Memo(user=user, **validated_data)))
+
+    if memos:
+        # slugを指定したメモを先に割り当てて、生成するslugがそれと重ならないようにする
+        ordered = [memo for _, memo in memos if memo.slug] + [memo for _, memo in memos if not memo.slug]
+        generated = iter(generate_slugs([memo.title for memo in ordered if not memo.slug], user.id))
+        base_slugs = [memo.slug or next(generated) for memo in ordered]
+        for attempt in range(SLUG_RETRY_LIMIT):
+            for memo, slug in zip(ordered, allocate_slugs(user.id, base_slugs)):
+                memo.slug = slug
+            try:
+                alias = shard_for_write(user)
+                with transaction.atomic(using=alias):
+                    Memo.objects.using(alias).bulk_create([memo for _, memo in memos])
+                    memos_bulk_created.send(sender=Memo, user=user, memos=[memo for _, memo in memos])
+                break
+            except IntegrityError:
+                # 同時に作成されたメモとslugが重なったときは割り当てからやり直す
+                for _, memo in memos:
+                    memo.pk = None
+                    memo._state.adding = True
+                if attempt == SLUG_RETRY_LIMIT - 1:
+                    raise
+
+    for (index, _), data in zip(memos, _serialize(memos, context)):
+        results[index] = {"index": index, "status": status.HTTP_201_CREATED, "data": data}
+    return results
+
+
+def bulk_update_memos(user, items, context=None):
+    """各項目の"id"のメモを部分更新する(PATCHと同じ)
+
+    slugをほかのメモや項目と同じにすると400、空にするとタイトルから生成し直す。
+    すでに受け付けた項目と同じidの項目は400(更新前の値がわからなくなり、件数がずれるため)。
+    """
+    results = [None] * len(items)
+    requested = set()
+    accepted = set()
+    ids = [item.get("id") for item in items if isinstance(item, dict)]
+    existing = Memo.objects.for_user(user).in_bulk([pk for pk in ids if _is_id(pk)])
+    memos = []
+    fields = set()
+    previous = {}
+    serializer = MemoSerializer(partial=True, context=context)
+    for index, item in enumerate(items):
+        if not (isinstance(item, dict) and _is_id(item.get("id"))):
+            results[index] = _invalid_id(index)
+            continue
+        if item["id"] in accepted:
+            results[index] = _duplicate_id(index)
+            continue
+        memo = existing.get(item["id"])
+        if memo is None:
+            results[index] = _error(index, status.HTTP_404_NOT_FOUND, {"id": ["メモが見つかりません"]})
+            continue
+        serializer.instance = memo
+        validated_data, errors = validate_item(serializer, item)
+        if errors:
+            results[index] = _error(index, status.HTTP_400_BAD_REQUEST, errors)
+            continue
+        slug = validated_data.get("slug")
+        if slug:
+            if slug in requested:
+                results[index] = _duplicate_slug(index)
+                continue
+            requested.add(slug)
+        previous[memo.pk] = {name: getattr(memo, name) for name in validated_data}
+        for name, value in validated_data.items():
+            setattr(memo, name, value)
+        fields.update(validated_data)
+        accepted.add(memo.pk)
+        memos.append((index, memo))
+
+    regenerated = [memo for _, memo in memos if not memo.slug]
+    if regenerated:
+        base_slugs = generate_slugs([memo.title for memo in regenerated], user.id)
+        usage = slug_usage(user.id, base_slugs)
+        for slug in requested:
+            reserve_slug(usage, slug)
+        for memo, slug in zip(regenerated, allocate_slugs(user.id, base_slugs, usage=usage)):
+            memo.slug = slug
+
+    if memos:
+        # bulk_updateではauto_nowが効かないので更新日時を自分で入れる
+        now = timezone.now()
+        for _, memo in memos:
+            memo.updated_at = memo.changed_at = now
+        fields.update(("updated_at", "changed_at"))
+        alias = shard_for_write(user)
+        with transaction.atomic(using=alias):
+            Memo.objects.using(alias).bulk_update([memo for _, memo in memos], sorted(fields))
+            memos_bulk_updated.send(
+                sender=Memo, user=user, memos=[memo for _, memo in memos],
+                fields=fields, previous=previous,
+            )
+
+    for (index, _), data in zip(memos, _serialize(memos, context)):
+        results[index] = {"index": index, "status": status.HTTP_200_OK, "data": data}
+    return results
+
+
+def bulk_delete_memos(user, ids):
+    """idのリストのメモを削除する
+
+    post_deleteは1件ずつ送られて、tombstoneや件数の更新が1件ずつのクエリになるので、
+    まとめて削除してからmemos_bulk_deletedを送る。
+    """
+    results = [None] * len(ids)
+    alias = shard_for_write(user)
+    with transaction.atomic(using=alias):
+        qs = Memo.objects.using(alias).filter(user=user, pk__in=[pk for pk in ids if _is_id(pk)])
+        memos = list(qs.only("pk", "category", "priority"))
+        found = {memo.pk for memo in memos}
+        if memos:
+            Memo.objects.using(alias).filter(pk__in=found)._raw_delete(alias)
+            memos_bulk_deleted.send(sender=Memo, user=user, memos=memos, using=alias)
+    for index, pk in enumerate(ids):
+        if not _is_id(pk):
+            results[index] = _invalid_id(index)
+        elif pk in found:
+            results[index] = {"index": index, "status": status.HTTP_204_NO_CONTENT, "id": pk}
+            found.discard(pk)
+        else:
+            results[index] = _error(index, status.HTTP_404_NOT_FOUND, {"id": ["メモが見つかりません"]})
+    return results
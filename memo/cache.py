@@ -0,0 +1,95 @@
+"""メモ一覧のキャッシュ
+
+ユーザーごとにバージョン番号を持ち、キャッシュのキーに含める。
+メモを保存、削除したときはバージョンを1つ上げるだけで、そのユーザーの古いキャッシュはすべて使われなくなる
+(古いキャッシュは期限切れかLRUで消える)。削除するキーを探す必要がないので、どのキャッシュバックエンドでも使える。
+"""
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+VERSION_KEY = "memo:v:{user_id}"
+LIST_KEY = "memo:list:{user_id}:{version}:{name}:{params}"
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _new_version():
+    # キャッシュから消えたあとに作り直しても、以前の番号と重ならないように時刻から作る
+    return time.time_ns()
+
+
+def get_version(user_id):
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def reset_version(user_id):
+    cache.set(VERSION_KEY.format(user_id=user_id), _new_version(), timeout=None)
+
+
+def _incr_version(user_id):
+    try:
+        cache.incr(VERSION_KEY.format(user_id=user_id))
+    except ValueError:
+        # キーがない(まだ作られていない、または消えた)
+        reset_version(user_id)
+
+
+def bump_version(user_id):
+    """user_idのメモ一覧のキャッシュを無効にする
+
+    トランザクションの途中で読まれた古い一覧が新しいバージョンでキャッシュされないように、
+    コミットしたあとにもう一度上げる。
+    """
+    _incr_version(user_id)
+    transaction.on_commit(lambda: _incr_version(user_id))
+
+
+def list_cache_key(user_id, name, params):
+    """name: 一覧の種類("page"、"api"など)、params: ページやカテゴリなどキャッシュを分ける値"""
+    encoded = urlencode(sorted((key, str(value)) for key, value in params.items() if value not in (None, "")))
+    digest = hashlib.md5(encoded.encode(), usedforsecurity=False).hexdigest()
+    return LIST_KEY.format(user_id=user_id, version=get_version(user_id), name=name, params=digest)
+
+
+def get_or_compute(user_id, name, params, compute):
+    """キャッシュにあればそれを返し、なければcompute()の結果をキャッシュして返す
+
+    MEMO_LIST_CACHE_TIMEOUT が0のときはキャッシュしない。
+    """
+    timeout = settings.MEMO_LIST_CACHE_TIMEOUT
+    if not timeout:
+        return compute()
+    key = list_cache_key(user_id, name, params)
+    value = cache.get(key)
+    with _stats_lock:
+        _stats["hits" if value is not None else "misses"] += 1
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout=timeout)
+    return value
+
+
+def cache_stats():
+    """このプロセスでのヒット数、ミス数、ヒット率"""
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats["hits"] = _stats["misses"] = 0
@@ -0,0 +1,100 @@
+"""変更の取得(/api/memo/changes/)
+
+前回の位置(cursor)より後に作成・更新されたメモと、削除されたメモ(MemoTombstone)を (日時, id) の順に返す。
+メモの日時は changed_at(書き込んだ日時)なので、更新日時を引き継いだインポートなどのメモも前回の位置より後になる。
+メモとtombstoneはUNION ALLの1回のクエリで位置を調べるので、変更がなければインデックスを読む1回のクエリで終わる。
+"""
+import base64
+import binascii
+import json
+
+from django.db import connections, models
+from django.db.models import F, Value
+from django.db.models.lookups import GreaterThan
+from django.utils.dateparse import parse_datetime
+
+from .models import Memo, MemoTombstone
+from .pagination import _row
+
+
+CHANGES_PAGE_SIZE = 100
+CHANGES_MAX_PAGE_SIZE = 1000
+
+# UNIONの結果のkindの値
+UPSERT = 0
+DELETE = 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    data = json.dumps({"t": timestamp.isoformat(), "i": pk}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """トークンから(日時, id)を取り出す。不正なトークンはInvalidCursor"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        position = (parse_datetime(data["t"]), int(data["i"]))
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
+        raise InvalidCursor(token)
+    if position[0] is None:
+        raise InvalidCursor(token)
+    return position
+
+
+def _after(timestamp_field, id_field, position):
+    """(timestamp_field, id_field) > position の行値比較"""
+    return GreaterThan(
+        _row(F(timestamp_field), F(id_field)),
+        _row(Value(position[0], output_field=models.DateTimeField()), Value(position[1])),
+    )
+
+
+class ChangesPage:
+    """changes()の結果。itemsは (kind, 日時, id, メモまたはNone) のリスト"""
+
+    def __init__(self, items, next_cursor, has_more):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.has_more = has_more
+
+
+def changes(user, position=None, page_size=CHANGES_PAGE_SIZE, using=None):
+    """positionより後の変更をpage_size件まで返す。positionがNoneなら最初から"""
+    # シャーディングしていればユーザーのシャード、していなければrouterが選ぶDB(レプリカなど)
+    using = using or Memo.objects.for_user(user).db
+    memos = Memo.objects.using(using).filter(user=user)
+    tombstones = MemoTombstone.objects.using(using).filter(user=user)
+    if position is not None:
+        memos = memos.filter(_after("changed_at", "id", position))
+        tombstones = tombstones.filter(_after("deleted_at", "memo_id", position))
+    memos = memos.annotate(ts=F("changed_at"), kind=Value(UPSERT)).values_list("ts", "id", "kind")
+    tombstones = tombstones.annotate(
+        ts=F("deleted_at"), kind=Value(DELETE)
+    ).values_list("ts", "memo_id", "kind")
+    if connections[using].features.supports_slicing_ordering_in_compound:
+        # PostgreSQLではそれぞれをインデックスの順にpage_size+1件で打ち切る
+        memos = memos.order_by("changed_at", "id")[:page_size + 1]
+        tombstones = tombstones.order_by("deleted_at", "memo_id")[:page_size + 1]
+    rows = list(memos.union(tombstones, all=True).order_by("ts", "id")[:page_size + 1])
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    upserted = Memo.objects.using(using).in_bulk([pk for _, pk, kind in rows if kind == UPSERT])
+    items = []
+    for timestamp, pk, kind in rows:
+        memo = upserted.get(pk) if kind == UPSERT else None
+        if kind == UPSERT and memo is None:
+            # 位置を調べたあとに削除された。tombstoneは次の取得で返す
+            continue
+        items.append((kind, timestamp, pk, memo))
+    if rows:
+        next_cursor = encode_cursor(rows[-1][0], rows[-1][1])
+    else:
+        next_cursor = encode_cursor(*position) if position is not None else None
+    return ChangesPage(items, next_cursor, has_more)
@@ -0,0 +1,64 @@
+"""条件付きリクエスト(ETag, Last-Modified, If-Match)
+
+検証子は本文を作らずに計算する。
+- 一覧: 絞り込んだメモの max(updated_at) と件数。削除しても max(updated_at) は変わらないので、
+  一覧にはLast-Modifiedを付けず、件数を含めたETagだけを使う
+- 詳細: メモの updated_at
+"""
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, Max
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_or_compute
+
+
+def make_etag(*parts):
+    digest = hashlib.md5("|".join(str(part) for part in parts).encode(), usedforsecurity=False).hexdigest()
+    return quote_etag(digest)
+
+
+def list_validators(user, queryset, category=None):
+    """一覧の (max(updated_at), 件数)。ユーザーごとの一覧のキャッシュに入れるので、メモを変更するまで再計算しない"""
+    def compute():
+        result = queryset.order_by().aggregate(last_modified=Max("updated_at"), count=Count("pk"))
+        return result["last_modified"], result["count"]
+    return get_or_compute(user.pk, "validators", {"category": category}, compute)
+
+
+def list_etag(user, queryset, *variant, category=None):
+    """variant: 同じデータでも本文が変わる要素(レンダラーの形式など)"""
+    last_modified, count = list_validators(user, queryset, category=category)
+    return make_etag("list", user.pk, last_modified.isoformat() if last_modified else "", count, *variant)
+
+
+def memo_etag(memo, *variant):
+    return make_etag("memo", memo.pk, memo.updated_at.isoformat(), *variant)
+
+
+def html_variant(request):
+    """HTMLのページはニックネームとCSRFトークンを含むので、これらが変わったら別のETagにする"""
+    user = request.user
+    # 初回のアクセスでもページに埋め込むトークンの元の値が決まるように、先に作っておく
+    get_token(request)
+    return (user.pk, getattr(user, "nickname", ""), request.META.get("CSRF_COOKIE", ""))
+
+
+def conditional_response(request, etag=None, last_modified=None):
+    """条件を満たさないときは304または412のレスポンス、満たすときはNone"""
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=timegm(last_modified.utctimetuple()) if last_modified else None,
+    )
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag:
+        response.headers["ETag"] = etag
+    if last_modified:
+        response.headers["Last-Modified"] = http_date(timegm(last_modified.utctimetuple()))
+    return response
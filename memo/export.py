@@ -0,0 +1,95 @@
+"""メモのエクスポート
+
+QuerySet.iterator()で少しずつ読み、ある程度たまったら書き出すジェネレーターにしているので、
+メモが何件あってもメモリの使用量はほぼ一定になる。
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+EXPORT_FIELDS = ["id", "title", "slug", "category", "priority", "content", "created_at", "updated_at"]
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "json": "application/json",
+}
+# DBから1回に読む件数
+EXPORT_CHUNK_SIZE = 2000
+# この大きさ(文字数)ごとに書き出す
+BUFFER_SIZE = 64 * 1024
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def _rows(queryset, chunk_size):
+    return queryset.order_by("pk").values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def _buffered(parts):
+    """細かい文字列をBUFFER_SIZEごとにまとめる"""
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= BUFFER_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _ndjson(rows):
+    for row in rows:
+        yield _encoder.encode(row) + "\n"
+
+
+def _json(rows):
+    yield "["
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + "\n" + _encoder.encode(row)
+    yield "\n]\n"
+
+
+def _csv(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        row["created_at"] = row["created_at"].isoformat()
+        row["updated_at"] = row["updated_at"].isoformat()
+        writer.writerow(row)
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+
+
+_WRITERS = {"ndjson": _ndjson, "csv": _csv, "json": _json}
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31: gzip形式
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_memos(queryset, export_format="ndjson", compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """querysetのメモをexport_formatで書き出すバイト列のジェネレーター"""
+    if export_format not in _WRITERS:
+        raise ValueError(f"未対応の形式です: {export_format}")
+    chunks = (part.encode("utf-8") for part in _buffered(_WRITERS[export_format](_rows(queryset, chunk_size))))
+    if compress:
+        chunks = _gzip(chunks)
+    return chunks
+
+
+def export_filename(export_format, compress=False):
+    return f"memos.{export_format}" + (".gz" if compress else "")
@@ -0,0 +1,210 @@
+"""NDJSON/CSVからのメモのインポート
+
+入力は1行ずつ読み、batch_size件ごとに
+1. MemoSerializerで検証する
+2. タイトルをまとめてslugに変換し、既存のslugとの重複をメモリ上で解決する
+3. bulk_createで1つのトランザクションとして書き込む
+を行う。バッチごとに処理済みの行数をチェックポイントに記録するので、途中で止まっても続きから再開できる。
+"""
+import codecs
+import csv
+import json
+import os
+import time
+
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from .bulk import validate_item
+from .models import Memo, SLUG_RETRY_LIMIT, allocate_slugs, generate_slugs
+from .sharding import shard_for_write
+from .serializers import MemoSerializer
+from .signals import memos_bulk_created
+
+
+IMPORT_FORMATS = ("ndjson", "csv")
+IMPORT_BATCH_SIZE = 1000
+# 結果に含めるエラーの最大件数
+MAX_REPORTED_ERRORS = 100
+TIMESTAMP_FIELDS = ("created_at", "updated_at")
+
+
+def read_rows(lines, import_format):
+    """文字列の行のイテラブルから辞書を1件ずつ返す。壊れた行は {"__error__": 理由} を返す"""
+    if import_format == "csv":
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield {"__error__": f"JSONとして読めません: {exc}"}
+            continue
+        yield row if isinstance(row, dict) else {"__error__": "オブジェクトではありません"}
+
+
+def decode_lines(byte_lines):
+    """バイト列の行をUTF-8(BOM付きも可)の文字列にする"""
+    return codecs.iterdecode(byte_lines, "utf-8-sig")
+
+
+def _timestamps(row):
+    """エクスポートしたファイルの作成日時、更新日時を引き継ぐ"""
+    values = {}
+    for name in TIMESTAMP_FIELDS:
+        raw = row.get(name)
+        if not raw:
+            continue
+        # JSONの数値や真偽値はparse_datetimeがTypeErrorにするので、文字列以外は読めない値として扱う
+        value = parse_datetime(raw) if isinstance(raw, str) else None
+        if value is None:
+            raise ValueError(f"{name}: 日時として読めません")
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        values[name] = value
+    return values
+
+
+class ImportResult:
+    def __init__(self, resumed_from=0):
+        # チェックポイントから再開したときに読み飛ばした行数
+        self.resumed_from = resumed_from
+        self.processed = 0
+        self.imported = 0
+        self.errors = []
+        self.error_count = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    def as_dict(self):
+        return {
+            "resumed_from": self.resumed_from,
+            "processed": self.processed,
+            "imported": self.imported,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "elapsed": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+class MemoImporter:
+    """userのメモとしてインポートする
+
+    checkpoint: 処理済みの行数を記録するファイル。あればその行数だけ読み飛ばして再開する
+    progress: バッチごとに ImportResult を受け取る関数
+    """
+
+    def __init__(self, user, batch_size=IMPORT_BATCH_SIZE, checkpoint=None, progress=None):
+        self.user = user
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.progress = progress
+        # base_slug -> (使われているか, 最大の番号)。DBへの問い合わせはbase_slugごとに1度だけ
+        self.usage = {}
+        self.serializer = MemoSerializer()
+
+    def _load_checkpoint(self):
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, encoding="utf-8") as f:
+                return json.load(f)["rows"]
+        return 0
+
+    def _save_checkpoint(self, rows):
+        if self.checkpoint:
+            tmp = f"{self.checkpoint}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"rows": rows}, f)
+            os.replace(tmp, self.checkpoint)
+
+    def run(self, rows):
+        skip = self._load_checkpoint()
+        result = ImportResult(resumed_from=skip)
+        self._start = time.perf_counter()
+        batch = []
+        for row_number, row in enumerate(rows, start=1):
+            if row_number <= skip:
+                continue
+            batch.append((row_number, row))
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch, result)
+                batch = []
+        if batch:
+            self._import_batch(batch, result)
+        result.elapsed = time.perf_counter() - self._start
+        return result
+
+    def _build(self, row_number, row, result):
+        """1行からMemoを作る。エラーのときはNone"""
+        if "__error__" in row:
+            result.add_error(row_number, {"non_field_errors": [row["__error__"]]})
+            return None
+        data = {name: row.get(name) for name in ("title", "content", "category", "priority") if row.get(name) not in (None, "")}
+        validated_data, errors = validate_item(self.serializer, data)
+        if errors:
+            result.add_error(row_number, errors)
+            return None
+        try:
+            timestamps = _timestamps(row)
+        except ValueError as exc:
+            result.add_error(row_number, {"non_field_errors": [str(exc)]})
+            return None
+        memo = Memo(user=self.user, **validated_data)
+        memo._import_slug = slugify(row.get("slug") or "")
+        memo._import_timestamps = timestamps
+        return memo
+
+    def _base_slugs(self, memos):
+        """slugの指定がない行はタイトルを変換する"""
+        converted = iter(generate_slugs([memo.title for memo in memos if not memo._import_slug], self.user.id))
+        return [memo._import_slug or next(converted) for memo in memos]
+
+    def _import_batch(self, batch, result):
+        memos = [memo for memo in (self._build(number, row, result) for number, row in batch) if memo]
+        if memos:
+            # slugを引き継ぐ行を先に割り当てて、タイトルから生成するslugがそれと重ならないようにする
+            ordered = [memo for memo in memos if memo._import_slug] + [memo for memo in memos if not memo._import_slug]
+            base_slugs = self._base_slugs(ordered)
+            for attempt in range(SLUG_RETRY_LIMIT):
+                for memo, slug in zip(ordered, allocate_slugs(self.user.id, base_slugs, usage=self.usage)):
+                    memo.slug = slug
+                try:
+                    alias = shard_for_write(self.user)
+                    with transaction.atomic(using=alias):
+                        Memo.objects.using(alias).bulk_create(memos)
+                        # auto_now_addで上書きされた日時を元の値に戻す
+                        restored = [memo for memo in memos if memo._import_timestamps]
+                        for memo in restored:
+                            for name, value in memo._import_timestamps.items():
+                                setattr(memo, name, value)
+                        if restored:
+                            Memo.objects.using(alias).bulk_update(restored, list(TIMESTAMP_FIELDS))
+                        memos_bulk_created.send(sender=Memo, user=self.user, memos=memos)
+                    break
+                except IntegrityError:
+                    # インポート中に他で作成されたslugと重なったので、DBから調べ直す
+                    for base_slug in base_slugs:
+                        self.usage.pop(base_slug, None)
+                    for memo in memos:
+                        memo.pk = None
+                        memo._state.adding = True
+                    if attempt == SLUG_RETRY_LIMIT - 1:
+                        raise
+            result.imported += len(memos)
+        result.processed += len(batch)
+        result.elapsed = time.perf_counter() - self._start
+        self._save_checkpoint(result.resumed_from + result.processed)
+        if self.progress:
+            self.progress(result)
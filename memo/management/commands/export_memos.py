@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from memo.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_memos
+from memo.models import Memo
+
+
+class Command(BaseCommand):
+    help = "ユーザーのメモをNDJSON/CSV/JSONで書き出す(メモの件数によらずメモリ使用量は一定)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--format", dest="export_format", choices=list(EXPORT_FORMATS), default="ndjson")
+        parser.add_argument("--gzip", action="store_true", help="gzipで圧縮する")
+        parser.add_argument("-o", "--output", help="出力先のファイル(省略時は標準出力)")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"ユーザーが見つかりません: {options['username']}")
+        chunks = export_memos(
+            Memo.objects.for_user(user),
+            options["export_format"],
+            compress=options["gzip"],
+            chunk_size=options["chunk_size"],
+        )
+        if options["output"]:
+            with open(options["output"], "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            return
+        out = getattr(self.stdout, "buffer", None)
+        if out is None:
+            # 標準出力がテキストしか受け付けないとき(call_commandのStringIOなど)
+            if options["gzip"]:
+                raise CommandError("--gzip のときは --output を指定してください")
+            for chunk in chunks:
+                self.stdout.write(chunk.decode("utf-8"), ending="")
+            return
+        for chunk in chunks:
+            out.write(chunk)
+        out.flush()
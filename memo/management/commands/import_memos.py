@@ -0,0 +1,63 @@
+import gzip
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from memo.importer import IMPORT_BATCH_SIZE, IMPORT_FORMATS, MemoImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "NDJSON/CSVのファイルからユーザーのメモをまとめてインポートする"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path", help="入力ファイル(.gzは展開して読む、-は標準入力)")
+        parser.add_argument("--format", dest="import_format", choices=IMPORT_FORMATS,
+                            help="省略時はファイルの拡張子から判断する")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE,
+                            help="1回のトランザクションで書き込む件数")
+        parser.add_argument("--checkpoint",
+                            help="処理済みの行数を記録するファイル。途中で止まったときは同じ指定で再開できる")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"ユーザーが見つかりません: {options['username']}")
+        path = options["path"]
+        import_format = options["import_format"]
+        if import_format is None:
+            name = path[:-3] if path.endswith(".gz") else path
+            import_format = "csv" if name.endswith(".csv") else "ndjson"
+
+        importer = MemoImporter(
+            user,
+            batch_size=options["batch_size"],
+            checkpoint=options["checkpoint"],
+            progress=self.report_progress,
+        )
+        if path == "-":
+            result = importer.run(read_rows(sys.stdin, import_format))
+        else:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rt", encoding="utf-8-sig", newline="") as f:
+                result = importer.run(read_rows(f, import_format))
+
+        for error in result.errors:
+            self.stderr.write(f"{error['row']}行目: {error['errors']}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"ほか{result.error_count - len(result.errors)}件のエラー")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.imported}件をインポートしました "
+            f"({result.processed}行, エラー{result.error_count}件, "
+            f"{result.elapsed:.1f}秒, {result.rows_per_second:.0f}行/秒)"
+        ))
+
+    def report_progress(self, result):
+        self.stdout.write(
+            f"{result.resumed_from + result.processed}行処理 "
+            f"({result.imported}件追加, エラー{result.error_count}件) "
+            f"{result.rows_per_second:.0f}行/秒"
+        )
@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from memo.sharding import MOVE_BATCH_SIZE, is_sharded, move_user, shard_for, shards
+
+
+class Command(BaseCommand):
+    help = "ユーザーのメモを別のシャードに移す。移動の最後の数秒だけ、そのユーザーのメモに書き込めなくなる"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("shard", help="移動先のDB(MEMO_SHARDS のどれか)")
+        parser.add_argument("--batch-size", type=int, default=MOVE_BATCH_SIZE)
+        parser.add_argument(
+            "--grace", type=float, default=1.0, help="書き込みを止めてから、最後の変更を写すまで待つ秒数"
+        )
+
+    def handle(self, *args, **options):
+        if not is_sharded():
+            raise CommandError("DB_SHARD_NAMES を設定してください")
+        if options["shard"] not in shards():
+            raise CommandError(f"シャード {options['shard']} がありません({', '.join(shards())})")
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"ユーザー {options['username']} が見つかりません")
+        source = shard_for(user)
+        if source == options["shard"]:
+            self.stdout.write(f"{user.username} はすでに {source} にあります")
+            return
+        count = move_user(user, options["shard"], batch_size=options["batch_size"], grace=options["grace"])
+        self.stdout.write(self.style.SUCCESS(f"{user.username} の{count}件のメモを {source} から {options['shard']} に移しました"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from memo.models import Memo
+from memo.search import index_memos
+from memo.sharding import shards
+
+
+class Command(BaseCommand):
+    help = "すべてのメモの全文検索用の索引を作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        total = 0
+        # シャーディングしているときはシャードごとに作り直す
+        for alias in shards():
+            batch = []
+            for memo in Memo.objects.using(alias).order_by("pk").iterator(chunk_size=batch_size):
+                batch.append(memo)
+                if len(batch) >= batch_size:
+                    index_memos(batch, using=alias)
+                    total += len(batch)
+                    batch = []
+            index_memos(batch, using=alias)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"{total}件のメモを索引しました"))
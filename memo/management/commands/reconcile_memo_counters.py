@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from memo.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = "カテゴリー・重要度別のメモの件数(MemoCounter)を数え直し、ずれていた件数を表示して直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="このユーザー名のユーザーだけ数え直す")
+        parser.add_argument("--check", action="store_true", help="直さずに表示だけする。ずれがあれば終了コード1")
+
+    def handle(self, *args, **options):
+        user_id = None
+        if options["user"]:
+            try:
+                user_id = get_user_model().objects.get(username=options["user"]).pk
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"ユーザー {options['user']} が見つかりません")
+        drift = reconcile(user_id, fix=not options["check"])
+        for uid, category, priority, stored, actual in drift:
+            self.stdout.write(f"user={uid} category={category} priority={priority} stored={stored} actual={actual}")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("件数のずれはありません"))
+        elif options["check"]:
+            raise CommandError(f"{len(drift)}件の件数がずれています")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(drift)}件の件数を直しました"))
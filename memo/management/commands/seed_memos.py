@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from memo.seeding import SEED_BATCH_SIZE, SEED_PASSWORD, seed
+
+
+class Command(BaseCommand):
+    help = "計測用のユーザーとメモを作成する(同じ--seedなら同じデータになる)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--memos-per-user", type=int, default=100)
+        parser.add_argument("--seed", type=int, default=0, help="乱数のseed")
+        parser.add_argument("--prefix", default="seed", help="ユーザー名の先頭(<prefix>0000, <prefix>0001, ...)")
+        parser.add_argument("--password", default=SEED_PASSWORD)
+        parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        users = seed(
+            options["users"],
+            options["memos_per_user"],
+            seed=options["seed"],
+            prefix=options["prefix"],
+            password=options["password"],
+            batch_size=options["batch_size"],
+            progress=lambda user: self.stdout.write(f"{user.username}: {options['memos_per_user']}件"),
+        )
+        elapsed = time.perf_counter() - start
+        total = len(users) * options["memos_per_user"]
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(users)}人のユーザーに{total}件のメモを作成しました ({elapsed:.1f}秒)"
+        ))
@@ -0,0 +1,248 @@
+"""/metrics で出すメトリクス(Prometheusのテキスト形式)
+
+カウンターとヒストグラムはプロセスごとにメモリ上で集計する。gunicornのように複数のワーカーで動かすときは
+MEMO_METRICS_DIR を設定すると、ワーカーごとに <pid>.json へ定期的に書き出し、/metrics ではすべてのファイルを合計する。
+ディレクトリは起動のたびに空にする(終了したワーカーのファイルも合計に含めるので、カウンターは減らない)。
+ゲージ(プールの接続数など)は今の値なので、動いているワーカーのファイルのものだけを合計する。
+"""
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+# リクエストの処理時間(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 1リクエストのクエリ数とSQLの時間(秒)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+QUERY_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# 名前: (種類, 説明, ヒストグラムの区切り)
+METRICS = {
+    "memo_http_requests_total": ("counter", "HTTP requests by URL name, method and status.", None),
+    "memo_http_request_duration_seconds": ("histogram", "Request latency by URL name.", LATENCY_BUCKETS),
+    "memo_db_queries_per_request": ("histogram", "SQL queries per request by URL name.", QUERY_COUNT_BUCKETS),
+    "memo_db_query_seconds_per_request": ("histogram", "SQL time per request by URL name.", QUERY_TIME_BUCKETS),
+    "memo_memos_created_total": ("counter", "Memos created.", None),
+    "memo_slug_collisions_total": (
+        "counter", "Slugs that needed a numeric suffix (taken) or a retry after a concurrent insert (race).", None
+    ),
+    "memo_saves_skipped_total": ("counter", "Memo saves skipped because no field changed.", None),
+    "memo_romaji_conversions_total": ("counter", "Titles converted to romaji with pykakasi.", None),
+    "memo_romaji_cache_hits_total": ("counter", "Romaji conversions served from the cache.", None),
+    "memo_list_cache_hits_total": ("counter", "Memo list cache hits.", None),
+    "memo_list_cache_misses_total": ("counter", "Memo list cache misses.", None),
+    "memo_romaji_cache_hit_ratio": ("gauge", "Romaji cache hit ratio.", None),
+    "memo_list_cache_hit_ratio": ("gauge", "Memo list cache hit ratio.", None),
+    "memo_db_pool_size": ("gauge", "Open connections in the pool.", None),
+    "memo_db_pool_in_use": ("gauge", "Connections checked out of the pool.", None),
+    "memo_db_pool_idle": ("gauge", "Idle connections in the pool.", None),
+    "memo_db_pool_waiting": ("gauge", "Requests waiting for a connection.", None),
+    "memo_db_pool_requests_total": ("counter", "Connections requested from the pool.", None),
+    "memo_db_pool_wait_seconds_total": ("counter", "Time spent waiting for a connection.", None),
+    "memo_db_pool_connections_lost_total": ("counter", "Connections found broken on checkout or return.", None),
+    "memo_db_pool_connection_errors_total": ("counter", "Failed attempts to open a connection.", None),
+}
+
+# pool_stats() の値とメトリクスの名前
+POOL_GAUGES = {"size": "memo_db_pool_size", "in_use": "memo_db_pool_in_use", "idle": "memo_db_pool_idle",
+               "waiting": "memo_db_pool_waiting"}
+POOL_COUNTERS = {"requests": "memo_db_pool_requests_total", "wait_seconds": "memo_db_pool_wait_seconds_total",
+                 "connections_lost": "memo_db_pool_connections_lost_total",
+                 "connection_errors": "memo_db_pool_connection_errors_total"}
+
+# ワーカーのファイルに書き出す間隔(秒)
+FLUSH_INTERVAL = 5
+
+
+class Registry:
+    """このプロセスのカウンターとヒストグラム。キーは (名前, ((ラベル, 値), ...))"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        # 区切りごとの件数(累積しない)、合計、件数
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        """JSONにできる形で返す。キャッシュのヒット数、コネクションプールの状態などもここで読む"""
+        from .cache import cache_stats
+        from .models import romaji_cache_stats
+        from .pool import pool_stats
+
+        with self.lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self.counters.items()]
+            histograms = [
+                [name, list(labels), list(buckets), total, count]
+                for (name, labels), (buckets, total, count) in self.histograms.items()
+            ]
+        romaji = romaji_cache_stats()
+        list_cache = cache_stats()
+        counters += [
+            ["memo_romaji_conversions_total", [], romaji["misses"]],
+            ["memo_romaji_cache_hits_total", [], romaji["hits"]],
+            ["memo_list_cache_hits_total", [], list_cache["hits"]],
+            ["memo_list_cache_misses_total", [], list_cache["misses"]],
+        ]
+        gauges = []
+        for alias, stats in pool_stats().items():
+            labels = [["alias", alias]]
+            gauges += [[name, labels, stats[key]] for key, name in POOL_GAUGES.items()]
+            counters += [[name, labels, stats[key]] for key, name in POOL_COUNTERS.items()]
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+_last_flush = 0.0
+
+
+def flush(force=False):
+    """MEMO_METRICS_DIR があれば、前回からFLUSH_INTERVAL秒たったときにこのプロセスの値を書き出す"""
+    global _last_flush
+    directory = settings.MEMO_METRICS_DIR
+    now = time.monotonic()
+    if not directory or (not force and now - _last_flush < FLUSH_INTERVAL):
+        return
+    _last_flush = now
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(registry.snapshot(), f)
+    # 読み込み中のほかのワーカーが途中までのファイルを読まないように置き換える
+    os.replace(tmp, path)
+
+
+def _alive(pid):
+    """pidのプロセスが動いているか(ワーカーは同じホストで動かす)"""
+    if pid == os.getpid():
+        return True
+    if os.name != "posix":
+        # Windowsのos.killはシグナル0でもプロセスを止めてしまうので、調べずに動いているとみなす
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 別のユーザーのプロセスとして動いている
+        return True
+    return True
+
+
+def _snapshots():
+    directory = settings.MEMO_METRICS_DIR
+    if not directory:
+        return [registry.snapshot()]
+    flush(force=True)
+    snapshots = []
+    for name in os.listdir(directory):
+        pid, ext = os.path.splitext(name)
+        if ext != ".json" or not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            # 書き出し中に終了したワーカーのファイルは使わない
+            continue
+        if not _alive(int(pid)):
+            # 終了したワーカーのカウンターは残すが、そのときの接続数などは今の値ではない
+            snapshot["gauges"] = []
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def collect():
+    """すべてのプロセスの値を合計して (カウンター, ゲージ, ヒストグラム) を返す
+
+    カウンターとゲージは {キー: 値}、ヒストグラムは {キー: [区切りごとの件数, 合計, 件数]}。
+    ゲージ(プールの接続数など)は動いているワーカーの合計になる。
+    """
+    counters = {}
+    gauges = {}
+    histograms = {}
+    for snapshot in _snapshots():
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in snapshot.get("gauges", []):
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            current = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            current[0] = [a + b for a, b in zip(current[0], buckets)]
+            current[1] += total
+            current[2] += count
+    return counters, gauges, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _ratio(counters, hits, misses):
+    hit_count = counters.get((hits, ()), 0)
+    total = hit_count + counters.get((misses, ()), 0)
+    return hit_count / total if total else 0.0
+
+
+def render():
+    """Prometheusのテキスト形式(version 0.0.4)"""
+    counters, gauges, histograms = collect()
+    gauges[("memo_romaji_cache_hit_ratio", ())] = _ratio(
+        counters, "memo_romaji_cache_hits_total", "memo_romaji_conversions_total"
+    )
+    gauges[("memo_list_cache_hit_ratio", ())] = _ratio(
+        counters, "memo_list_cache_hits_total", "memo_list_cache_misses_total"
+    )
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (key_name, labels), (counts, total, count) in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        else:
+            samples = counters if kind == "counter" else gauges
+            for (key_name, labels), value in sorted(samples.items()):
+                if key_name == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,237 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from . import metrics, routers
+from .sharding import ShardMoving
+from .timing import current_timings, install_query_recorder, start_timings, stop_timings
+
+
+logger = logging.getLogger("memo.timing")
+
+# Server-Timingに出す順番と説明(ヘッダーなのでASCIIにする)
+TIMING_NAMES = {
+    "db": "SQL",
+    "render": "Template/Renderer",
+    "serializer": "Serializer",
+    "slug": "Slug",
+}
+
+
+class ServerTimingMiddleware:
+    """リクエストごとのSQLの件数・時間、レンダリング、シリアライザ、slugの生成の時間を計測する
+
+    結果はServer-Timingヘッダーと memo.timing のログに出す。MEMO_SLOW_REQUEST_MS より遅いリクエストは
+    時間のかかったクエリと一緒にWARNINGで出す。MEMO_SERVER_TIMING=False のときはミドルウェアごと使わない。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.MEMO_SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_query_recorder()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        token = start_timings()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = stop_timings(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        token = start_timings()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = stop_timings(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def process_template_response(self, request, response):
+        # この直後にレンダリングされるので、終わったときまでの時間を計測する
+        timings = current_timings()
+        if timings is not None:
+            start = time.perf_counter()
+
+            def record(response):
+                timings.add("render", time.perf_counter() - start)
+
+            response.add_post_render_callback(record)
+        return response
+
+    def finish(self, request, response, timings, total):
+        durations = {"db": timings.query_time, **timings.durations}
+        entries = [f'total;dur={total * 1000:.1f}']
+        for name, description in TIMING_NAMES.items():
+            if name in durations:
+                if name == "db":
+                    description = f"{description} ({timings.query_count} queries)"
+                entries.append(f'{name};dur={durations[name] * 1000:.1f};desc="{description}"')
+        response.headers["Server-Timing"] = ", ".join(entries)
+
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            "db_queries": timings.query_count,
+            **{f"{name}_ms": round(seconds * 1000, 1) for name, seconds in durations.items()},
+        }
+        message = " ".join(f"{key}={value}" for key, value in record.items())
+        if total * 1000 >= settings.MEMO_SLOW_REQUEST_MS:
+            slowest = "".join(
+                f"\n  {seconds * 1000:.1f}ms {sql}" for seconds, sql in timings.slowest_queries()
+            )
+            logger.warning("slow_request %s%s", message, slowest, extra={"timing": record})
+        else:
+            logger.info("request %s", message, extra={"timing": record})
+        return response
+
+
+class MetricsMiddleware:
+    """URL名ごとの処理時間、1リクエストのクエリ数・SQLの時間を /metrics のヒストグラムに記録する
+
+    MEMO_METRICS=False のときはミドルウェアごと使わない。SQLは ServerTimingMiddleware と同じく計測する。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.MEMO_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_query_recorder()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        # ServerTimingMiddlewareで計測中ならそのクエリ数を使う
+        token = start_timings() if current_timings() is None else None
+        timings = current_timings()
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                stop_timings(token)
+        self.record(request, response, timings, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        token = start_timings() if current_timings() is None else None
+        timings = current_timings()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                stop_timings(token)
+        self.record(request, response, timings, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, timings, total):
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+        metrics.inc("memo_http_requests_total", view=view, method=request.method, status=response.status_code)
+        metrics.observe("memo_http_request_duration_seconds", total, view=view)
+        metrics.observe("memo_db_queries_per_request", timings.query_count, view=view)
+        metrics.observe("memo_db_query_seconds_per_request", timings.query_time, view=view)
+        metrics.flush()
+
+
+class ReplicaMiddleware:
+    """read_from_replica = True のビューへのGET/HEADのリクエストをレプリカから読む(memo.routers)
+
+    書き込んだリクエストのあとは、そのユーザーをしばらくプライマリから読むようにする。
+    MEMO_REPLICAS が空のときはミドルウェアごと使わない。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.MEMO_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = routers.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            state = routers.end_request(token)
+        if state.wrote and request.user.is_authenticated:
+            routers.pin_to_primary(request.user.pk, response)
+        return response
+
+    async def __acall__(self, request):
+        token = routers.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = routers.end_request(token)
+        if state.wrote:
+            user = await request.auser()
+            if user.is_authenticated:
+                routers.pin_to_primary(user.pk, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return None
+        # Djangoのクラスベースビューは view_class、DRFのビューセットは cls に元のクラスが入っている
+        view_class = getattr(view_func, "view_class", None) or getattr(view_func, "cls", None)
+        if getattr(view_class, "read_from_replica", False):
+            user = request.user
+            if not (user.is_authenticated and routers.is_pinned(user.pk, request)):
+                routers.current_state().replica = True
+        return None
+
+
+class ShardMiddleware:
+    """シャードを移動中のユーザーのメモへの書き込み(ShardMoving)を503にする
+
+    移動はすぐに終わるので、クライアントには Retry-After の秒数のあとに送り直してもらう。
+    MEMO_SHARDS が空のときはミドルウェアごと使わない。
+    """
+    sync_capable = True
+    async_capable = True
+    retry_after = 5
+
+    def __init__(self, get_response):
+        if not settings.MEMO_SHARDS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, ShardMoving):
+            return None
+        response = HttpResponse("メモを移動しています。しばらくしてからもう一度お試しください。", status=503)
+        response["Retry-After"] = str(self.retry_after)
+        return response
+
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe_slugs(apps, schema_editor):
+    """同時に作成されて同じslugになったメモは、pkが最も小さいメモ以外に空いている番号をつける"""
+    Memo = apps.get_model("memo", "Memo")
+    duplicates = (
+        Memo.objects.exclude(slug="").values("user_id", "slug").annotate(count=Count("pk")).filter(count__gt=1)
+        .order_by("user_id", "slug")
+    )
+    used = {}
+    for row in duplicates.iterator():
+        user_id, base_slug = row["user_id"], row["slug"]
+        if user_id not in used:
+            used[user_id] = set(Memo.objects.filter(user_id=user_id).values_list("slug", flat=True))
+        taken = used[user_id]
+        pks = Memo.objects.filter(user_id=user_id, slug=base_slug).order_by("pk").values_list("pk", flat=True)
+        i = 1
+        for pk in list(pks)[1:]:
+            while f"{base_slug}-{i}" in taken:
+                i += 1
+            slug = f"{base_slug}-{i}"
+            taken.add(slug)
+            Memo.objects.filter(pk=pk).update(slug=slug)
+
+
+def fill_empty_slugs(apps, schema_editor):
+    """ユニーク制約を追加する前に、slugが空のメモに重複しないslugを割り当てる"""
+    from memo.models import generate_slug
+
+    Memo = apps.get_model("memo", "Memo")
+    empty = Memo.objects.filter(slug="").order_by("user_id", "pk")
+    used = {}
+    for memo in empty.iterator():
+        if memo.user_id not in used:
+            used[memo.user_id] = set(
+                Memo.objects.filter(user_id=memo.user_id).exclude(slug="").values_list("slug", flat=True)
+            )
+        taken = used[memo.user_id]
+        base_slug = generate_slug(memo.title, memo.user_id)
+        slug = base_slug
+        i = 1
+        while slug in taken:
+            slug = f"{base_slug}-{i}"
+            i += 1
+        taken.add(slug)
+        Memo.objects.filter(pk=memo.pk).update(slug=slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memo', '0002_memo_slug_alter_memo_category_alter_memo_priority'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_slugs, migrations.RunPython.noop),
+        migrations.RunPython(fill_empty_slugs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='memo',
+            constraint=models.UniqueConstraint(fields=('user', 'slug'), name='memo_unique_user_slug'),
+        ),
+    ]
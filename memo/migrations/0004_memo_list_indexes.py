@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memo', '0003_memo_unique_user_slug'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='memo',
+            index=models.Index(fields=['user', '-priority', '-updated_at', '-created_at'], name='memo_user_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memo',
+            index=models.Index(fields=['user', 'category', '-priority', '-updated_at', '-created_at'], name='memo_user_category_order_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memo', '0004_memo_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='memo',
+            name='memo_user_order_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='memo',
+            name='memo_user_category_order_idx',
+        ),
+        migrations.AddIndex(
+            model_name='memo',
+            index=models.Index(fields=['user', '-priority', '-updated_at', '-created_at', '-id'], name='memo_user_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memo',
+            index=models.Index(fields=['user', 'category', '-priority', '-updated_at', '-created_at', '-id'], name='memo_user_category_order_idx'),
+        ),
+    ]
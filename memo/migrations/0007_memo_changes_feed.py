@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memo', '0006_memo_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemoTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('memo_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='削除日時')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='memo',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='memo_user_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='memotombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='memotombstone',
+            index=models.Index(fields=['user', 'deleted_at', 'memo_id'], name='memo_tombstone_user_idx'),
+        ),
+    ]
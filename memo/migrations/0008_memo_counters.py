@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_memos(apps, schema_editor):
+    """既存のメモの件数を数えて入れる"""
+    Memo = apps.get_model("memo", "Memo")
+    MemoCounter = apps.get_model("memo", "MemoCounter")
+    db = schema_editor.connection.alias
+    rows = Memo.objects.using(db).values("user_id", "category", "priority").annotate(count=Count("pk")).order_by()
+    MemoCounter.objects.using(db).bulk_create([MemoCounter(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memo', '0007_memo_changes_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemoCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=20)),
+                ('priority', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'category', 'priority'), name='memo_counter_unique')],
+            },
+        ),
+        migrations.RunPython(count_existing_memos, migrations.RunPython.noop),
+    ]
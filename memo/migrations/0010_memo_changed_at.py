@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:51
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_updated_at(apps, schema_editor):
+    """これまでの変更の取得の位置(updated_at)がそのまま使えるように、変更日時を更新日時にする"""
+    Memo = apps.get_model("memo", "Memo")
+    Memo.objects.using(schema_editor.connection.alias).update(changed_at=F("updated_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memo', '0009_user_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='memo',
+            name='memo_user_updated_idx',
+        ),
+        migrations.AddField(
+            model_name='memo',
+            name='changed_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='変更日時'),
+        ),
+        migrations.RunPython(copy_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='memo',
+            index=models.Index(fields=['user', 'changed_at', 'id'], name='memo_user_changed_idx'),
+        ),
+    ]
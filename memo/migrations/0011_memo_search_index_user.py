@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def rebuild_search_index(apps, schema_editor):
+    """SQLiteの索引のuser_idを索引する列に変えて、メモを索引し直す(PostgreSQLはそのまま)"""
+    from memo.search import SQLiteSearchBackend, build_document
+
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    Memo = apps.get_model("memo", "Memo")
+    backend = SQLiteSearchBackend()
+    memos = Memo.objects.using(schema_editor.connection.alias).order_by("pk")
+    with schema_editor.connection.cursor() as cursor:
+        backend.drop(cursor)
+        backend.create(cursor)
+        batch = []
+        for memo in memos.iterator(chunk_size=500):
+            batch.append((memo.pk, memo.user_id, build_document(memo.title, memo.content)))
+            if len(batch) >= 500:
+                backend.index(cursor, batch)
+                batch = []
+        backend.index(cursor, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memo', '0010_memo_changed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,68 @@
-import pykakasi
-from django.db import models
+import functools
+import re
+import threading
+
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Cast, Substr
 from django.utils.text import slugify
 from django.conf import settings
 
+from . import metrics
+from .timing import timer
+
+
+# 同時作成でslugが衝突したときにやり直す回数
+SLUG_RETRY_LIMIT = 5
+
+# ローマ字変換の結果を覚えておくタイトルの数(タイトルは20文字までなので数MB程度)
+ROMAJI_CACHE_SIZE = 10000
+
+_kakasi = None
+_kakasi_lock = threading.Lock()
+
+
+def get_kakasi():
+    """pykakasiの変換器を返す
+
+    importと辞書の読み込みに0.5秒以上かかるので、migrateなどslugを作らない処理では読み込まないように、
+    最初に使うときに作る。常駐するプロセスでは MEMO_KAKASI_WARMUP で起動時に読み込める(MemoConfig.ready)。
+    """
+    global _kakasi
+    if _kakasi is None:
+        with _kakasi_lock:
+            if _kakasi is None:
+                import pykakasi
+                _kakasi = pykakasi.kakasi()
+    return _kakasi
+
+
+@functools.lru_cache(maxsize=ROMAJI_CACHE_SIZE)
+def to_romaji(title):
+    """pykakasiでヘボン式のローマ字にする。変換は遅いので、よく使われるタイトルはキャッシュから返す"""
+    return "".join([item['hepburn'] for item in get_kakasi().convert(title)])
+
+
+def romaji_cache_stats():
+    """このプロセスでのローマ字変換のキャッシュのヒット数、ミス数、ヒット率"""
+    info = to_romaji.cache_info()
+    total = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / total if total else 0.0,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+    }
+
 
-kks = pykakasi.kakasi()
 def generate_slug(title, user_id):
     """日本語からローマ字を生成してslugにする関数"""
     # slugifiyはallow_unicode=False がデフォルトで日本語だと空文字をかえす
     # "テスト1"の時はslugify()だけだと1とかえしてしまうのでpykakasiでローマ字変換してslugを生成する
     try:
-        result = kks.convert(title)
-        romaji = "".join([item['hepburn'] for item in result])
+        with timer("slug"):
+            romaji = to_romaji(title)
         slug = slugify(romaji, allow_unicode=False)
         if not slug:
             raise ValueError("slugが空です")
@@ -21,6 +72,139 @@ def generate_slug(title, user_id):
     return slug
 
 
+def generate_slugs(titles, user_id):
+    """複数のタイトルをまとめてslugにする(一括作成、インポート用)。同じタイトルは1回だけ変換する"""
+    converted = {}
+    for title in titles:
+        if title not in converted:
+            converted[title] = generate_slug(title, user_id)
+    return [converted[title] for title in titles]
+
+
+# slug_usageで1回のクエリに含めるbase_slugの数
+SLUG_USAGE_BATCH_SIZE = 100
+
+
+def slug_usage(user_id, base_slugs, exclude_pk=None):
+    """base_slugごとに(そのslugが使われているか, <base_slug>-<番号>の最大の番号)を返す
+
+    重複の数に関係なく、base_slugの種類SLUG_USAGE_BATCH_SIZE個ごとに1回の集計クエリで調べる。
+    """
+    base_slugs = list(dict.fromkeys(base_slugs))
+    usage = {}
+    for start in range(0, len(base_slugs), SLUG_USAGE_BATCH_SIZE):
+        batch = base_slugs[start:start + SLUG_USAGE_BATCH_SIZE]
+        prefix = Q()
+        aggregates = {}
+        for i, base_slug in enumerate(batch):
+            prefix |= Q(slug__startswith=base_slug)
+            # bigintに収まる桁数の番号だけを対象にする
+            suffix_pattern = rf"^{re.escape(base_slug)}-[0-9]{{1,18}}$"
+            aggregates[f"taken_{i}"] = Count("pk", filter=Q(slug=base_slug))
+            aggregates[f"max_{i}"] = Max(
+                Cast(Substr("slug", len(base_slug) + 2), models.BigIntegerField()),
+                filter=Q(slug__regex=suffix_pattern),
+            )
+        qs = Memo.objects.for_user(user_id).filter(prefix)
+        if exclude_pk is not None:
+            qs = qs.exclude(pk=exclude_pk)
+        result = qs.aggregate(**aggregates)
+        for i, base_slug in enumerate(batch):
+            usage[base_slug] = (bool(result[f"taken_{i}"]), result[f"max_{i}"] or 0)
+    return usage
+
+
+def next_slug(user_id, base_slug, exclude_pk=None):
+    """base_slugが使われていれば、<base_slug>-<最大の番号+1>を返す"""
+    taken, max_suffix = slug_usage(user_id, [base_slug], exclude_pk=exclude_pk)[base_slug]
+    if not taken:
+        return base_slug
+    return f"{base_slug}-{max_suffix + 1}"
+
+
+# <base_slug>-<番号> のslug
+SLUG_SUFFIX_RE = re.compile(r"^(.+)-([0-9]{1,18})$")
+
+
+def reserve_slug(usage, slug):
+    """slugを使用済みとしてusage(slug_usageの結果の辞書)に記録する
+
+    slugが <base_slug>-<番号> で、base_slugがusageにあれば最大の番号も更新するので、
+    このあと割り当てる番号と重ならない。
+    """
+    if slug in usage:
+        usage[slug] = (True, usage[slug][1])
+    match = SLUG_SUFFIX_RE.match(slug)
+    if match and match[1] in usage:
+        taken, max_suffix = usage[match[1]]
+        usage[match[1]] = (taken, max(max_suffix, int(match[2])))
+
+
+def allocate_slugs(user_id, base_slugs, usage=None):
+    """複数のメモのslugをまとめて決める。同じbase_slugが複数あれば順に番号をつける
+
+    usageにslug_usageの結果の辞書を渡すと、DBへは辞書にないbase_slugだけを問い合わせ、
+    割り当てた結果で辞書を更新する(インポートのようにバッチをまたいで使うとき)。
+    割り当てたslugはほかのbase_slugの番号とも重ならないので、指定されたslug(base_slugがそのままslugになる)を
+    先に並べれば、指定どおりのslugになる。
+    """
+    if usage is None:
+        usage = {}
+    unknown = [base_slug for base_slug in base_slugs if base_slug not in usage]
+    if unknown:
+        usage.update(slug_usage(user_id, unknown))
+    slugs = []
+    for base_slug in base_slugs:
+        taken, max_suffix = usage[base_slug]
+        if not taken:
+            slugs.append(base_slug)
+        else:
+            max_suffix += 1
+            slugs.append(f"{base_slug}-{max_suffix}")
+            metrics.inc("memo_slug_collisions_total", reason="taken")
+        usage[base_slug] = (True, max_suffix)
+        reserve_slug(usage, slugs[-1])
+    return slugs
+
+
+class MemoQuerySet(models.QuerySet):
+    def on_shard(self, user):
+        """シャーディングしているときは、userのシャードで実行する(絞り込みはしない)"""
+        from .sharding import using_shard  # sharding は models を読み込むので、ここで読み込む
+
+        return using_shard(self, user)
+
+    def for_user(self, user):
+        """userのメモ。シャーディングしているときはユーザーのシャードから読む"""
+        return self.on_shard(user).filter(user=user)
+
+    def create(self, **kwargs):
+        if self._db is None:
+            # DBを指定していなければ、routerがユーザーのシャードを選べるようにメモを渡して保存する
+            obj = self.model(**kwargs)
+            obj.save(force_insert=True)
+            return obj
+        return super().create(**kwargs)
+
+    def in_category(self, category):
+        """categoryが空のときは絞り込まない"""
+        if category:
+            return self.filter(category=category)
+        return self
+
+    def ordered(self):
+        return self.order_by(*Memo.LIST_ORDERING)
+
+    def with_content_preview(self, length=None):
+        """内容は読まずに、DBで切り出した先頭だけを content_preview として取得する
+
+        一覧では内容の先頭しか表示しないので、長い内容のメモがあっても転送量が増えない。
+        truncatecharsで省略記号を付けられるように1文字多く取得する。
+        """
+        length = length or Memo.CONTENT_PREVIEW_LENGTH
+        return self.defer("content").annotate(content_preview=Substr("content", 1, length + 1))
+
+
 class Memo(models.Model):
     CATEGORY = [
         ("work", "仕事"),
@@ -35,32 +219,169 @@ class Memo(models.Model):
         (2, "中"),
         (3, "高"),
     ]
+
+    # 重要度、更新日時（降順）、作成日時（降順）の順に表示する。idは同じ日時のときの順序を固定するため
+    LIST_ORDERING = ("-priority", "-updated_at", "-created_at", "-id")
+    # 一覧に表示する内容の文字数
+    CONTENT_PREVIEW_LENGTH = 50
     
     title = models.CharField(verbose_name="タイトル", max_length=20,)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # シャーディングではメモとユーザーが別のDBになるので、外部キーの制約は作らない
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False)
     priority = models.IntegerField(verbose_name="重要度", choices=PRIORITY_CHOICES, default=2)
     category = models.CharField(verbose_name="カテゴリー", choices=CATEGORY, default="personal", max_length=20)
     content = models.TextField(verbose_name="メモ内容")
     created_at = models.DateTimeField(verbose_name="作成日時", auto_now_add=True)
     updated_at = models.DateTimeField(verbose_name="更新日時", auto_now=True)
+    # 変更の取得(/api/memo/changes/)の位置。インポートなどで更新日時を引き継いでも、書き込んだ日時になる
+    changed_at = models.DateTimeField(verbose_name="変更日時", auto_now=True)
     slug = models.SlugField(verbose_name="URL用文字列", max_length=255, blank=True)
     # slugを導入
-    # saveで重複を避けるようにするのでunique=True,unique_togetherは使わない。
+    # slugはsaveで自動生成する。同時作成での重複はDBの(user, slug)のユニーク制約で防ぐ
+
+    objects = MemoQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # (user, slug)での検索はこのユニーク制約のインデックスが使われる
+            models.UniqueConstraint(fields=["user", "slug"], name="memo_unique_user_slug"),
+        ]
+        indexes = [
+            # 一覧表示、APIの並び順に合わせたインデックス。ソートなしで先頭から読める
+            models.Index(
+                fields=["user", "-priority", "-updated_at", "-created_at", "-id"],
+                name="memo_user_order_idx",
+            ),
+            models.Index(
+                fields=["user", "category", "-priority", "-updated_at", "-created_at", "-id"],
+                name="memo_user_category_order_idx",
+            ),
+            # 変更の取得(/api/memo/changes/)用。(changed_at, id)の順に前回の位置から読める
+            models.Index(fields=["user", "changed_at", "id"], name="memo_user_changed_idx"),
+        ]
+
     def __str__(self):
         return self.title
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded()
+        # カテゴリー・重要度を変更して保存したときに、件数(MemoCounter)の移動元がわかるように残す
+        instance._counter_key = (instance.__dict__.get("category"), instance.__dict__.get("priority"))
+        return instance
+
+    def _remember_loaded(self):
+        """読み込んだ(保存した)ときの値を残す。遅延読み込みで読んでいない列は含めない"""
+        self._loaded_values = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields if field.attname in self.__dict__
+        }
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # 遅延読み込みした列も、読み込んだときの値として残す
+        loaded = getattr(self, "_loaded_values", {})
+        for field in self._meta.concrete_fields:
+            if (fields is None or field.name in fields or field.attname in fields) and field.attname in self.__dict__:
+                loaded[field.attname] = self.__dict__[field.attname]
+        self._loaded_values = loaded
+
+    def changed_fields(self):
+        """読み込んだときから変更した列の名前の集合。読み込んだときの値がわからなければNone"""
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is None:
+            return None
+        changed = set()
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if field.attname not in loaded or loaded[field.attname] != self.__dict__[field.attname]:
+                changed.add(field.name)
+        return changed
+
     def save(self, *args, **kwargs):
-        """titleからslugを生成。重複した場合は数字で対応"""
-        if not self.slug:
-            base_slug = generate_slug(self.title, self.user.id)
-            slug = base_slug
-            i = 1        
-            # titleが重複したときは数字を足してslugを生成する
-            while Memo.objects.filter(
-                user=self.user,
-                slug=slug
-                ).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{i}"
-                i += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
\ No newline at end of file
+        """titleからslugを生成。重複した場合は数字で対応
+
+        読み込んだメモは変更した列と更新日時だけをUPDATEし、何も変更していなければ書き込まない。
+        """
+        if not (self._state.adding or args or kwargs.get("force_insert") or kwargs.get("update_fields") is not None):
+            changed = self.changed_fields()
+            if changed is not None:
+                if not changed:
+                    metrics.inc("memo_saves_skipped_total")
+                    return
+                if not self.slug:
+                    changed.add("slug")
+                kwargs["update_fields"] = changed | {"updated_at", "changed_at"}
+        self._save_with_slug(*args, **kwargs)
+        self._remember_loaded()
+
+    def _save_with_slug(self, *args, **kwargs):
+        if self.slug:
+            return super().save(*args, **kwargs)
+        base_slug = generate_slug(self.title, self.user.id)
+        for attempt in range(SLUG_RETRY_LIMIT):
+            # titleが重複したときは既存の最大の番号+1をslugにする
+            self.slug = next_slug(self.user.id, base_slug, exclude_pk=self.pk)
+            if self.slug != base_slug:
+                metrics.inc("memo_slug_collisions_total", reason="taken")
+            try:
+                # 失敗してもトランザクション全体が壊れないようにsavepointを切る
+                with transaction.atomic(using=kwargs.get("using") or router.db_for_write(Memo, instance=self)):
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # 同時に同じslugが保存されたときは番号を取り直す
+                metrics.inc("memo_slug_collisions_total", reason="race")
+                self.slug = ""
+                if attempt == SLUG_RETRY_LIMIT - 1:
+                    raise
+
+
+class MemoTombstone(models.Model):
+    """削除したメモの記録。変更の取得(/api/memo/changes/)で削除を伝えるために残す"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False)
+    memo_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(verbose_name="削除日時", auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "deleted_at", "memo_id"], name="memo_tombstone_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.memo_id} ({self.deleted_at})"
+
+
+class MemoCounter(models.Model):
+    """ユーザーごと、カテゴリーと重要度の組み合わせごとのメモの件数
+
+    一覧の絞り込みやAPIで件数を表示するたびにGROUP BYしないように、メモの作成・変更・削除のたびに増減する
+    (memo.stats)。ずれたときは reconcile_memo_counters コマンドで数え直す。
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False)
+    category = models.CharField(max_length=20)
+    priority = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "category", "priority"], name="memo_counter_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.category}/{self.priority}: {self.count}"
+
+
+class UserShard(models.Model):
+    """ユーザーのメモを保存しているシャード(MEMO_SHARDS のDB)。default のDBに保存する
+
+    記録のないユーザーは default。moving のあいだは移動中なので、そのユーザーのメモには書き込めない。
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    alias = models.CharField(max_length=100)
+    moving = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.alias}"
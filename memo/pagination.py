@@ -0,0 +1,178 @@
+import base64
+import binascii
+import json
+
+from django.db import models
+from django.db.models import F, Func, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from django.utils.dateparse import parse_datetime
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import Memo
+
+
+# Memo.LIST_ORDERING と同じ並びのキー。すべて降順
+KEYSET_FIELDS = ("priority", "updated_at", "created_at", "id")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(memo, reverse=False):
+    """memoの位置を不透明なトークンにする。reverse=Trueなら前のページ用"""
+    position = [
+        memo.priority,
+        memo.updated_at.isoformat(),
+        memo.created_at.isoformat(),
+        memo.pk,
+    ]
+    data = json.dumps({"p": position, "r": int(reverse)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """トークンから(位置, reverse)を取り出す。不正なトークンはInvalidCursor"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        priority, updated_at, created_at, pk = data["p"]
+        position = (int(priority), parse_datetime(updated_at), parse_datetime(created_at), int(pk))
+        reverse = bool(data["r"])
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
+        raise InvalidCursor(token)
+    if position[1] is None or position[2] is None:
+        raise InvalidCursor(token)
+    return position, reverse
+
+
+def _row(*expressions):
+    return Func(*expressions, function="", output_field=models.Field())
+
+
+def keyset_filter(position, reverse=False):
+    """並び順でpositionより後ろ(reverse=Trueなら前)の行を絞る条件
+
+    (priority, updated_at, created_at, id) < (...) の行値比較にするので、
+    一覧用のインデックスをpositionから読み始められる。
+    """
+    lhs = _row(*[F(name) for name in KEYSET_FIELDS])
+    rhs = _row(*[
+        Value(value, output_field=Memo._meta.get_field(name))
+        for name, value in zip(KEYSET_FIELDS, position)
+    ])
+    # 降順なので「後ろ」は小さい方
+    return GreaterThan(lhs, rhs) if reverse else LessThan(lhs, rhs)
+
+
+class KeysetPage:
+    """カーソルで取得した1ページ分。ListViewのpage_objとして使える"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<KeysetPage ({len(self)} items)>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate_keyset(queryset, cursor, page_size, orphans=0):
+    """COUNTやOFFSETを使わずにcursorの位置から1ページ分を取得する
+
+    不正なcursorや、該当する行がないcursorのときは1ページ目を返す。
+    orphansはPaginatorと同じで、残りがorphans件以下なら今のページに含める。
+    """
+    position, reverse = None, False
+    if cursor:
+        try:
+            position, reverse = decode_cursor(cursor)
+        except InvalidCursor:
+            pass
+    queryset = queryset.order_by(*Memo.LIST_ORDERING)
+    if position is None:
+        rows = list(queryset[:page_size + orphans + 1])
+    elif reverse:
+        rows = list(queryset.filter(keyset_filter(position, reverse=True)).reverse()[:page_size + 1])
+    else:
+        rows = list(queryset.filter(keyset_filter(position))[:page_size + orphans + 1])
+    if position is not None and not rows:
+        return paginate_keyset(queryset, None, page_size, orphans)
+
+    if reverse:
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        has_next = True
+    else:
+        has_previous = position is not None
+        has_next = len(rows) > page_size + orphans
+        if has_next:
+            rows = rows[:page_size]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1]) if has_next else None,
+        previous_cursor=encode_cursor(rows[0], reverse=True) if has_previous else None,
+    )
+
+
+class MemoCursorPagination(BasePagination):
+    """/api/memo/ 用のカーソルページネーション。並び順は Memo.LIST_ORDERING に固定"""
+    cursor_query_param = "cursor"
+    page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page = paginate_keyset(queryset, request.query_params.get(self.cursor_query_param), self.page_size)
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def _link(self, cursor):
+        url = self.request.build_absolute_uri()
+        if cursor is None:
+            return None
+        return replace_query_param(remove_query_param(url, "page"), self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
@@ -0,0 +1,33 @@
+"""PostgreSQLのコネクションプール(DB_POOL=True)の状態"""
+from django.db import connections
+
+
+def pool_stats():
+    """プールを使っているDBごとの {alias: 状態}。値はこのプロセスのプールのもの
+
+    wait_seconds, requests, connection_errors, connections_lost はプールを作ってからの累計。
+    """
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        if not connection.settings_dict.get("OPTIONS", {}).get("pool"):
+            continue
+        pool = connection.pool
+        if pool is None:
+            continue
+        raw = pool.get_stats()
+        size, idle = raw.get("pool_size", 0), raw.get("pool_available", 0)
+        stats[alias] = {
+            "min_size": raw.get("pool_min", 0),
+            "max_size": raw.get("pool_max", 0),
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "waiting": raw.get("requests_waiting", 0),
+            "requests": raw.get("requests_num", 0),
+            "wait_seconds": raw.get("requests_wait_ms", 0) / 1000,
+            # 取り出すときの確認で切れていた接続と、接続に失敗した回数
+            "connections_lost": raw.get("connections_lost", 0) + raw.get("returns_bad", 0),
+            "connection_errors": raw.get("connections_errors", 0),
+        }
+    return stats
@@ -0,0 +1,134 @@
+"""読み取り用のレプリカへの振り分け
+
+ReplicaMiddleware が read_from_replica = True のビューへのGET/HEADのリクエストだけをレプリカに向け、
+ReplicaRouter がそのリクエスト中のmemoアプリのモデルの読み込みをレプリカに振り分ける。
+セッションやユーザーは常にプライマリから読む(ログイン直後にレプリカに届いていないことがあるため)。
+
+書き込んだユーザーは MEMO_REPLICA_STICKY_SECONDS 秒の間プライマリから読むので、自分の変更が反映されていない
+一覧が表示されることはない。この記録はキャッシュと、レスポンスの署名したクッキーに保存する。次のリクエストが
+別のワーカーに届いても、共有のキャッシュ(CACHE_SHARED)がなければクッキーで分かる。クッキーを送らない
+トークンのクライアントは、共有のキャッシュがなければレプリカから読まない(MemoViewSet.initial)。
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+PIN_KEY = "memo:primary:{user_id}"
+PIN_COOKIE = "memo_primary"
+ROUTED_APP_LABELS = {"memo"}
+# シャーディングでも default に保存するmemoアプリのモデル
+UNSHARDED_MODELS = {"memo.usershard"}
+
+_state = ContextVar("memo_db_request_state", default=None)
+
+
+class RequestState:
+    """replica: このリクエストの読み込みをレプリカに向けるか、wrote: このリクエストで書き込んだか"""
+    __slots__ = ("replica", "wrote")
+
+    def __init__(self):
+        self.replica = False
+        self.wrote = False
+
+
+def start_request():
+    return _state.set(RequestState())
+
+
+def end_request(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def current_state():
+    return _state.get()
+
+
+def pin_to_primary(user_id, response=None):
+    """user_idの読み込みをしばらくプライマリに向ける。responseがあればクッキーにも記録する"""
+    seconds = settings.MEMO_REPLICA_STICKY_SECONDS
+    cache.set(PIN_KEY.format(user_id=user_id), True, timeout=seconds)
+    if response is not None:
+        response.set_signed_cookie(
+            PIN_COOKIE, str(user_id), salt=PIN_COOKIE, max_age=seconds, httponly=True, samesite="Lax"
+        )
+
+
+def is_pinned(user_id, request=None):
+    """requestがあれば、pin_to_primaryのクッキーも見る"""
+    if cache.get(PIN_KEY.format(user_id=user_id)):
+        return True
+    if request is None:
+        return False
+    value = request.get_signed_cookie(
+        PIN_COOKIE, default=None, salt=PIN_COOKIE, max_age=settings.MEMO_REPLICA_STICKY_SECONDS
+    )
+    return value == str(user_id)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APP_LABELS:
+            return None
+        state = _state.get()
+        if state is None or not state.replica or state.wrote or not settings.MEMO_REPLICAS:
+            return None
+        return random.choice(settings.MEMO_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label in ROUTED_APP_LABELS:
+            # 同じリクエストのこのあとの読み込みと、しばらくの間のこのユーザーの読み込みはプライマリから
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカはプライマリの複製なので、どのDBのオブジェクトどうしでも関連づけられる
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.MEMO_REPLICAS:
+            return False
+        return None
+
+
+class ShardRouter:
+    """シャーディング(memo.sharding)での振り分け
+
+    memoアプリのモデルは、保存・削除するオブジェクトのユーザーのシャードに書き込む。読み込みは
+    Memo.objects.for_user() がシャードを指定する。ほかのアプリのモデル(ユーザー、セッションなど)は default。
+    """
+    def _shard(self, model, hints, write):
+        from .sharding import shard_for, shard_for_write
+
+        instance = hints.get("instance")
+        if instance is None:
+            return None
+        # メモの保存ではメモのユーザー、user.memo_set などではそのユーザー
+        user_id = instance.pk if isinstance(instance, get_user_model()) else getattr(instance, "user_id", None)
+        if user_id is None:
+            return None
+        return shard_for_write(user_id) if write else shard_for(user_id)
+
+    def _sharded(self, model):
+        return model._meta.app_label in ROUTED_APP_LABELS and model._meta.label_lower not in UNSHARDED_MODELS
+
+    def db_for_read(self, model, **hints):
+        if not self._sharded(model):
+            return DEFAULT_DB_ALIAS
+        return self._shard(model, hints, write=False)
+
+    def db_for_write(self, model, **hints):
+        if not self._sharded(model):
+            return DEFAULT_DB_ALIAS
+        return self._shard(model, hints, write=True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # メモ(シャード)とユーザー(default)を関連づけられるようにする
+        return True
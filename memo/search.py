@@ -0,0 +1,262 @@
+"""メモのタイトルと内容の全文検索
+
+SQLiteではFTS5、PostgreSQLではtsvectorとGINインデックスを使う。
+日本語は空白で単語に分かれないので、かな・漢字の並びは2文字ずつ(2-gram)に分けて索引する。
+元の文字列に加えてpykakasiの読み(ひらがな、ローマ字)も索引するので、
+「会議」「かいぎ」「kaigi」のどれでも同じメモが見つかる。
+"""
+import re
+import unicodedata
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Memo, get_kakasi
+
+
+# 読みの変換は遅いので、内容は先頭のこの文字数だけ読みを索引する(元の文字列はすべて索引する)
+READING_CONTENT_LIMIT = 1000
+# 1回の検索で返す最大件数
+SEARCH_RESULT_LIMIT = 1000
+# SQLiteで1回のDELETEで索引から削除する件数
+REMOVE_BATCH_SIZE = 500
+
+TABLE = "memo_memosearch"
+
+_WORD_RE = re.compile(r"[0-9a-z]+|[ぁ-ゟ㐀-䶿一-鿿豈-﫿々〆ー]+")
+_ASCII_RE = re.compile(r"[0-9a-z]+")
+
+
+def normalize(text):
+    """全角英数を半角に、大文字を小文字に、カタカナをひらがなにそろえる"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+
+def _tokens(text):
+    """英数字は単語のまま、かな・漢字は2-gramにして返す
+
+    1文字の検索語は前方一致で探すので、かな・漢字の並びの最後の1文字も加える。
+    """
+    for word in _WORD_RE.findall(normalize(text)):
+        if _ASCII_RE.fullmatch(word) or len(word) == 1:
+            yield word
+        else:
+            for i in range(len(word) - 1):
+                yield word[i:i + 2]
+            yield word[-1]
+
+
+def readings(text):
+    """pykakasiでひらがなとローマ字の読みを返す"""
+    items = get_kakasi().convert(text)
+    hira = " ".join(item["hira"] for item in items)
+    romaji = " ".join(item["hepburn"] for item in items)
+    return hira, romaji
+
+
+def build_document(title, content):
+    """索引する文字列。トークンを空白区切りで並べる"""
+    parts = [title, content]
+    parts.extend(readings(title))
+    parts.extend(readings(content[:READING_CONTENT_LIMIT]))
+    return " ".join(token for part in parts for token in _tokens(part))
+
+
+def _query_terms(query):
+    """検索語を (種類, トークン) のリストにする
+
+    "prefix": 英数字の単語や1文字の漢字。前方一致で検索する
+    "phrase": 2文字以上のかな・漢字。2-gramが連続しているものを検索する
+    """
+    terms = []
+    for word in _WORD_RE.findall(normalize(query)):
+        if _ASCII_RE.fullmatch(word) or len(word) == 1:
+            terms.append(("prefix", [word]))
+        else:
+            terms.append(("phrase", [word[i:i + 2] for i in range(len(word) - 1)]))
+    return terms
+
+
+class SQLiteSearchBackend:
+    """FTS5の仮想テーブル。rowidをメモのidにする
+
+    user_idも索引して MATCH の中で絞り込むので、ほかのユーザーのメモは照合も順位づけもしない。
+    """
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} "
+            "USING fts5(document, user_id, tokenize='unicode61 remove_diacritics 0')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def index(self, cursor, rows):
+        rows = list(rows)
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(pk,) for pk, _, _ in rows])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, user_id, document) VALUES (%s, %s, %s)", rows
+        )
+
+    def remove(self, cursor, ids):
+        # SQLiteのパラメータの数の上限を超えないように分けて削除する
+        ids = list(ids)
+        for start in range(0, len(ids), REMOVE_BATCH_SIZE):
+            batch = ids[start:start + REMOVE_BATCH_SIZE]
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join(['%s'] * len(batch))})", batch)
+
+    def match_expression(self, user_id, terms):
+        parts = []
+        for kind, tokens in terms:
+            phrase = '"' + " ".join(tokens) + '"'
+            parts.append(phrase + "*" if kind == "prefix" else phrase)
+        return f'user_id:"{int(user_id)}" AND document:(' + " AND ".join(parts) + ")"
+
+    def search(self, cursor, user_id, terms, limit, offset=0):
+        cursor.execute(
+            f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY rank, rowid DESC LIMIT %s OFFSET %s",
+            [self.match_expression(user_id, terms), limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgreSQLSearchBackend:
+    """tsvectorの列にGINインデックスを張ったテーブル。辞書は語幹処理をしない'simple'を使う"""
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+            " memo_id bigint PRIMARY KEY REFERENCES memo_memo (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,"
+            " user_id bigint NOT NULL,"
+            " document tsvector NOT NULL)"
+        )
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING gin (document)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_user_idx ON {TABLE} (user_id)")
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def index(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (memo_id, user_id, document) VALUES (%s, %s, to_tsvector('simple', %s)) "
+            "ON CONFLICT (memo_id) DO UPDATE SET user_id = EXCLUDED.user_id, document = EXCLUDED.document",
+            list(rows),
+        )
+
+    def remove(self, cursor, ids):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE memo_id = ANY(%s)", [list(ids)])
+
+    def tsquery(self, terms):
+        # トークンは英数字かかな・漢字だけなので、そのまま引用符で囲める
+        parts = []
+        for kind, tokens in terms:
+            if kind == "prefix":
+                parts.append(f"'{tokens[0]}':*")
+            else:
+                parts.append("(" + " <-> ".join(f"'{token}'" for token in tokens) + ")")
+        return " & ".join(parts)
+
+    def search(self, cursor, user_id, terms, limit, offset=0):
+        cursor.execute(
+            f"SELECT memo_id FROM {TABLE}, to_tsquery('simple', %s) query "
+            "WHERE user_id = %s AND document @@ query "
+            "ORDER BY ts_rank(document, query) DESC, memo_id DESC LIMIT %s OFFSET %s",
+            [self.tsquery(terms), user_id, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgreSQLSearchBackend,
+}
+
+
+def get_backend(connection):
+    """対応していないDBのときはNone(icontainsで検索する)"""
+    backend_class = BACKENDS.get(connection.vendor)
+    return backend_class() if backend_class else None
+
+
+def index_memos(memos, using=None):
+    """メモを索引に追加、または更新する"""
+    memos = list(memos)
+    if not memos:
+        return
+    connection = connections[using or router.db_for_write(Memo, instance=memos[0])]
+    backend = get_backend(connection)
+    if backend is None:
+        return
+    rows = [(memo.pk, memo.user_id, build_document(memo.title, memo.content)) for memo in memos]
+    with connection.cursor() as cursor:
+        backend.index(cursor, rows)
+
+
+def remove_memos(ids, using=None):
+    ids = list(ids)
+    if not ids:
+        return
+    connection = connections[using or router.db_for_write(Memo)]
+    backend = get_backend(connection)
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.remove(cursor, ids)
+
+
+class SearchResults:
+    """関連度順のidを持ち、スライスしたときにその範囲のメモだけを取得する
+
+    PaginatorやDRFのページネーションにそのまま渡せる。
+    """
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            ids = self.ids[index]
+            memos = self.queryset.in_bulk(ids)
+            return [memos[pk] for pk in ids if pk in memos]
+        return self[index:index + 1][0]
+
+
+def search_memos(queryset, user, query, limit=SEARCH_RESULT_LIMIT):
+    """querysetの中からqueryに一致するメモを関連度の高い順にlimit件まで返す
+
+    索引はユーザーで絞り込むだけなので、カテゴリなどquerysetの条件はlimit件ずつ読んだ結果に適用し、
+    limit件に足りなければ続きを読む。
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return SearchResults(queryset, [])
+    connection = connections[queryset.db]
+    backend = get_backend(connection)
+    if backend is None:
+        # 索引がないDBでは部分一致で検索する
+        qs = queryset
+        for word in query.split():
+            qs = qs.filter(Q(title__icontains=word) | Q(content__icontains=word))
+        return SearchResults(queryset, list(qs.ordered().values_list("pk", flat=True)[:limit]))
+    ids = []
+    offset = 0
+    while len(ids) < limit:
+        with connection.cursor() as cursor:
+            found = backend.search(cursor, user.pk, terms, limit, offset)
+        if found:
+            # querysetの条件で絞り込む(idだけなのでメモ本体は読まない)
+            allowed = set(queryset.filter(pk__in=found).values_list("pk", flat=True))
+            ids.extend(pk for pk in found if pk in allowed)
+        if len(found) < limit:
+            break
+        offset += limit
+    return SearchResults(queryset, ids[:limit])
@@ -0,0 +1,114 @@
+"""計測用のデータを作る(seed_memosコマンド、benchmarks)
+
+同じseedなら同じタイトル・内容・日時のメモを作るので、計測の結果を比べられる。
+メモはユーザーごとにbulk_createでまとめて作成し、slugも一括作成と同じくメモリ上で割り当てる。
+"""
+import datetime
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Memo, allocate_slugs, generate_slugs
+from .sharding import shard_for_write
+from .signals import memos_bulk_created
+
+
+SEED_BATCH_SIZE = 1000
+SEED_PASSWORD = "password"
+
+TITLE_WORDS = [
+    "会議", "議事録", "買い物", "日報", "週報", "読書", "勉強", "旅行", "献立", "予定", "振り返り", "アイデア",
+    "TODO", "メモ", "企画", "打ち合わせ", "レシピ", "映画", "English", "Python", "Django", "Meeting", "Memo",
+]
+TITLE_SUFFIXES = ["", "", "", "メモ", "リスト", "まとめ", "案", "1", "2", "03", " draft", " notes"]
+SENTENCES = [
+    "明日の打ち合わせまでに資料を準備する。",
+    "牛乳、卵、パン、トマトを買う。",
+    "今週の進捗は予定どおり。来週はテストを進める。",
+    "図書館で借りた本を金曜日までに返す。",
+    "新しい機能のアイデアをまとめておく。",
+    "駅前のカフェで10時に待ち合わせ。",
+    "レビューで指摘された箇所を修正した。",
+    "週末は天気が良ければ公園を散歩する。",
+    "Remember to renew the domain before the end of the month.",
+    "Draft the release notes and share them with the team.",
+    "Check the slow query log after the deploy.",
+    "Book flights for the conference in October.",
+]
+
+
+def _title(rng):
+    return (rng.choice(TITLE_WORDS) + rng.choice(TITLE_SUFFIXES))[:20]
+
+
+def _content(rng):
+    # ほとんどは短く、たまに長い文書を貼り付けたメモがある
+    count = min(int(rng.lognormvariate(1.2, 1.0)) + 1, 2000)
+    return "".join(rng.choice(SENTENCES) for _ in range(count))
+
+
+def build_memos(user, count, rng, now=None):
+    """userのメモをcount件作る(保存はしない)"""
+    now = now or timezone.now()
+    memos = []
+    for _ in range(count):
+        created_at = now - datetime.timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        memos.append(Memo(
+            user=user,
+            title=_title(rng),
+            content=_content(rng),
+            category=rng.choice(Memo.CATEGORY)[0],
+            priority=rng.choice(Memo.PRIORITY_CHOICES)[0],
+            created_at=created_at,
+            updated_at=min(created_at + datetime.timedelta(seconds=rng.randrange(30 * 24 * 3600)), now),
+        ))
+    return memos
+
+
+def create_memos(user, memos, batch_size=SEED_BATCH_SIZE):
+    """build_memosで作ったメモをbatch_size件ずつ保存する"""
+    for start in range(0, len(memos), batch_size):
+        batch = memos[start:start + batch_size]
+        timestamps = [(memo.created_at, memo.updated_at) for memo in batch]
+        for memo, slug in zip(batch, allocate_slugs(user.id, generate_slugs([memo.title for memo in batch], user.id))):
+            memo.slug = slug
+        alias = shard_for_write(user)
+        with transaction.atomic(using=alias):
+            Memo.objects.using(alias).bulk_create(batch)
+            # auto_now_add, auto_nowで上書きされた日時を戻す
+            for memo, (created_at, updated_at) in zip(batch, timestamps):
+                memo.created_at, memo.updated_at = created_at, updated_at
+            Memo.objects.using(alias).bulk_update(batch, ["created_at", "updated_at"])
+            memos_bulk_created.send(sender=Memo, user=user, memos=batch)
+
+
+def seed_users(users, prefix="seed", password=SEED_PASSWORD):
+    """<prefix>0000 のような名前のユーザーを作る。すでにあればそのまま使う"""
+    User = get_user_model()
+    names = [f"{prefix}{i:04d}" for i in range(users)]
+    existing = {user.username: user for user in User.objects.filter(username__in=names)}
+    # パスワードのハッシュは遅いので1回だけ計算する
+    hashed = make_password(password)
+    result = []
+    for name in names:
+        user = existing.get(name)
+        if user is None:
+            user = User.objects.create(username=name, nickname=name, password=hashed)
+        result.append(user)
+    return result
+
+
+def seed(users, memos_per_user, seed=0, prefix="seed", password=SEED_PASSWORD,
+         batch_size=SEED_BATCH_SIZE, progress=None):
+    """users人のユーザーにmemos_per_user件ずつメモを作る。戻り値はユーザーのリスト"""
+    rng = random.Random(seed)
+    now = timezone.now()
+    seeded = seed_users(users, prefix=prefix, password=password)
+    for user in seeded:
+        create_memos(user, build_memos(user, memos_per_user, rng, now=now), batch_size=batch_size)
+        if progress:
+            progress(user)
+    return seeded
@@ -1,15 +1,63 @@
 from rest_framework import serializers
+from rest_framework.fields import empty
 from .models import Memo
+from .timing import timer
 
 
-class MemoSerializer(serializers.ModelSerializer):
+class TimedSerializerMixin:
+    """変換とバリデーションの時間をServer-Timingのserializerに加える(ServerTimingMiddleware)"""
+
+    def to_representation(self, instance):
+        with timer("serializer"):
+            return super().to_representation(instance)
+
+    def run_validation(self, data=empty):
+        with timer("serializer"):
+            return super().run_validation(data)
+
+
+class MemoSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Memo
-        fields = "__all__"
+        # changed_at は変更の取得の位置なので返さない
+        exclude = ["changed_at"]
         read_only_fields = ["user"]
+        # slugはsaveで自動生成し、(user, slug)の重複もsaveで解決するので
+        # ユニーク制約からのバリデーションは行わない(指定されたslugの重複は validate_slug で調べる)
+        validators = []
+
+    def validate_slug(self, value):
+        """指定されたslugが同じユーザーのほかのメモで使われていれば400にする。空のときはsaveで生成する"""
+        if not value:
+            return value
+        if self.instance is not None:
+            user = self.instance.user_id
+        else:
+            request = self.context.get("request")
+            user = getattr(request, "user", None)
+            if user is None:
+                return value
+        qs = Memo.objects.for_user(user).filter(slug=value)
+        if self.instance is not None:
+            qs = qs.exclude(pk=self.instance.pk)
+        if qs.exists():
+            raise serializers.ValidationError("このslugはすでに使われています")
+        return value
 
     def validate_title(self, value):
         """学習用に禁止ワードを設定 APIレスポンスは400になる"""
         if "禁止ワード" in value:
             raise serializers.ValidationError("禁止ワードが使用されています")
-        return value
\ No newline at end of file
+        return value
+
+class MemoListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """一覧用(?compact=1)。内容は先頭だけを content_preview で返す。内容すべては詳細で取得する"""
+    content_preview = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Memo
+        exclude = ["content", "changed_at"]
+
+    def get_content_preview(self, obj):
+        # with_content_preview()は省略を判定するために1文字多く取得している
+        return obj.content_preview[:Memo.CONTENT_PREVIEW_LENGTH]
@@ -0,0 +1,240 @@
+"""ユーザーごとにメモを複数のDBに分ける(シャーディング)
+
+MEMO_SHARDS(DB_SHARD_NAMES で設定する。先頭は default)が空でなければ、メモ、tombstone、件数、検索用の索引は
+ユーザーのシャードに保存する。ユーザーやセッションなどは default に保存する。
+ユーザーのシャードは UserShard に記録してキャッシュに入れる。新しいユーザーは user_id で割り当て、
+記録のないユーザー(シャーディングの前からいるユーザー)は default のまま使う。
+共有のキャッシュ(CACHE_SHARED)がなければ、移動は他のワーカーのキャッシュに届かないので、キャッシュは
+SHARD_CACHE_TIMEOUT 秒で切れるようにし、書き込みのたびに UserShard を読み直す。
+
+メモの読み込みは Memo.objects.for_user() がユーザーのシャードを指定し、保存・削除は ShardRouter(memo.routers)が
+メモのユーザーからシャードを選ぶ。メモのidはシャードごとに SHARD_ID_SPAN ずつ離れた範囲から採番するので、
+シャードをまたいで重ならず、ユーザーを移動(move_user)してもidは変わらない。
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .models import Memo, MemoCounter, MemoTombstone, UserShard
+
+
+SHARD_KEY = "memo:shard:{user_id}"
+# シャードごとのメモのidの範囲の幅。k番目のシャードは k * SHARD_ID_SPAN から採番する
+SHARD_ID_SPAN = 10 ** 12
+# 移動の最後に写し直す範囲。位置より前の日時でコミットが遅れた書き込みも写す
+MOVE_REWIND = datetime.timedelta(seconds=60)
+MOVE_BATCH_SIZE = 500
+# 共有のキャッシュがないときに、ワーカーごとのキャッシュにシャードを入れておく秒数
+SHARD_CACHE_TIMEOUT = 5
+
+
+class ShardMoving(Exception):
+    """移動中のユーザーのメモに書き込もうとした(ShardMiddleware が503にする)"""
+
+
+def is_sharded():
+    return bool(settings.MEMO_SHARDS)
+
+
+def shards():
+    """メモを保存しているすべてのDB"""
+    return settings.MEMO_SHARDS or [DEFAULT_DB_ALIAS]
+
+
+def _user_id(user):
+    return getattr(user, "pk", user)
+
+
+def _cache_timeout():
+    return None if settings.CACHE_SHARED else SHARD_CACHE_TIMEOUT
+
+
+def placement(user, fresh=False):
+    """(シャード, 移動中か)。freshならキャッシュを使わずに UserShard から読む"""
+    user_id = _user_id(user)
+    key = SHARD_KEY.format(user_id=user_id)
+    value = None if fresh else cache.get(key)
+    if value is None:
+        row = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list("alias", "moving").first()
+        value = tuple(row) if row else (DEFAULT_DB_ALIAS, False)
+        cache.set(key, value, timeout=_cache_timeout())
+    return value
+
+
+def shard_for(user):
+    """userのメモを保存しているDB。シャーディングしていなければ default"""
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    return placement(user)[0]
+
+
+def shard_for_write(user):
+    """userのメモを書き込むDB。移動中なら ShardMoving
+
+    共有のキャッシュがなければ、他のワーカーが始めた移動に気づけるように UserShard から読む。
+    """
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    alias, moving = placement(user, fresh=not settings.CACHE_SHARED)
+    if moving:
+        raise ShardMoving(_user_id(user))
+    return alias
+
+
+def using_shard(queryset, user):
+    """シャーディングしているときは、querysetをuserのシャードで実行する
+
+    シャーディングしていないときはそのまま返すので、読み込みはレプリカ(ReplicaRouter)に振り分けられる。
+    """
+    if not is_sharded():
+        return queryset
+    return queryset.using(shard_for(user))
+
+
+def assign(user, alias, moving=False):
+    user_id = _user_id(user)
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={"alias": alias, "moving": moving}
+    )
+    cache.set(SHARD_KEY.format(user_id=user_id), (alias, moving), timeout=_cache_timeout())
+
+
+def initial_shard(user):
+    return settings.MEMO_SHARDS[_user_id(user) % len(settings.MEMO_SHARDS)]
+
+
+def reserve_id_range(alias):
+    """aliasのシャードのメモのidを、ほかのシャードと重ならない範囲から採番する"""
+    index = shards().index(alias)
+    start = index * SHARD_ID_SPAN
+    if not start:
+        return
+    connection = connections[alias]
+    table = Memo._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            # AUTOINCREMENT の次の値は sqlite_sequence に記録されている
+            cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s", [start, table, start])
+            cursor.execute("SELECT 1 FROM sqlite_sequence WHERE name = %s", [table])
+            if cursor.fetchone() is None:
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start])
+        elif connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                "GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM " + connection.ops.quote_name(table) + ")))",
+                [table, start],
+            )
+
+
+def _copy_rows(memos, target):
+    """メモをidと日時を変えずにtargetに書き込む(すでにあれば置き換える)
+
+    変更日時も引き継ぐので、クライアントは移動の前の変更の取得の位置から続けられる。
+    """
+    from .search import index_memos
+
+    ids = [memo.pk for memo in memos]
+    timestamps = [(memo.created_at, memo.updated_at, memo.changed_at) for memo in memos]
+    Memo.objects.using(target).filter(pk__in=ids)._raw_delete(target)
+    Memo.objects.using(target).bulk_create(memos)
+    # auto_now_add, auto_nowで上書きされた日時を戻す
+    for memo, (created_at, updated_at, changed_at) in zip(memos, timestamps):
+        memo.created_at, memo.updated_at, memo.changed_at = created_at, updated_at, changed_at
+    Memo.objects.using(target).bulk_update(memos, ["created_at", "updated_at", "changed_at"])
+    index_memos(memos, using=target)
+
+
+def _copy_deletions(user_id, deletions, target):
+    """削除されたメモ [(削除日時, id)] をtargetからも削除し、tombstoneを写す"""
+    from .search import remove_memos
+
+    ids = [pk for _, pk in deletions]
+    Memo.objects.using(target).filter(pk__in=ids)._raw_delete(target)
+    remove_memos(ids, using=target)
+    existing = set(
+        MemoTombstone.objects.using(target).filter(user_id=user_id, memo_id__in=ids).values_list("memo_id", flat=True)
+    )
+    tombstones = MemoTombstone.objects.using(target).bulk_create([
+        MemoTombstone(user_id=user_id, memo_id=pk) for _, pk in deletions if pk not in existing
+    ])
+    deleted_at = {pk: timestamp for timestamp, pk in deletions}
+    for tombstone in tombstones:
+        tombstone.deleted_at = deleted_at[tombstone.memo_id]
+    MemoTombstone.objects.using(target).bulk_update(tombstones, ["deleted_at"])
+
+
+def _copy_changes(user, source, target, position, batch_size):
+    """sourceのpositionより後の変更をtargetに写して、最後の位置を返す"""
+    from .changes import DELETE, changes, decode_cursor
+
+    while True:
+        page = changes(user, position, page_size=batch_size, using=source)
+        with transaction.atomic(using=target):
+            _copy_rows([memo for kind, _, _, memo in page.items if kind != DELETE], target)
+            _copy_deletions(user.pk, [(ts, pk) for kind, ts, pk, _ in page.items if kind == DELETE], target)
+        if page.next_cursor is not None:
+            position = decode_cursor(page.next_cursor)
+        if not page.has_more:
+            return position
+
+
+def _recount(user, alias):
+    from .stats import count_memos
+
+    counts = count_memos(user.pk, using=alias).get(user.pk, {})
+    with transaction.atomic(using=alias):
+        MemoCounter.objects.using(alias).filter(user=user).delete()
+        MemoCounter.objects.using(alias).bulk_create([
+            MemoCounter(user_id=user.pk, category=category, priority=priority, count=count)
+            for (category, priority), count in counts.items()
+        ])
+
+
+def purge(user, alias):
+    """aliasのシャードからuserのメモ、tombstone、件数、索引を削除する(シグナルは送らない)"""
+    from .search import remove_memos
+
+    with transaction.atomic(using=alias):
+        memos = Memo.objects.using(alias).filter(user=user)
+        remove_memos(list(memos.values_list("pk", flat=True)), using=alias)
+        memos._raw_delete(alias)
+        MemoTombstone.objects.using(alias).filter(user=user)._raw_delete(alias)
+        MemoCounter.objects.using(alias).filter(user=user)._raw_delete(alias)
+
+
+def move_user(user, target, batch_size=MOVE_BATCH_SIZE, grace=1.0):
+    """userのメモをtargetのシャードに移す。移したメモの件数を返す
+
+    1. 書き込みを止めずに、変更の取得(memo.changes)と同じ順番ですべてのメモとtombstoneを写す
+    2. 移動中にして書き込みを止め、grace秒待ってから、1. の位置より少し前からの変更を写し直す
+    3. シャードを切り替えて、元のシャードから削除する
+    書き込みを止めるのは 2. のあいだだけで、読み込みはその間も元のシャードからできる。
+    共有のキャッシュがなければ、他のワーカーのキャッシュが切れるまで待ってから元のシャードから削除する。
+    """
+    from .cache import bump_version
+
+    source = shard_for(user)
+    if source == target:
+        return 0
+    try:
+        position = _copy_changes(user, source, target, None, batch_size)
+        assign(user, source, moving=True)
+        # 止める前に始まった書き込みが終わるのを待つ
+        time.sleep(grace)
+        if position is not None:
+            position = (position[0] - MOVE_REWIND, 0)
+        _copy_changes(user, source, target, position, batch_size)
+        _recount(user, target)
+    except BaseException:
+        assign(user, source)
+        purge(user, target)
+        raise
+    assign(user, target)
+    if not settings.CACHE_SHARED:
+        time.sleep(SHARD_CACHE_TIMEOUT)
+    purge(user, source)
+    bump_version(user.pk)
+    return Memo.objects.using(target).filter(user=user).count()
@@ -0,0 +1,172 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_delete
+from django.dispatch import receiver, Signal
+
+from .models import Memo, MemoTombstone
+from . import cache, metrics, search, sharding, stats
+
+
+# bulk_create, bulk_updateではpost_saveが送られないので、一括処理のあとにこれらを送る
+# memos_bulk_created: user, memos
+# memos_bulk_updated: user, memos, fields(更新した列), previous({pk: {列: 更新前の値}})
+# memos_bulk_deleted: user, memos(id、カテゴリー、重要度だけを読んだメモ), using
+# 一括削除はpost_deleteを1件ずつ送らずに、まとめて削除してからmemos_bulk_deletedを送る
+memos_bulk_created = Signal()
+memos_bulk_updated = Signal()
+memos_bulk_deleted = Signal()
+
+
+@receiver(post_save, sender=Memo)
+def index_saved_memo(sender, instance, raw=False, update_fields=None, **kwargs):
+    """保存したメモの検索用の索引を更新する"""
+    if raw:
+        return
+    if update_fields is not None and not {"title", "content"} & set(update_fields):
+        return
+    search.index_memos([instance])
+
+
+@receiver(post_delete, sender=Memo)
+def remove_deleted_memo(sender, instance, using, **kwargs):
+    search.remove_memos([instance.pk], using=using)
+
+
+@receiver(memos_bulk_deleted, sender=Memo)
+def remove_bulk_deleted_memos(sender, memos, using, **kwargs):
+    search.remove_memos([memo.pk for memo in memos], using=using)
+
+
+def _deleted_as_memo(origin):
+    """メモ自体を削除したときはTrue。ユーザーを削除してメモも削除されたときはFalse"""
+    return isinstance(origin, Memo) or getattr(origin, "model", None) is Memo
+
+
+@receiver(post_delete, sender=Memo)
+def record_tombstone(sender, instance, using, origin=None, **kwargs):
+    """変更の取得で削除を返すために記録する。ユーザーごと削除したときは記録しない"""
+    if _deleted_as_memo(origin):
+        MemoTombstone.objects.using(using).create(user_id=instance.user_id, memo_id=instance.pk)
+
+
+@receiver(memos_bulk_deleted, sender=Memo)
+def record_bulk_tombstones(sender, user, memos, using, **kwargs):
+    MemoTombstone.objects.using(using).bulk_create([MemoTombstone(user_id=user.pk, memo_id=memo.pk) for memo in memos])
+
+
+@receiver(memos_bulk_created, sender=Memo)
+def index_bulk_created_memos(sender, memos, **kwargs):
+    search.index_memos(memos)
+
+
+@receiver(memos_bulk_updated, sender=Memo)
+def index_bulk_updated_memos(sender, memos, fields, **kwargs):
+    if {"title", "content"} & set(fields):
+        search.index_memos(memos)
+
+
+@receiver(post_save, sender=Memo)
+@receiver(post_delete, sender=Memo)
+def invalidate_memo_list(sender, instance, raw=False, **kwargs):
+    """そのユーザーのメモ一覧のキャッシュを無効にする"""
+    if not raw:
+        cache.bump_version(instance.user_id)
+
+
+@receiver(memos_bulk_created, sender=Memo)
+@receiver(memos_bulk_updated, sender=Memo)
+@receiver(memos_bulk_deleted, sender=Memo)
+def invalidate_bulk_memo_list(sender, user, **kwargs):
+    cache.bump_version(user.pk)
+
+
+@receiver(post_save, sender=Memo)
+def count_created_memo(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        metrics.inc("memo_memos_created_total")
+
+
+@receiver(memos_bulk_created, sender=Memo)
+def count_bulk_created_memos(sender, memos, **kwargs):
+    metrics.inc("memo_memos_created_total", len(memos))
+
+
+@receiver(post_save, sender=Memo)
+def update_saved_memo_counters(sender, instance, created, using, raw=False, **kwargs):
+    """カテゴリー・重要度別の件数を増減する。読み込んだときの値がわからないメモの変更は数えない"""
+    if raw:
+        return
+    key = stats.counter_key(instance)
+    previous = getattr(instance, "_counter_key", None)
+    if created:
+        stats.apply_deltas(instance.user_id, {key: 1}, using=using)
+    elif previous is not None and None not in previous and previous != key:
+        stats.apply_deltas(instance.user_id, stats.moved(previous, instance), using=using)
+    instance._counter_key = key
+
+
+@receiver(post_delete, sender=Memo)
+def update_deleted_memo_counters(sender, instance, using, origin=None, **kwargs):
+    if _deleted_as_memo(origin):
+        key = getattr(instance, "_counter_key", None)
+        if key is None or None in key:
+            key = stats.counter_key(instance)
+        stats.apply_deltas(instance.user_id, {key: -1}, using=using)
+
+
+@receiver(memos_bulk_created, sender=Memo)
+def update_bulk_created_memo_counters(sender, user, memos, **kwargs):
+    stats.apply_deltas(user.pk, Counter(stats.counter_key(memo) for memo in memos))
+
+
+@receiver(memos_bulk_deleted, sender=Memo)
+def update_bulk_deleted_memo_counters(sender, user, memos, using, **kwargs):
+    deltas = Counter()
+    deltas.subtract(stats.counter_key(memo) for memo in memos)
+    stats.apply_deltas(user.pk, deltas, using=using)
+
+
+@receiver(memos_bulk_updated, sender=Memo)
+def update_bulk_updated_memo_counters(sender, user, memos, fields, previous, **kwargs):
+    if not {"category", "priority"} & set(fields):
+        return
+    deltas = Counter()
+    for memo in memos:
+        old = previous.get(memo.pk, {})
+        deltas.update(stats.moved(
+            (old.get("category", memo.category), old.get("priority", memo.priority)), memo
+        ))
+        memo._counter_key = stats.counter_key(memo)
+    stats.apply_deltas(user.pk, deltas)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def reset_memo_list_version(sender, instance, created, raw=False, **kwargs):
+    """削除したユーザーのidが再利用されても、古いキャッシュを使わないようにする"""
+    if created and not raw:
+        cache.reset_version(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def assign_user_shard(sender, instance, created, raw=False, **kwargs):
+    """新しいユーザーのメモを保存するシャードを決める"""
+    if created and not raw and sharding.is_sharded():
+        sharding.assign(instance, sharding.initial_shard(instance))
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def delete_sharded_memos(sender, instance, **kwargs):
+    """default 以外のシャードのメモは、ユーザーを削除したときにカスケードで削除されないので削除する"""
+    if sharding.is_sharded():
+        alias = sharding.shard_for(instance)
+        if alias != DEFAULT_DB_ALIAS:
+            sharding.purge(instance, alias)
+
+
+@receiver(post_migrate)
+def reserve_shard_id_range(sender, using, **kwargs):
+    if sender.name == "memo" and using in settings.MEMO_SHARDS:
+        sharding.reserve_id_range(using)
+
@@ -0,0 +1,107 @@
+"""ユーザーごとのカテゴリー・重要度別のメモの件数(MemoCounter)
+
+メモの作成・変更・削除・一括処理のシグナルで件数を増減するので、表示するときはGROUP BYせずに
+ユーザーの数行(カテゴリー×重要度)を読むだけで済む。読んだ結果は一覧と同じくユーザーのキャッシュに入れる。
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .cache import bump_version, get_or_compute
+from .models import Memo, MemoCounter
+from .sharding import shard_for, shards, using_shard
+
+
+def counter_key(memo):
+    return (memo.category, memo.priority)
+
+
+def apply_deltas(user_id, deltas, using=None):
+    """deltas: {(カテゴリー, 重要度): 増減}。usingを省略したときはユーザーのシャード"""
+    using = using or shard_for(user_id)
+    for (category, priority), delta in deltas.items():
+        if not delta:
+            continue
+        counters = MemoCounter.objects.using(using).filter(user_id=user_id, category=category, priority=priority)
+        if counters.update(count=F("count") + delta):
+            continue
+        try:
+            with transaction.atomic(using=using):
+                MemoCounter.objects.using(using).create(
+                    user_id=user_id, category=category, priority=priority, count=delta
+                )
+        except IntegrityError:
+            # 同時に作成された
+            counters.update(count=F("count") + delta)
+
+
+def moved(previous_key, memo):
+    """カテゴリー・重要度を変更したメモの増減"""
+    deltas = Counter({counter_key(memo): 1})
+    deltas[previous_key] -= 1
+    return deltas
+
+
+def _querysets(model, user_id, using):
+    """user_idのシャード、またはすべてのシャード(user_idがNone)のquerysetを返す"""
+    if user_id is not None:
+        return [model.objects.using(using or shard_for(user_id)).filter(user_id=user_id)]
+    return [model.objects.using(alias) for alias in ([using] if using else shards())]
+
+
+def count_memos(user_id=None, using=None):
+    """メモのテーブルから数えた {user_id: {(カテゴリー, 重要度): 件数}}"""
+    actual = {}
+    for qs in _querysets(Memo, user_id, using):
+        for row in qs.values("user_id", "category", "priority").annotate(count=Count("pk")).order_by():
+            actual.setdefault(row["user_id"], {})[(row["category"], row["priority"])] = row["count"]
+    return actual
+
+
+def stored_counts(user_id=None, using=None):
+    stored = {}
+    for qs in _querysets(MemoCounter, user_id, using):
+        for counter in qs:
+            stored.setdefault(counter.user_id, {})[(counter.category, counter.priority)] = counter.count
+    return stored
+
+
+def reconcile(user_id=None, fix=True):
+    """件数を数え直して、ずれていた (user_id, カテゴリー, 重要度, 保存されていた件数, 実際の件数) のリストを返す
+
+    fix=Trueならずれていた件数を直す。
+    """
+    actual = count_memos(user_id)
+    stored = stored_counts(user_id)
+    drift = []
+    for uid in sorted(set(actual) | set(stored)):
+        counts, saved = actual.get(uid, {}), stored.get(uid, {})
+        for key in sorted(set(counts) | set(saved)):
+            if counts.get(key, 0) != saved.get(key, 0):
+                drift.append((uid, *key, saved.get(key, 0), counts.get(key, 0)))
+    if fix and drift:
+        by_shard = defaultdict(list)
+        for row in drift:
+            by_shard[shard_for(row[0])].append(row)
+        for alias, rows in by_shard.items():
+            with transaction.atomic(using=alias):
+                for uid, category, priority, _, count in rows:
+                    MemoCounter.objects.using(alias).update_or_create(
+                        user_id=uid, category=category, priority=priority, defaults={"count": count}
+                    )
+        for uid in {row[0] for row in drift}:
+            bump_version(uid)
+    return drift
+
+
+def user_stats(user):
+    """{"total": 件数, "category": {カテゴリー: 件数}, "priority": {重要度: 件数}}。すべての選択肢を含める"""
+    def compute():
+        category = {value: 0 for value, _ in Memo.CATEGORY}
+        priority = {value: 0 for value, _ in Memo.PRIORITY_CHOICES}
+        for counter in using_shard(MemoCounter.objects.filter(user=user, count__gt=0), user):
+            category[counter.category] = category.get(counter.category, 0) + counter.count
+            priority[counter.priority] = priority.get(counter.priority, 0) + counter.count
+        return {"total": sum(category.values()), "category": category, "priority": priority}
+    return get_or_compute(user.pk, "stats", {}, compute)
@@ -5,4 +5,14 @@ register = template.Library()
 
 @register.filter
 def stars(value):
-    return "★" * value
\ No newline at end of file
+    return "★" * value
+
+@register.simple_tag(takes_context=True)
+def page_query(context, **params):
+    """今のクエリパラメータ(検索語、カテゴリー)を残し、ページの指定だけをparamsに置き換えたクエリ文字列"""
+    query = context["request"].GET.copy()
+    for key in ("page", "cursor"):
+        query.pop(key, None)
+    for key, value in params.items():
+        query[key] = value
+    return query.urlencode()
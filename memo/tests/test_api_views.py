@@ -190,5 +190,25 @@ class MemoAPITestValidation(APITestCase):
         self.assertEqual(res.status_code, 400)
         self.assertIn("title", res.data)
 
+    def test_get_memo_compact(self):
+        # ?compact=1 では内容の先頭だけを返し、内容すべては詳細で取得する
+        self.memo.content = "a" * 100
+        self.memo.save()
+        res = self.client.get("/api/memo/?compact=1")
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("content", res.data["results"][0])
+        self.assertEqual(res.data["results"][0]["content_preview"], "a" * 50)
+        self.assertEqual(res.data["results"][0]["slug"], self.memo.slug)
+        res = self.client.get(f"/api/memo/{self.memo.pk}/")
+        self.assertEqual(res.data["content"], "a" * 100)
 
-
+    def test_patch_memo_duplicate_slug(self):
+        # ほかのメモのslugに変更すると400になる(自分のslugのままなら変更できる)
+        other = Memo.objects.create(user=self.user, title="other", content="content")
+        res = self.client.patch(f"/api/memo/{self.memo.pk}/", data={"slug": other.slug}, format="json")
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("slug", res.data)
+        res = self.client.patch(f"/api/memo/{self.memo.pk}/", data={"slug": self.memo.slug}, format="json")
+        self.assertEqual(res.status_code, 200)
+        res = self.client.post("/api/memo/", data={"title": "t", "content": "c", "slug": other.slug})
+        self.assertEqual(res.status_code, 400)
@@ -0,0 +1,114 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from memo.models import Memo
+
+
+class TestAsyncMemoViews(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", nickname="nickname", password="password")
+        self.other = User.objects.create_user(username="other", password="password")
+        self.memo = Memo.objects.create(title="会議", content="内容", user=self.user)
+
+    async def login(self):
+        await self.async_client.aforce_login(self.user)
+
+    async def test_list(self):
+        await self.login()
+        for i in range(11):
+            await Memo.objects.acreate(title=f"memo{i}", content="content", user=self.user)
+        res = await self.async_client.get("/async/")
+        self.assertEqual(res.status_code, 200)
+        self.assertTemplateUsed(res, "memo.html")
+        self.assertEqual(len(res.context["page_obj"]), 9)
+        self.assertEqual(res.context["paginator"].num_pages, 2)
+        # リンクは /async/ のURLになる
+        self.assertContains(res, "/async/detail/memo10/")
+        self.assertContains(res, "nickname")
+        res = await self.async_client.get("/async/?page=2")
+        self.assertEqual(len(res.context["page_obj"]), 3)
+        res = await self.async_client.get("/async/?page=100")
+        self.assertEqual(res.context["page_obj"].number, 1)
+
+    async def test_list_search(self):
+        await self.login()
+        res = await self.async_client.get("/async/?q=会議")
+        self.assertEqual([memo.pk for memo in res.context["page_obj"]], [self.memo.pk])
+
+    async def test_login_required(self):
+        res = await self.async_client.get("/async/")
+        self.assertEqual(res.status_code, 302)
+        self.assertIn("/accounts/login/", res["Location"])
+
+    async def test_detail(self):
+        await self.login()
+        res = await self.async_client.get(f"/async/detail/{self.memo.slug}/")
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "内容")
+        self.assertContains(res, f"/async/edit/{self.memo.slug}/")
+        other = await Memo.objects.acreate(title="他人", content="content", user=self.other)
+        res = await self.async_client.get(f"/async/detail/{other.slug}/")
+        self.assertEqual(res.status_code, 404)
+
+    async def test_create(self):
+        await self.login()
+        res = await self.async_client.post(
+            "/async/create/", {"title": "会議", "content": "new", "category": "work", "priority": 3}
+        )
+        self.assertRedirects(res, "/async/", fetch_redirect_response=False)
+        memo = await Memo.objects.aget(content="new")
+        self.assertEqual(memo.slug, "kaigi-1")
+        self.assertEqual(memo.user_id, self.user.pk)
+        res = await self.async_client.post("/async/create/", {"title": "", "content": "new"})
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.context["form"].errors)
+
+    async def test_edit(self):
+        await self.login()
+        res = await self.async_client.post(
+            f"/async/edit/{self.memo.slug}/",
+            {"title": "会議", "content": "edited", "category": "personal", "priority": 2},
+        )
+        self.assertRedirects(res, f"/async/detail/{self.memo.slug}/", fetch_redirect_response=False)
+        await self.memo.arefresh_from_db()
+        self.assertEqual(self.memo.content, "edited")
+
+    async def test_delete(self):
+        await self.login()
+        res = await self.async_client.post(f"/async/delete/{self.memo.slug}/")
+        self.assertRedirects(res, "/async/", fetch_redirect_response=False)
+        self.assertFalse(await Memo.objects.filter(pk=self.memo.pk).aexists())
+
+
+class TestAsyncMemoAPI(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        for i in range(6):
+            Memo.objects.create(title=f"memo{i}", content="content" * 20, user=self.user, priority=i % 3 + 1)
+
+    async def test_list_same_as_sync(self):
+        await self.async_client.aforce_login(self.user)
+        for query in ("", "?page=2", "?ordering=created_at", "?compact=1"):
+            res = await self.async_client.get(f"/api/async/memo/{query}")
+            self.assertEqual(res.status_code, 200)
+            expected = await self.async_client.get(f"/api/memo/{query}")
+            self.assertEqual(res.json()["count"], expected.json()["count"])
+            self.assertEqual(res.json()["results"], expected.json()["results"])
+        res = await self.async_client.get("/api/async/memo/")
+        self.assertEqual(res.json()["next"], "http://testserver/api/async/memo/?page=2")
+        res = await self.async_client.get("/api/async/memo/?page=3")
+        self.assertEqual(res.status_code, 404)
+
+    async def test_detail(self):
+        await self.async_client.aforce_login(self.user)
+        memo = await Memo.objects.afirst()
+        res = await self.async_client.get(f"/api/async/memo/{memo.pk}/")
+        self.assertEqual(res.json()["content"], memo.content)
+        res = await self.async_client.get("/api/async/memo/0/")
+        self.assertEqual(res.status_code, 404)
+
+    async def test_not_authenticated(self):
+        res = await self.async_client.get("/api/async/memo/")
+        self.assertEqual(res.status_code, 403)
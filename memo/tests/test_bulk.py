@@ -0,0 +1,155 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.models import Memo, MemoTombstone
+from memo.search import search_memos
+
+
+class MemoBulkAPITest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.login(username="user", password="password")
+        self.memo = Memo.objects.create(user=self.user, title="会議", content="content")
+
+    def test_bulk_create(self):
+        data = [
+            {"title": "会議", "content": "1"},
+            {"title": "会議", "content": "2", "category": "work", "priority": 3},
+            {"title": "", "content": "3"},
+            {"title": "買い物", "content": "4"},
+        ]
+        res = self.client.post("/api/memo/bulk/", data, format="json")
+        self.assertEqual(res.status_code, 200)
+        results = res.data["results"]
+        self.assertEqual([r["status"] for r in results], [201, 201, 400, 201])
+        self.assertIn("title", results[2]["errors"])
+        self.assertEqual([results[i]["data"]["slug"] for i in (0, 1, 3)], ["kaigi-1", "kaigi-2", "kaimono"])
+        self.assertEqual(results[1]["data"]["priority"], 3)
+        self.assertEqual(results[0]["data"]["user"], self.user.id)
+        self.assertEqual(Memo.objects.filter(user=self.user).count(), 4)
+        # 一括作成したメモも検索できる
+        found = list(search_memos(Memo.objects.for_user(self.user), self.user, "kaimono"))
+        self.assertEqual([m.pk for m in found], [results[3]["data"]["id"]])
+
+    def test_bulk_create_keeps_requested_slug(self):
+        # 指定したslugはそのまま使い、生成するslugはそれと重ならない番号にする
+        data = [
+            {"title": "会議", "content": "1"},
+            {"title": "x", "content": "2", "slug": "kaigi-1"},
+            {"title": "y", "content": "3", "slug": "kaigi"},
+            {"title": "z", "content": "4", "slug": "kaigi-1"},
+            {"title": "w", "content": "5", "slug": "custom"},
+        ]
+        res = self.client.post("/api/memo/bulk/", data, format="json")
+        results = res.data["results"]
+        self.assertEqual([r["status"] for r in results], [201, 201, 400, 400, 201])
+        self.assertIn("slug", results[2]["errors"])
+        self.assertIn("slug", results[3]["errors"])
+        self.assertEqual([results[i]["data"]["slug"] for i in (0, 1, 4)], ["kaigi-2", "kaigi-1", "custom"])
+
+    def test_bulk_create_query_count_does_not_grow(self):
+        def count_queries(size):
+            data = [{"title": f"title {i % 3}", "content": "c"} for i in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post("/api/memo/bulk/", data, format="json")
+            self.assertEqual(res.status_code, 200)
+            # 検索の索引への書き込みは件数によらずexecutemanyで1回ずつ
+            return len(ctx.captured_queries)
+        self.assertEqual(count_queries(5), count_queries(50))
+
+    def test_bulk_update(self):
+        other = Memo.objects.create(user=self.user, title="other", content="content")
+        data = [
+            {"id": self.memo.pk, "priority": 3},
+            {"id": other.pk, "category": "invalid"},
+            {"id": 99999, "title": "x"},
+        ]
+        res = self.client.patch("/api/memo/bulk/", data, format="json")
+        self.assertEqual(res.status_code, 200)
+        results = res.data["results"]
+        self.assertEqual([r["status"] for r in results], [200, 400, 404])
+        self.memo.refresh_from_db()
+        self.assertEqual(self.memo.priority, 3)
+        self.assertEqual(self.memo.content, "content")
+        self.assertEqual(self.memo.slug, "kaigi")
+        self.assertGreater(self.memo.updated_at, self.memo.created_at)
+
+    def test_bulk_update_slug(self):
+        first = Memo.objects.create(user=self.user, title="other", content="content")
+        second = Memo.objects.create(user=self.user, title="会議", content="content")
+        data = [
+            {"id": first.pk, "slug": self.memo.slug},
+            {"id": first.pk, "slug": "new"},
+            {"id": second.pk, "slug": "new"},
+            {"id": second.pk, "slug": ""},
+        ]
+        res = self.client.patch("/api/memo/bulk/", data, format="json")
+        results = res.data["results"]
+        self.assertEqual([r["status"] for r in results], [400, 200, 400, 200])
+        self.assertIn("slug", results[0]["errors"])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.slug, "new")
+        # 空にしたslugはタイトルから生成し直す
+        self.assertEqual(second.slug, "kaigi-2")
+
+    def test_bulk_update_repeated_id(self):
+        # 同じidは最初に受け付けた項目だけを更新し、それ以降は400にする
+        data = [
+            {"id": self.memo.pk, "category": "invalid"},
+            {"id": self.memo.pk, "title": "first"},
+            {"id": self.memo.pk, "title": "second"},
+        ]
+        res = self.client.patch("/api/memo/bulk/", data, format="json")
+        results = res.data["results"]
+        self.assertEqual([r["status"] for r in results], [400, 200, 400])
+        self.assertIn("id", results[2]["errors"])
+        self.memo.refresh_from_db()
+        self.assertEqual(self.memo.title, "first")
+
+    def test_bulk_delete(self):
+        User = get_user_model()
+        other_user = User.objects.create_user(username="other", password="password")
+        other_memo = Memo.objects.create(user=other_user, title="other", content="content")
+        res = self.client.delete("/api/memo/bulk/", [self.memo.pk, other_memo.pk], format="json")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([r["status"] for r in res.data["results"]], [204, 404])
+        self.assertFalse(Memo.objects.filter(pk=self.memo.pk).exists())
+        # 他のユーザーのメモは削除できない
+        self.assertTrue(Memo.objects.filter(pk=other_memo.pk).exists())
+
+    def test_bulk_delete_query_count_does_not_grow(self):
+        def count_queries(size):
+            ids = [Memo.objects.create(user=self.user, title="会議", content="c").pk for _ in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.delete("/api/memo/bulk/", ids, format="json")
+            self.assertEqual([r["status"] for r in res.data["results"]], [204] * size)
+            # tombstoneを残し、検索の索引から削除する
+            self.assertEqual(MemoTombstone.objects.filter(memo_id__in=ids).count(), size)
+            self.assertEqual(list(search_memos(Memo.objects.for_user(self.user), self.user, "会議")), [self.memo])
+            return len(ctx.captured_queries)
+        self.assertEqual(count_queries(2), count_queries(20))
+
+    def test_bulk_invalid_ids(self):
+        # 整数でないidはその項目だけ400にする
+        res = self.client.delete("/api/memo/bulk/", [{"id": self.memo.pk}, [1], "1", True, self.memo.pk], format="json")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([r["status"] for r in res.data["results"]], [400, 400, 400, 400, 204])
+        memo = Memo.objects.create(user=self.user, title="other", content="content")
+        res = self.client.patch(
+            "/api/memo/bulk/", [{"id": [memo.pk]}, {"title": "x"}, "x", {"id": memo.pk, "priority": 1}], format="json"
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([r["status"] for r in res.data["results"]], [400, 400, 400, 200])
+
+    def test_bulk_requires_list(self):
+        res = self.client.post("/api/memo/bulk/", {"title": "x", "content": "y"}, format="json")
+        self.assertEqual(res.status_code, 400)
+
+    def test_bulk_without_login(self):
+        self.client.logout()
+        res = self.client.post("/api/memo/bulk/", [{"title": "x", "content": "y"}], format="json")
+        self.assertIn(res.status_code, [401, 403])
@@ -0,0 +1,109 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.models import Memo
+from memo.cache import cache_stats, get_version, reset_cache_stats
+
+
+@override_settings(MEMO_LIST_CACHE_TIMEOUT=300)
+class TestMemoListCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.other = User.objects.create_user(username="other", password="password")
+        self.client.login(username="user", password="password")
+        for i in range(12):
+            Memo.objects.create(title=f"memo{i}", content="content", user=self.user)
+
+    def memo_queries(self, url):
+        """メモのテーブルへのクエリの数"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+        return res, [q["sql"] for q in ctx.captured_queries if "memo_memo" in q["sql"]]
+
+    def test_second_request_is_cached(self):
+        url = reverse("memo:memo") + "?page=2"
+        first, queries = self.memo_queries(url)
+        self.assertEqual(len(queries), 4)  # ETag用の集計、カテゴリー別の件数、COUNT、1ページ分
+        second, queries = self.memo_queries(url)
+        self.assertEqual(queries, [])
+        self.assertEqual(
+            [memo.pk for memo in first.context["page_obj"]], [memo.pk for memo in second.context["page_obj"]]
+        )
+        self.assertEqual(second.context["page_obj"].number, 2)
+        self.assertEqual(second.context["paginator"].num_pages, 2)
+        # ETag用の集計、カテゴリー別の件数、1ページ分
+        self.assertEqual(cache_stats()["hits"], 3)
+        self.assertEqual(cache_stats()["misses"], 3)
+
+    def test_keys_include_category_and_page(self):
+        self.memo_queries(reverse("memo:memo"))
+        _, queries = self.memo_queries(reverse("memo:memo") + "?page=2")
+        self.assertNotEqual(queries, [])
+        _, queries = self.memo_queries(reverse("memo:memo") + "?category=work")
+        self.assertNotEqual(queries, [])
+
+    def test_save_and_delete_invalidate(self):
+        url = reverse("memo:memo")
+        self.client.get(url)
+        memo = Memo.objects.create(title="new", content="content", user=self.user, priority=3)
+        res = self.client.get(url)
+        self.assertEqual(res.context["page_obj"][0], memo)
+        memo.delete()
+        res = self.client.get(url)
+        self.assertNotIn(memo, list(res.context["page_obj"]))
+
+    def test_other_user_write_does_not_invalidate(self):
+        version = get_version(self.user.pk)
+        Memo.objects.create(title="other", content="content", user=self.other)
+        self.assertEqual(get_version(self.user.pk), version)
+
+    def test_bulk_invalidate(self):
+        version = get_version(self.user.pk)
+        self.client.post("/api/memo/bulk/", [{"title": "bulk", "content": "c"}], content_type="application/json")
+        self.assertNotEqual(get_version(self.user.pk), version)
+
+    @override_settings(MEMO_LIST_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        url = reverse("memo:memo")
+        self.client.get(url)
+        _, queries = self.memo_queries(url)
+        self.assertEqual(len(queries), 4)
+
+    @override_settings(MEMO_CURSOR_PAGINATION=True)
+    def test_cursor_pagination_cached(self):
+        url = reverse("memo:memo")
+        first, _ = self.memo_queries(url)
+        second, queries = self.memo_queries(url + "?cursor=" + first.context["page_obj"].next_cursor)
+        self.assertNotEqual(queries, [])
+        third, queries = self.memo_queries(url + "?cursor=" + first.context["page_obj"].next_cursor)
+        self.assertEqual(queries, [])
+        self.assertEqual(list(second.context["page_obj"]), list(third.context["page_obj"]))
+
+
+@override_settings(MEMO_LIST_CACHE_TIMEOUT=300)
+class TestMemoAPIListCache(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.login(username="user", password="password")
+        Memo.objects.create(title="memo", content="content", user=self.user)
+
+    def test_list_cached_and_invalidated(self):
+        first = self.client.get("/api/memo/?ordering=created_at")
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get("/api/memo/?ordering=created_at")
+        self.assertFalse([q for q in ctx.captured_queries if "memo_memo" in q["sql"]])
+        self.assertEqual(first.data, second.data)
+
+        self.client.post("/api/memo/", {"title": "new", "content": "c"}, format="json")
+        res = self.client.get("/api/memo/?ordering=created_at")
+        self.assertEqual(res.data["count"], 2)
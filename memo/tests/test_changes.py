@@ -0,0 +1,90 @@
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.importer import MemoImporter
+from memo.models import Memo, MemoTombstone
+
+
+class TestChangesAPI(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.other = User.objects.create_user(username="other", password="password")
+        self.memos = [Memo.objects.create(title=f"memo{i}", content="content", user=self.user) for i in range(3)]
+        Memo.objects.create(title="other", content="content", user=self.other)
+        self.client.force_authenticate(self.user)
+
+    def sync(self, **params):
+        res = self.client.get("/api/memo/changes/", params)
+        self.assertEqual(res.status_code, 200)
+        return res.data
+
+    def test_initial_sync_returns_all_memos_in_order(self):
+        data = self.sync()
+        self.assertEqual([item["id"] for item in data["results"]], [memo.pk for memo in self.memos])
+        self.assertFalse(data["results"][0]["deleted"])
+        self.assertEqual(data["results"][0]["memo"]["title"], "memo0")
+        self.assertFalse(data["has_more"])
+        self.assertIsNotNone(data["next_cursor"])
+
+    def test_nothing_new_is_one_query(self):
+        cursor = self.sync()["next_cursor"]
+        with self.assertNumQueries(1):
+            data = self.sync(cursor=cursor)
+        self.assertEqual(data["results"], [])
+        self.assertEqual(data["next_cursor"], cursor)
+
+    def test_updates_and_deletes_since_cursor(self):
+        cursor = self.sync()["next_cursor"]
+        memo = self.memos[0]
+        memo.title = "updated"
+        memo.save()
+        res = self.client.delete(f"/api/memo/{self.memos[1].pk}/")
+        self.assertEqual(res.status_code, 204)
+        data = self.sync(cursor=cursor)
+        self.assertEqual(
+            [(item["id"], item["deleted"]) for item in data["results"]],
+            [(memo.pk, False), (self.memos[1].pk, True)],
+        )
+        self.assertEqual(data["results"][0]["memo"]["title"], "updated")
+        self.assertIsNone(data["results"][1]["memo"])
+        self.assertEqual(self.sync(cursor=data["next_cursor"])["results"], [])
+
+    def test_imported_memos_with_old_timestamps_since_cursor(self):
+        # 更新日時を引き継いだメモも、インポートしたあとの取得で返す
+        cursor = self.sync()["next_cursor"]
+        MemoImporter(self.user).run([{"title": "old", "content": "c", "updated_at": "2001-01-01T00:00:00+09:00"}])
+        data = self.sync(cursor=cursor)
+        self.assertEqual([item["memo"]["title"] for item in data["results"]], ["old"])
+        self.assertEqual(data["results"][0]["memo"]["updated_at"][:4], "2001")
+
+    def test_delete_view_records_tombstone(self):
+        self.client.force_login(self.user)
+        res = self.client.post(reverse("memo:delete", kwargs={"slug": self.memos[2].slug}))
+        self.assertEqual(res.status_code, 302)
+        self.assertTrue(MemoTombstone.objects.filter(user=self.user, memo_id=self.memos[2].pk).exists())
+
+    def test_page_size(self):
+        data = self.sync(page_size=2)
+        self.assertEqual(len(data["results"]), 2)
+        self.assertTrue(data["has_more"])
+        data = self.sync(page_size=2, cursor=data["next_cursor"])
+        self.assertEqual([item["id"] for item in data["results"]], [self.memos[2].pk])
+        self.assertFalse(data["has_more"])
+
+    def test_since(self):
+        since = self.memos[1].updated_at.isoformat()
+        data = self.sync(since=since)
+        self.assertEqual([item["id"] for item in data["results"]], [self.memos[1].pk, self.memos[2].pk])
+
+    def test_invalid_cursor(self):
+        res = self.client.get("/api/memo/changes/", {"cursor": "invalid"})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.get("/api/memo/changes/", {"since": "yesterday"})
+        self.assertEqual(res.status_code, 400)
+
+    def test_deleting_user_does_not_record_tombstones(self):
+        self.other.delete()
+        self.assertFalse(MemoTombstone.objects.exists())
+        self.assertFalse(Memo.objects.filter(user_id=self.other.pk).exists())
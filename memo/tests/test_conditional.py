@@ -0,0 +1,103 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.models import Memo, MemoQuerySet
+
+
+class ConditionalAPITest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.login(username="user", password="password")
+        self.memo = Memo.objects.create(user=self.user, title="title", content="content")
+
+    def test_list_not_modified(self):
+        res = self.client.get("/api/memo/")
+        etag = res["ETag"]
+        self.assertNotIn("Last-Modified", res)
+        res = self.client.get("/api/memo/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res["ETag"], etag)
+        # カテゴリが違えば別の一覧
+        self.assertEqual(self.client.get("/api/memo/?category=work", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etag_changes(self):
+        etag = self.client.get("/api/memo/")["ETag"]
+        other = Memo.objects.create(user=self.user, title="other", content="content")
+        res = self.client.get("/api/memo/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+        # 削除ではmax(updated_at)が変わらないが、件数で検出できる
+        etag = res["ETag"]
+        self.memo.delete()
+        self.assertEqual(self.client.get("/api/memo/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        other.delete()
+        self.assertNotEqual(self.client.get("/api/memo/")["ETag"], etag)
+
+    def test_detail_not_modified(self):
+        url = f"/api/memo/{self.memo.pk}/"
+        res = self.client.get(url)
+        self.assertIn("Last-Modified", res)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=res["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=res["Last-Modified"]).status_code, 304)
+
+    def test_if_match(self):
+        url = f"/api/memo/{self.memo.pk}/"
+        etag = self.client.get(url)["ETag"]
+        res = self.client.patch(url, {"title": "first"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+        # 古いETagでの更新は拒否する
+        res = self.client.patch(url, {"title": "second"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, 412)
+        self.memo.refresh_from_db()
+        self.assertEqual(self.memo.title, "first")
+        res = self.client.put(url, {"title": "third", "content": "c"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, 412)
+
+    def test_if_match_locks_row(self):
+        # 比べてから保存するまで行をロックする(SQLiteではFOR UPDATEは付かない)
+        url = f"/api/memo/{self.memo.pk}/"
+        etag = self.client.get(url)["ETag"]
+        with mock.patch.object(
+            MemoQuerySet, "select_for_update", autospec=True, side_effect=MemoQuerySet.select_for_update
+        ) as select_for_update:
+            self.client.patch(url, {"title": "first"}, format="json")
+            select_for_update.assert_not_called()
+            res = self.client.patch(url, {"title": "second"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, 412)
+        select_for_update.assert_called()
+
+
+class ConditionalViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", nickname="nick", password="password")
+        self.client.login(username="user", password="password")
+        self.memo = Memo.objects.create(user=self.user, title="title", content="content")
+
+    def test_list_not_modified(self):
+        url = reverse("memo:memo")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # ニックネームはページに表示されるので、変わったら別のETagになる
+        self.user.nickname = "new"
+        self.user.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_not_modified(self):
+        url = reverse("memo:detail", kwargs={"slug": self.memo.slug})
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.memo.content = "changed"
+        self.memo.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "changed")
@@ -0,0 +1,123 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.models import Memo
+from memo.export import export_memos
+
+
+def current_rss():
+    """今のプロセスの常駐メモリ(バイト)。Linuxの/procから読む"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+
+
+class TestExportMemos(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="test", password="password")
+        self.memo1 = Memo.objects.create(title="会議", content="改行\n\"引用\",カンマ", user=self.user)
+        self.memo2 = Memo.objects.create(title="買い物", content="牛乳", user=self.user, priority=3)
+
+    def export(self, export_format, compress=False):
+        data = b"".join(export_memos(Memo.objects.for_user(self.user), export_format, compress=compress))
+        return (gzip.decompress(data) if compress else data).decode("utf-8")
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export("ndjson").splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.memo1.pk, self.memo2.pk])
+        self.assertEqual(rows[0]["content"], self.memo1.content)
+        self.assertEqual(rows[1]["priority"], 3)
+        self.assertEqual(rows[0]["slug"], "kaigi")
+
+    def test_json_and_gzip(self):
+        rows = json.loads(self.export("json", compress=True))
+        self.assertEqual([row["title"] for row in rows], ["会議", "買い物"])
+
+    def test_json_empty(self):
+        Memo.objects.all().delete()
+        self.assertEqual(json.loads(self.export("json")), [])
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export("csv"))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["content"], self.memo1.content)
+
+    @unittest.skipUnless(os.path.exists("/proc/self/status"), "/proc がない環境ではRSSを測れません")
+    def test_memory_stays_flat(self):
+        # 100,000件を書き出してもRSSのピークの増加が一定の範囲に収まる
+        # (全件をリストに読み込むと80MB以上増える)
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO memo_memo (user_id, title, slug, priority, category, content, created_at, updated_at, "
+                "changed_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                [(self.user.pk, "title", f"title-{i}", 2, "personal", "内容" * 20, now, now, now) for i in range(100_000)],
+            )
+        before = current_rss()
+        peak = before
+        size = 0
+        for i, chunk in enumerate(export_memos(Memo.objects.for_user(self.user), "ndjson", compress=True)):
+            size += len(chunk)
+            if i % 10 == 0:
+                peak = max(peak, current_rss())
+        self.assertGreater(size, 0)
+        self.assertLess(peak - before, 30 * 1024 * 1024)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "memos.csv.gz")
+            call_command("export_memos", "test", "--format", "csv", "--gzip", "--output", path)
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 2)
+        out = io.StringIO()
+        call_command("export_memos", "test", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class TestExportAPI(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.login(username="user", password="password")
+        Memo.objects.create(user=self.user, title="title", content="content")
+        other = User.objects.create_user(username="other", password="password")
+        Memo.objects.create(user=other, title="other", content="content")
+
+    def test_export(self):
+        res = self.client.get("/api/memo/export/")
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Type"], "application/x-ndjson; charset=utf-8")
+        lines = b"".join(res.streaming_content).decode().splitlines()
+        # 自分のメモだけが含まれる
+        self.assertEqual([json.loads(line)["title"] for line in lines], ["title"])
+
+    def test_export_gzip(self):
+        res = self.client.get("/api/memo/export/", {"fmt": "csv", "gzip": "1"})
+        self.assertEqual(res["Content-Type"], "application/gzip")
+        self.assertIn("memos.csv.gz", res["Content-Disposition"])
+        text = gzip.decompress(b"".join(res.streaming_content)).decode()
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(text)))), 1)
+
+    def test_export_invalid_format(self):
+        res = self.client.get("/api/memo/export/", {"fmt": "xml"})
+        self.assertEqual(res.status_code, 400)
+
+    def test_export_without_login(self):
+        self.client.logout()
+        res = self.client.get("/api/memo/export/")
+        self.assertIn(res.status_code, [401, 403])
@@ -0,0 +1,127 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.models import Memo
+from memo.export import export_memos
+
+
+ROWS = [
+    {"title": "会議", "content": "1"},
+    {"title": "会議", "content": "2", "category": "work", "priority": 3},
+    {"title": "", "content": "タイトルなし"},
+    {"title": "買い物", "content": "3", "slug": "shopping", "created_at": "2024-01-02T03:04:05+09:00"},
+]
+
+
+class TestImportCommand(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="test", password="password")
+        Memo.objects.create(title="会議", content="既存", user=self.user)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def run_command(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_memos", "test", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_ndjson(self):
+        path = self.write("memos.ndjson", "\n".join(json.dumps(row, ensure_ascii=False) for row in ROWS) + "\n{broken\n")
+        out, err = self.run_command(path, "--batch-size", "2")
+        self.assertIn("3件をインポートしました", out)
+        self.assertIn("行/秒", out)
+        self.assertIn("3行目", err)
+        self.assertIn("5行目", err)
+        memos = {memo.content: memo for memo in Memo.objects.filter(user=self.user)}
+        # 既存のslugとの重複は番号で解決する
+        self.assertEqual(memos["1"].slug, "kaigi-1")
+        self.assertEqual(memos["2"].slug, "kaigi-2")
+        self.assertEqual(memos["2"].priority, 3)
+        # slugと作成日時は引き継ぐ
+        self.assertEqual(memos["3"].slug, "shopping")
+        self.assertEqual(memos["3"].created_at.isoformat(), "2024-01-01T18:04:05+00:00")
+
+    def test_resume_from_checkpoint(self):
+        path = self.write("memos.ndjson", "\n".join(json.dumps(row, ensure_ascii=False) for row in ROWS))
+        checkpoint = os.path.join(self.tmp.name, "checkpoint.json")
+        # 2行目まで処理したところで止まった状態
+        with open(checkpoint, "w") as f:
+            json.dump({"rows": 2}, f)
+        self.run_command(path, "--checkpoint", checkpoint)
+        self.assertEqual(Memo.objects.filter(user=self.user).count(), 2)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)["rows"], 4)
+        # 最後まで処理済みなので、もう一度実行しても増えない
+        self.run_command(path, "--checkpoint", checkpoint)
+        self.assertEqual(Memo.objects.filter(user=self.user).count(), 2)
+
+    def test_import_exported_csv(self):
+        data = b"".join(export_memos(Memo.objects.for_user(self.user), "csv"))
+        path = os.path.join(self.tmp.name, "memos.csv")
+        with open(path, "wb") as f:
+            f.write(data)
+        self.run_command(path)
+        slugs = sorted(Memo.objects.filter(user=self.user).values_list("slug", flat=True))
+        self.assertEqual(slugs, ["kaigi", "kaigi-1"])
+
+
+class TestImportAPI(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.login(username="user", password="password")
+
+    def test_import(self):
+        body = "\n".join(json.dumps(row, ensure_ascii=False) for row in ROWS).encode()
+        res = self.client.post("/api/memo/import/", body, content_type="application/x-ndjson")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["imported"], 3)
+        self.assertEqual(res.data["error_count"], 1)
+        self.assertEqual(res.data["errors"][0]["row"], 3)
+        self.assertEqual(Memo.objects.filter(user=self.user).count(), 3)
+
+    def test_import_csv(self):
+        body = "title,content\n会議,\"改行\nあり\"\n".encode()
+        res = self.client.post("/api/memo/import/?fmt=csv", body, content_type="text/csv")
+        self.assertEqual(res.data["imported"], 1)
+        self.assertEqual(Memo.objects.get(user=self.user).content, "改行\nあり")
+
+    def test_import_preserved_slug_with_generated(self):
+        # 引き継ぐslugと同じ番号は生成するslugに使わない(行の順番によらない)
+        rows = [{"title": "会議", "content": "1", "slug": "kaigi-1"}, {"title": "会議", "content": "2"},
+                {"title": "会議", "content": "3"}, {"title": "x", "content": "4", "slug": "kaigi-3"}]
+        body = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows).encode()
+        res = self.client.post("/api/memo/import/", body, content_type="application/x-ndjson")
+        self.assertEqual(res.data["imported"], 4)
+        slugs = dict(Memo.objects.filter(user=self.user).values_list("content", "slug"))
+        self.assertEqual(slugs, {"1": "kaigi-1", "2": "kaigi", "3": "kaigi-4", "4": "kaigi-3"})
+
+    def test_import_non_string_timestamp(self):
+        # 文字列でない日時はその行だけエラーにして、ほかの行はインポートする
+        rows = [{"title": "a", "content": "1", "created_at": 123}, {"title": "b", "content": "2", "updated_at": True},
+                {"title": "c", "content": "3"}]
+        body = "\n".join(json.dumps(row) for row in rows).encode()
+        res = self.client.post("/api/memo/import/", body, content_type="application/x-ndjson")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["imported"], 1)
+        self.assertEqual([error["row"] for error in res.data["errors"]], [1, 2])
+        self.assertIn("created_at", res.data["errors"][0]["errors"]["non_field_errors"][0])
+
+    def test_import_without_login(self):
+        self.client.logout()
+        res = self.client.post("/api/memo/import/", b"{}", content_type="application/x-ndjson")
+        self.assertIn(res.status_code, [401, 403])
@@ -0,0 +1,126 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo import metrics
+
+
+def sample(text, name, **labels):
+    """テキスト形式からnameのサンプルの値を返す(なければNone)"""
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = re.escape(name + (f"{{{label_text}}}" if labels else "")) + r" ([0-9.e+-]+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+@override_settings(MEMO_METRICS=True, MEMO_METRICS_DIR="")
+class TestMetricsEndpoint(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.force_login(self.user)
+
+    def scrape(self):
+        res = self.client.get("/metrics")
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return res.content.decode()
+
+    def test_request_histograms(self):
+        before = sample(self.scrape(), "memo_http_request_duration_seconds_count", view="memo:memo") or 0
+        self.client.get(reverse("memo:memo"))
+        self.client.get("/api/memo/")
+        text = self.scrape()
+        self.assertEqual(sample(text, "memo_http_request_duration_seconds_count", view="memo:memo"), before + 1)
+        self.assertIsNotNone(sample(text, "memo_http_request_duration_seconds_count", view="memo-list"))
+        self.assertIsNotNone(
+            sample(text, "memo_http_request_duration_seconds_bucket", view="memo:memo", le="+Inf")
+        )
+        self.assertIsNotNone(sample(text, "memo_db_queries_per_request_sum", view="memo:memo"))
+        self.assertIsNotNone(
+            sample(text, "memo_http_requests_total", method="GET", status="200", view="memo:memo")
+        )
+        self.assertIn("# TYPE memo_http_request_duration_seconds histogram", text)
+        self.assertIsNotNone(sample(text, "memo_list_cache_hit_ratio"))
+
+    def test_memo_and_slug_counters(self):
+        text = self.scrape()
+        created = sample(text, "memo_memos_created_total") or 0
+        taken = sample(text, "memo_slug_collisions_total", reason="taken") or 0
+        self.client.post("/api/memo/", {"title": "会議", "content": "内容"}, format="json")
+        self.client.post("/api/memo/", {"title": "会議", "content": "内容"}, format="json")
+        self.client.post("/api/memo/bulk/", [{"title": "会議", "content": "内容"}], format="json")
+        text = self.scrape()
+        self.assertEqual(sample(text, "memo_memos_created_total"), created + 3)
+        self.assertEqual(sample(text, "memo_slug_collisions_total", reason="taken"), taken + 2)
+        self.assertIsNotNone(sample(text, "memo_romaji_conversions_total"))
+
+    @override_settings(MEMO_METRICS=False)
+    def test_disabled(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+
+class TestMetricsAggregation(TestCase):
+    def test_files_of_other_workers_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEMO_METRICS_DIR=directory):
+            registry = metrics.Registry()
+            registry.inc("memo_memos_created_total", 5)
+            registry.observe("memo_http_request_duration_seconds", 0.02, view="memo:memo")
+            other = registry.snapshot()
+            # 別のワーカーが書き出したファイル
+            with open(os.path.join(directory, "999999.json"), "w", encoding="utf-8") as f:
+                json.dump(other, f)
+            before = sample(metrics.render(), "memo_memos_created_total") or 0
+            metrics.inc("memo_memos_created_total")
+            text = metrics.render()
+        self.assertEqual(sample(text, "memo_memos_created_total"), before + 1)
+        self.assertGreaterEqual(before, 5)
+        self.assertEqual(
+            sample(text, "memo_http_request_duration_seconds_bucket", view="memo:memo", le="0.025"),
+            sample(text, "memo_http_request_duration_seconds_bucket", view="memo:memo", le="0.01") + 1,
+        )
+
+    @unittest.skipUnless(os.name == "posix", "プロセスが動いているかはPOSIXでだけ調べる")
+    def test_pool_gauges_of_live_workers_are_summed(self):
+        pool = [["alias", "default"]]
+        snapshot = {
+            "counters": [["memo_db_pool_wait_seconds_total", pool, 0.5]],
+            "histograms": [],
+            "gauges": [["memo_db_pool_in_use", pool, 3], ["memo_db_pool_idle", pool, 1]],
+        }
+        # 終了したワーカーのpid
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEMO_METRICS_DIR=directory):
+            for pid in (os.getppid(), process.pid):
+                with open(os.path.join(directory, f"{pid}.json"), "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f)
+            text = metrics.render()
+        self.assertIn("# TYPE memo_db_pool_in_use gauge", text)
+        # ゲージは動いているワーカーの分だけ、カウンターは終了したワーカーの分も合計する
+        self.assertEqual(sample(text, "memo_db_pool_in_use", alias="default"), 3)
+        self.assertEqual(sample(text, "memo_db_pool_idle", alias="default"), 1)
+        self.assertEqual(sample(text, "memo_db_pool_wait_seconds_total", alias="default"), 1.0)
+
+    @unittest.skipUnless(
+        connection.settings_dict.get("OPTIONS", {}).get("pool"), "PostgreSQLで DB_POOL=True のときだけ実行する"
+    )
+    def test_pool_stats(self):
+        connection.ensure_connection()
+        text = metrics.render()
+        self.assertGreaterEqual(sample(text, "memo_db_pool_size", alias="default"), 1)
+        self.assertGreaterEqual(sample(text, "memo_db_pool_in_use", alias="default"), 1)
+        self.assertIsNotNone(sample(text, "memo_db_pool_requests_total", alias="default"))
+
+    def test_label_escaping(self):
+        self.assertEqual(metrics._labels((("view", 'a"b\\c'),)), '{view="a\\"b\\\\c"}')
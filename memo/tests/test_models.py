@@ -0,0 +1,166 @@
+import os
+import subprocess
+import sys
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from memo import metrics
+from memo.models import Memo, generate_slugs, next_slug, romaji_cache_stats, to_romaji
+
+
+class TestMemoSlug(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="test", password="password")
+
+    def create(self, title="会議メモ"):
+        return Memo.objects.create(title=title, content="content", user=self.user)
+
+    def test_slug_number_is_max_plus_one(self):
+        self.create()
+        self.create()
+        third = self.create()
+        self.assertEqual(third.slug, "kaigimemo-2")
+        # 途中の番号が消えても最大の番号の次になる
+        Memo.objects.filter(slug="kaigimemo-1").delete()
+        self.assertEqual(self.create().slug, "kaigimemo-3")
+
+    def test_slug_ignores_other_users_and_prefix_only_matches(self):
+        User = get_user_model()
+        other = User.objects.create_user(username="other", password="password")
+        Memo.objects.create(title="会議メモ", content="content", user=other)
+        # "kaigimemoxyz"は"kaigimemo"の連番ではない
+        Memo.objects.create(title="kaigimemoxyz", content="content", user=self.user)
+        self.assertEqual(self.create().slug, "kaigimemo")
+        self.assertEqual(self.create().slug, "kaigimemo-1")
+
+    def test_query_count_does_not_grow_with_collisions(self):
+        # 重複が何件あってもslugの割り当てに使うクエリ数は一定
+        counts = []
+        for i in range(30):
+            with CaptureQueriesContext(connection) as ctx:
+                self.create()
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(len(set(counts[1:])), 1)
+        self.assertEqual(Memo.objects.filter(user=self.user).values("slug").distinct().count(), 30)
+
+    def test_unique_constraint(self):
+        memo = self.create()
+        with self.assertRaises(IntegrityError):
+            Memo.objects.bulk_create([Memo(title="x", content="x", user=self.user, slug=memo.slug)])
+
+    def test_retry_when_slug_is_taken_concurrently(self):
+        self.create()
+        # 別のリクエストが同じslugを先に保存した状況を再現する
+        with mock.patch("memo.models.next_slug", side_effect=["kaigimemo", "kaigimemo-1"]) as patched:
+            memo = self.create()
+        self.assertEqual(patched.call_count, 2)
+        self.assertEqual(memo.slug, "kaigimemo-1")
+
+    def test_next_slug_excludes_self(self):
+        memo = self.create()
+        self.assertEqual(next_slug(self.user.id, "kaigimemo", exclude_pk=memo.pk), "kaigimemo")
+
+
+class TestMemoChangedFields(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="test", password="password")
+        self.memo = Memo.objects.create(title="会議", content="長い内容" * 100, user=self.user)
+
+    def updates(self, memo):
+        with CaptureQueriesContext(connection) as ctx:
+            memo.save()
+        return [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "memo_memo" ')]
+
+    def test_only_changed_columns_are_written(self):
+        memo = Memo.objects.get(pk=self.memo.pk)
+        memo.priority = 3
+        updates = self.updates(memo)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"priority"', updates[0])
+        self.assertIn('"updated_at"', updates[0])
+        self.assertNotIn('"content"', updates[0])
+        memo.refresh_from_db()
+        self.assertEqual(memo.priority, 3)
+        self.assertGreater(memo.updated_at, self.memo.updated_at)
+
+    def test_unchanged_save_is_skipped(self):
+        key = ("memo_saves_skipped_total", ())
+        before = metrics.registry.counters.get(key, 0)
+        memo = Memo.objects.get(pk=self.memo.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            memo.save()
+        self.assertEqual(ctx.captured_queries, [])
+        # 同じ値を入れ直しても書き込まない
+        memo.title = "会議"
+        memo.save()
+        # 保存したあとは、その値と比べる
+        memo.content = "短い内容"
+        self.assertEqual(len(self.updates(memo)), 1)
+        self.assertEqual(self.updates(memo), [])
+        self.assertEqual(metrics.registry.counters[key], before + 3)
+        self.assertEqual(Memo.objects.get(pk=memo.pk).updated_at, memo.updated_at)
+
+    def test_deferred_content_is_not_written(self):
+        memo = Memo.objects.defer("content").get(pk=self.memo.pk)
+        self.assertTrue(memo.content.startswith("長い内容"))
+        memo.category = "work"
+        updates = self.updates(memo)
+        self.assertNotIn('"content"', updates[0])
+
+    def test_edit_view_without_changes(self):
+        self.client.force_login(self.user)
+        url = reverse("memo:edit", kwargs={"slug": self.memo.slug})
+        data = {"title": "会議", "content": self.memo.content, "category": "personal", "priority": 2}
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(url, data)
+        self.assertEqual(res.status_code, 302)
+        self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith("UPDATE \"memo_memo\"")])
+
+
+class TestRomajiCache(TestCase):
+    def setUp(self):
+        to_romaji.cache_clear()
+
+    def test_cache_hit(self):
+        with mock.patch("memo.models.get_kakasi") as get_kakasi:
+            kks = get_kakasi.return_value
+            kks.convert.return_value = [{"hepburn": "gijiroku"}]
+            self.assertEqual(to_romaji("議事録"), "gijiroku")
+            self.assertEqual(to_romaji("議事録"), "gijiroku")
+        # 2回目はpykakasiを呼ばない
+        self.assertEqual(kks.convert.call_count, 1)
+        stats = romaji_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+    def test_generate_slugs(self):
+        self.assertEqual(
+            generate_slugs(["会議", "買い物", "会議", "", "TODO"], 3),
+            ["kaigi", "kaimono", "kaigi", "memo-3", "todo"],
+        )
+        # 同じタイトルは1回だけ変換する
+        self.assertEqual(romaji_cache_stats()["misses"], 4)
+
+
+class TestKakasiLazyLoad(SimpleTestCase):
+    def setup_loads_pykakasi(self, warmup):
+        """新しいプロセスでdjango.setup()したあとにpykakasiが読み込まれているか"""
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="my_memo.settings", MEMO_KAKASI_WARMUP=str(warmup))
+        env.setdefault("SECRET_KEY", "test")
+        out = subprocess.run(
+            [sys.executable, "-c", "import sys, django; django.setup(); print('pykakasi' in sys.modules)"],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip() == "True"
+
+    def test_not_loaded_on_setup(self):
+        self.assertFalse(self.setup_loads_pykakasi(False))
+
+    def test_loaded_with_warmup(self):
+        self.assertTrue(self.setup_loads_pykakasi(True))
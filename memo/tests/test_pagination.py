@@ -0,0 +1,136 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.models import Memo
+from memo.pagination import encode_cursor, decode_cursor, paginate_keyset, InvalidCursor
+
+
+def create_memos(user, count, **kwargs):
+    return [
+        Memo.objects.create(title=f"title_{i}", content="message", user=user, priority=i % 3 + 1, **kwargs)
+        for i in range(count)
+    ]
+
+
+class TestKeysetPaginate(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="test", password="password")
+        create_memos(self.user, 23)
+        self.expected = list(Memo.objects.for_user(self.user).ordered())
+
+    def walk(self, page_size, orphans=0):
+        pages = []
+        page = paginate_keyset(Memo.objects.for_user(self.user), None, page_size, orphans)
+        pages.append(list(page))
+        while page.has_next():
+            page = paginate_keyset(Memo.objects.for_user(self.user), page.next_cursor, page_size, orphans)
+            pages.append(list(page))
+        return pages, page
+
+    def test_forward_covers_all_rows_in_order(self):
+        pages, _ = self.walk(5)
+        self.assertEqual([len(p) for p in pages], [5, 5, 5, 5, 3])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_orphans(self):
+        pages, _ = self.walk(10, orphans=3)
+        self.assertEqual([len(p) for p in pages], [10, 13])
+
+    def test_backward(self):
+        pages, last = self.walk(5)
+        page = last
+        backward = []
+        while page.has_previous():
+            page = paginate_keyset(Memo.objects.for_user(self.user), page.previous_cursor, 5)
+            backward.append(list(page))
+        self.assertEqual(backward, pages[-2::-1])
+
+    def test_cursor_round_trip(self):
+        memo = self.expected[3]
+        position, reverse = decode_cursor(encode_cursor(memo, reverse=True))
+        self.assertEqual(position, (memo.priority, memo.updated_at, memo.created_at, memo.pk))
+        self.assertTrue(reverse)
+        with self.assertRaises(InvalidCursor):
+            decode_cursor("invalid")
+
+    def test_query_count_is_same_for_deep_pages(self):
+        # 何ページ目でも1クエリで取得できる
+        _, last = self.walk(5)
+        with CaptureQueriesContext(connection) as ctx:
+            paginate_keyset(Memo.objects.for_user(self.user), last.previous_cursor, 5)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn("COUNT", ctx.captured_queries[0]["sql"])
+        self.assertNotIn("OFFSET", ctx.captured_queries[0]["sql"])
+
+
+@override_settings(MEMO_CURSOR_PAGINATION=True)
+class TestMemoListCursor(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="test", nickname="nickname", password="password")
+        self.client.login(username="test", password="password")
+        for i in range(20):
+            Memo.objects.create(title=f"title_{i}", content="message", user=self.user)
+
+    def test_get_with_cursor(self):
+        res1 = self.client.get(reverse("memo:memo"))
+        self.assertTemplateUsed(res1, "memo.html")
+        self.assertEqual(len(res1.context["page_obj"]), 9)
+        next_cursor = res1.context["page_obj"].next_cursor
+        self.assertContains(res1, f"cursor={next_cursor}")
+        # paginate_orphans = 2 から2ページ目に残りの11個が表示される
+        res2 = self.client.get(reverse("memo:memo"), data={"cursor": next_cursor})
+        title_list2 = [memo.title for memo in res2.context["object_list"]]
+        self.assertEqual(len(title_list2), 11)
+        self.assertIn("title_0", title_list2)
+        self.assertFalse(res2.context["page_obj"].has_next())
+
+    def test_get_with_invalid_cursor(self):
+        # 不正なcursorのときは1ページ目を表示
+        res = self.client.get(reverse("memo:memo"), data={"cursor": "invalid"})
+        title_list = [memo.title for memo in res.context["object_list"]]
+        self.assertEqual(len(title_list), 9)
+        self.assertIn("title_19", title_list)
+
+    def test_get_by_category(self):
+        Memo.objects.create(title="work", category="work", content="message", user=self.user)
+        res = self.client.get(reverse("memo:memo"), data={"category": "work"})
+        self.assertEqual([memo.title for memo in res.context["object_list"]], ["work"])
+
+
+@override_settings(MEMO_CURSOR_PAGINATION=True)
+class TestMemoAPICursor(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.login(username="user", password="password")
+        for i in range(6):
+            Memo.objects.create(user=self.user, title=f"test_title_{i}", content="test_content")
+
+    def test_get_memo_cursor(self):
+        res = self.client.get("/api/memo/")
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("count", res.data)
+        self.assertEqual(len(res.data["results"]), 5)
+        self.assertEqual(res.data["results"][0]["title"], "test_title_5")
+        self.assertIsNone(res.data["previous"])
+        res2 = self.client.get(res.data["next"])
+        self.assertEqual([m["title"] for m in res2.data["results"]], ["test_title_0"])
+        self.assertIsNone(res2.data["next"])
+        res3 = self.client.get(res2.data["previous"])
+        self.assertEqual(res3.data["results"], res.data["results"])
+
+    def test_get_memo_invalid_cursor(self):
+        res = self.client.get("/api/memo/", data={"cursor": "invalid"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["results"][0]["title"], "test_title_5")
+
+    def test_get_memo_by_category(self):
+        Memo.objects.create(user=self.user, title="work", category="work", content="test_content")
+        res = self.client.get("/api/memo/", data={"category": "work"})
+        self.assertEqual([m["title"] for m in res.data["results"]], ["work"])
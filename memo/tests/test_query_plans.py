@@ -0,0 +1,73 @@
+from django.test import TestCase
+from django.db import connection
+from django.contrib.auth import get_user_model
+
+from memo.models import Memo
+from memo.pagination import keyset_filter
+
+
+class TestMemoQueryPlans(TestCase):
+    """一覧、詳細、APIのクエリがインデックスを使い、ソートをしないことをEXPLAINで確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(username="test", password="password")
+        other = User.objects.create_user(username="other", password="password")
+        categories = [value for value, _ in Memo.CATEGORY]
+        memos = []
+        for user in (cls.user, other):
+            for i in range(200):
+                memos.append(Memo(
+                    user=user, title=f"title_{i}", slug=f"title-{i}", content="content",
+                    category=categories[i % len(categories)], priority=i % 3 + 1,
+                ))
+        Memo.objects.bulk_create(memos)
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE memo_memo")
+                # 行数が少ないとseq scanが選ばれるので、インデックスが使えるかどうかを見る
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        elif connection.vendor != "sqlite":
+            self.skipTest(f"{connection.vendor} のEXPLAINには対応していません")
+
+    def assertUsesIndexWithoutSort(self, qs, index_name):
+        plan = qs.explain()
+        if connection.vendor == "sqlite":
+            # SQLiteはソートが必要なとき "USE TEMP B-TREE FOR ORDER BY" を出力する
+            self.assertIn(f"USING INDEX {index_name}", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+        else:
+            self.assertIn(index_name, plan)
+            self.assertNotIn("Sort", plan)
+
+    def ordered(self, qs):
+        return qs.ordered()
+
+    def test_list(self):
+        qs = self.ordered(Memo.objects.filter(user=self.user))
+        self.assertUsesIndexWithoutSort(qs, "memo_user_order_idx")
+        # 2ページ目以降(OFFSET付き)も同じ
+        self.assertUsesIndexWithoutSort(qs[9:18], "memo_user_order_idx")
+
+    def test_list_with_cursor(self):
+        # カーソルの位置からインデックスを読み始める
+        memo = self.ordered(Memo.objects.filter(user=self.user))[100]
+        position = (memo.priority, memo.updated_at, memo.created_at, memo.pk)
+        qs = self.ordered(Memo.objects.filter(user=self.user).filter(keyset_filter(position)))
+        self.assertUsesIndexWithoutSort(qs, "memo_user_order_idx")
+        self.assertUsesIndexWithoutSort(qs.reverse(), "memo_user_order_idx")
+
+    def test_list_by_category(self):
+        qs = self.ordered(Memo.objects.filter(user=self.user, category="work"))
+        self.assertUsesIndexWithoutSort(qs, "memo_user_category_order_idx")
+
+    def test_detail_by_slug(self):
+        plan = Memo.objects.filter(user=self.user, slug="title-1").explain()
+        if connection.vendor == "sqlite":
+            # ユニーク制約のインデックスはSQLiteでは自動生成の名前になる
+            self.assertIn("USING INDEX sqlite_autoindex_memo_memo", plan)
+        else:
+            self.assertIn("memo_unique_user_slug", plan)
@@ -0,0 +1,103 @@
+import unittest
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from memo import routers
+from memo.models import Memo
+
+
+@override_settings(MEMO_REPLICAS=["replica1"])
+class TestReplicaRouter(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.token = routers.start_request()
+        self.addCleanup(routers.end_request, self.token)
+
+    def test_reads_from_replica_only_when_requested(self):
+        self.assertIsNone(self.router.db_for_read(Memo))
+        routers.current_state().replica = True
+        self.assertEqual(self.router.db_for_read(Memo), "replica1")
+        # セッションやユーザーはプライマリ
+        self.assertIsNone(self.router.db_for_read(get_user_model()))
+
+    def test_write_switches_to_primary(self):
+        routers.current_state().replica = True
+        self.assertEqual(self.router.db_for_write(Memo), "default")
+        self.assertIsNone(self.router.db_for_read(Memo))
+        self.assertTrue(routers.current_state().wrote)
+
+    def test_pin_is_carried_in_signed_cookie(self):
+        # 共有のキャッシュがなくても、ほかのワーカーはクッキーで書き込んだあとだと分かる
+        response = HttpResponse()
+        routers.pin_to_primary(1, response)
+        cache.clear()
+        cookie = response.cookies[routers.PIN_COOKIE]
+        request = RequestFactory().get("/", HTTP_COOKIE=f"{routers.PIN_COOKIE}={cookie.value}")
+        self.assertTrue(routers.is_pinned(1, request))
+        self.assertFalse(routers.is_pinned(2, request))
+        self.assertFalse(routers.is_pinned(1))
+        forged = RequestFactory().get("/", HTTP_COOKIE=f"{routers.PIN_COOKIE}=1")
+        self.assertFalse(routers.is_pinned(1, forged))
+
+    def test_no_migrations_on_replica(self):
+        self.assertFalse(self.router.allow_migrate("replica1", "memo"))
+        self.assertIsNone(self.router.allow_migrate("default", "memo"))
+
+
+@unittest.skipUnless(settings.MEMO_REPLICAS, "DB_REPLICA_NAMES を設定したときだけ実行する")
+class TestReplicaRouting(TransactionTestCase):
+    """DB_REPLICA_NAMES=replica.sqlite3 のように設定して、このモジュールだけを実行する
+
+    テストではレプリカはプライマリのミラーになる。SQLiteではトランザクション中のテーブルを
+    ほかの接続から読めないので、TransactionTestCaseにする。
+    """
+    databases = {"default", *settings.MEMO_REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="user", password="password")
+        self.client.force_login(self.user)
+        self.memo = Memo.objects.create(title="会議", content="内容", user=self.user)
+
+    def replica_queries(self, method, url, data=None):
+        contexts = [CaptureQueriesContext(connections[alias]) for alias in settings.MEMO_REPLICAS]
+        for ctx in contexts:
+            ctx.__enter__()
+        try:
+            res = getattr(self.client, method)(url, data)
+        finally:
+            for ctx in contexts:
+                ctx.__exit__(None, None, None)
+        return res, [q["sql"] for ctx in contexts for q in ctx.captured_queries]
+
+    def test_get_reads_from_replica(self):
+        res, queries = self.replica_queries("get", reverse("memo:memo"))
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(any("memo_memo" in sql for sql in queries))
+        # セッションとユーザーはプライマリ
+        self.assertFalse(any("django_session" in sql for sql in queries))
+        _, queries = self.replica_queries("get", f"/api/memo/{self.memo.pk}/")
+        self.assertTrue(queries)
+
+    def test_reads_stick_to_primary_after_write(self):
+        res, queries = self.replica_queries(
+            "post", reverse("memo:create"), {"title": "買い物", "content": "牛乳", "category": "work", "priority": 2}
+        )
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(queries, [])
+        _, queries = self.replica_queries("get", reverse("memo:memo"))
+        self.assertEqual(queries, [])
+        # 書き込んだリクエストのレスポンスで、ほかのワーカーにも分かるようにクッキーで記録している
+        self.assertIn(routers.PIN_COOKIE, res.cookies)
+        # 一覧のキャッシュとプライマリへの固定の記録を消す
+        cache.clear()
+        del self.client.cookies[routers.PIN_COOKIE]
+        _, queries = self.replica_queries("get", reverse("memo:memo"))
+        self.assertTrue(queries)
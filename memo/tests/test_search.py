@@ -0,0 +1,120 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.models import Memo
+from memo.search import search_memos, build_document
+
+
+class TestSearchMemos(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="test", password="password")
+        self.meeting = Memo.objects.create(title="会議メモ", content="来週の予定を決める", user=self.user)
+        self.shopping = Memo.objects.create(title="買い物", content="牛乳と卵 Milk", user=self.user)
+
+    def search(self, query):
+        return list(search_memos(Memo.objects.for_user(self.user), self.user, query))
+
+    def test_kanji_kana_romaji(self):
+        # 漢字、ひらがな、カタカナ、ローマ字のどれでも見つかる
+        for query in ["会議", "かいぎ", "カイギ", "kaigi", "KAIGI", "メモ", "予定"]:
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [self.meeting])
+
+    def test_english_prefix_and_single_kanji(self):
+        self.assertEqual(self.search("mil"), [self.shopping])
+        self.assertEqual(self.search("卵"), [self.shopping])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search("会議 牛乳"), [])
+        self.assertEqual(self.search("買い物 牛乳"), [self.shopping])
+
+    def test_ranked(self):
+        many = Memo.objects.create(title="会議", content="会議 会議 会議の議事録", user=self.user)
+        self.assertEqual(self.search("会議"), [many, self.meeting])
+
+    def test_index_follows_update_and_delete(self):
+        self.meeting.content = "打ち合わせ"
+        self.meeting.save()
+        self.assertEqual(self.search("予定"), [])
+        self.assertEqual(self.search("打ち合わせ"), [self.meeting])
+        self.meeting.delete()
+        self.assertEqual(self.search("会議"), [])
+
+    def test_other_users_memo_is_not_found(self):
+        User = get_user_model()
+        other = User.objects.create_user(username="other", password="password")
+        Memo.objects.create(title="会議", content="other", user=other)
+        self.assertEqual(self.search("会議"), [self.meeting])
+        # user_idの列は検索語と照合しない
+        self.assertEqual(self.search(str(self.user.pk)), [])
+
+    def test_filter_beyond_limit(self):
+        # 関連度の上位limit件に入らないメモも、querysetの条件に合えば返す
+        for _ in range(3):
+            Memo.objects.create(title="会議", content="会議 会議", category="work", user=self.user)
+        study = Memo.objects.create(title="予定", content="来月の会議 " + "予定 " * 50, category="study", user=self.user)
+        top = list(search_memos(Memo.objects.for_user(self.user), self.user, "会議", limit=2))
+        self.assertNotIn(study, top)
+        qs = Memo.objects.for_user(self.user).filter(category="study")
+        self.assertEqual(list(search_memos(qs, self.user, "会議", limit=2)), [study])
+
+    def test_symbols_only(self):
+        self.assertEqual(self.search("!!!"), [])
+
+    def test_build_document(self):
+        document = build_document("会議", "").split()
+        self.assertIn("会議", document)
+        self.assertIn("かい", document)
+        self.assertIn("kaigi", document)
+
+
+class TestMemoListSearch(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="test", nickname="nickname", password="password")
+        self.client.login(username="test", password="password")
+        self.memo1 = Memo.objects.create(title="会議メモ", category="work", content="予定", user=self.user)
+        self.memo2 = Memo.objects.create(title="会議", category="personal", content="予定", user=self.user)
+
+    def test_get_with_q(self):
+        res = self.client.get(reverse("memo:memo"), data={"q": "kaigimemo"})
+        self.assertEqual(list(res.context["object_list"]), [])
+        res = self.client.get(reverse("memo:memo"), data={"q": "かいぎ"})
+        self.assertEqual(len(res.context["object_list"]), 2)
+
+    def test_get_with_q_and_category(self):
+        res = self.client.get(reverse("memo:memo"), data={"q": "会議", "category": "work"})
+        self.assertEqual(list(res.context["object_list"]), [self.memo1])
+
+    def test_page_links_keep_q_and_category(self):
+        for i in range(12):
+            Memo.objects.create(title=f"会議{i}", category="work", content="予定", user=self.user)
+        res = self.client.get(reverse("memo:memo"), data={"q": "会議", "category": "work"})
+        self.assertContains(res, "?q=%E4%BC%9A%E8%AD%B0&amp;category=work&amp;page=2")
+
+
+class TestMemoAPISearch(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.login(username="user", password="password")
+        self.memo = Memo.objects.create(user=self.user, title="議事録", content="content")
+
+    def test_search(self):
+        res = self.client.get("/api/memo/search/", data={"q": "gijiroku"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["count"], 1)
+        self.assertEqual(res.data["results"][0]["id"], self.memo.pk)
+
+    def test_search_without_q(self):
+        res = self.client.get("/api/memo/search/")
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("q", res.data)
+
+    def test_search_without_login(self):
+        self.client.logout()
+        res = self.client.get("/api/memo/search/", data={"q": "gijiroku"})
+        self.assertIn(res.status_code, [401, 403])
@@ -0,0 +1,36 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from memo.models import Memo
+
+
+class TestSeedMemos(TestCase):
+    def seed(self, *args):
+        call_command("seed_memos", *args, stdout=io.StringIO())
+
+    def test_seed(self):
+        self.seed("--users", "2", "--memos-per-user", "30", "--batch-size", "7")
+        User = get_user_model()
+        self.assertEqual(list(User.objects.values_list("username", flat=True).order_by("username")), ["seed0000", "seed0001"])
+        user = User.objects.get(username="seed0000")
+        self.assertTrue(self.client.login(username="seed0000", password="password"))
+        memos = Memo.objects.filter(user=user)
+        self.assertEqual(memos.count(), 30)
+        # 作成日時は1年の範囲に散らばる
+        self.assertGreater(memos.values("created_at").distinct().count(), 1)
+        self.assertEqual(memos.values("slug").distinct().count(), 30)
+        # 2回目はユーザーを作らずにメモを追加する
+        self.seed("--users", "1", "--memos-per-user", "5")
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(memos.count(), 35)
+
+    def test_reproducible(self):
+        self.seed("--users", "1", "--memos-per-user", "20", "--prefix", "a", "--seed", "1")
+        self.seed("--users", "1", "--memos-per-user", "20", "--prefix", "b", "--seed", "1")
+        fields = ("title", "content", "category", "priority")
+        a = list(Memo.objects.filter(user__username="a0000").order_by("pk").values_list(*fields))
+        b = list(Memo.objects.filter(user__username="b0000").order_by("pk").values_list(*fields))
+        self.assertEqual(a, b)
@@ -0,0 +1,150 @@
+import unittest
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo import routers, sharding
+from memo.bulk import bulk_delete_memos
+from memo.models import Memo, MemoCounter, MemoTombstone
+from memo.stats import count_memos, stored_counts
+
+
+@override_settings(MEMO_SHARDS=["default", "shard1"])
+class TestShardPlacement(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="user", password="password")
+
+    def test_new_users_are_assigned(self):
+        self.assertEqual(sharding.shard_for(self.user), sharding.initial_shard(self.user))
+        sharding.assign(self.user, "shard1")
+        self.assertEqual(sharding.shard_for(self.user.pk), "shard1")
+        # キャッシュが消えても記録から読む
+        cache.clear()
+        self.assertEqual(sharding.shard_for(self.user), "shard1")
+
+    def test_router(self):
+        router = routers.ShardRouter()
+        sharding.assign(self.user, "shard1")
+        memo = Memo(user=self.user, title="会議")
+        self.assertEqual(router.db_for_write(Memo, instance=memo), "shard1")
+        self.assertEqual(router.db_for_read(MemoCounter, instance=self.user), "shard1")
+        # ユーザーやシャードの記録は default
+        self.assertEqual(router.db_for_read(get_user_model(), instance=memo), "default")
+        self.assertEqual(router.db_for_write(sharding.UserShard, instance=self.user.usershard), "default")
+        sharding.assign(self.user, "shard1", moving=True)
+        with self.assertRaises(sharding.ShardMoving):
+            router.db_for_write(Memo, instance=memo)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_writes_reread_placement_without_shared_cache(self):
+        sharding.assign(self.user, "shard1")
+        # 他のワーカーが移動を始めても、このワーカーのキャッシュは変わらない
+        sharding.UserShard.objects.filter(user=self.user).update(moving=True)
+        self.assertEqual(sharding.shard_for(self.user), "shard1")
+        with self.assertRaises(sharding.ShardMoving):
+            sharding.shard_for_write(self.user)
+        with self.assertRaises(sharding.ShardMoving):
+            bulk_delete_memos(self.user, [1])
+
+    @override_settings(CACHE_SHARED=True)
+    def test_writes_use_shared_cache(self):
+        sharding.assign(self.user, "shard1")
+        with self.assertNumQueries(0):
+            self.assertEqual(sharding.shard_for_write(self.user), "shard1")
+
+    @override_settings(MEMO_SHARDS=[])
+    def test_not_sharded(self):
+        self.assertEqual(sharding.shard_for(self.user), "default")
+        self.assertIsNone(Memo.objects.for_user(self.user)._db)
+
+
+@unittest.skipUnless(settings.MEMO_SHARDS, "DB_SHARD_NAMES を設定したときだけ実行する")
+@override_settings(CACHE_SHARED=True)
+class TestSharding(APITestCase):
+    """DB_SHARD_NAMES=shard1.sqlite3,shard2.sqlite3 のように2つ以上設定して、このモジュールだけを実行する"""
+    databases = set(settings.MEMO_SHARDS)
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="user", password="password")
+        sharding.assign(self.user, "shard1")
+        self.client.force_login(self.user)
+
+    def create_memos(self):
+        self.client.post("/api/memo/", {"title": "会議", "content": "内容", "category": "work"}, format="json")
+        self.client.post(reverse("memo:create"), {"title": "会議", "content": "内容", "category": "work", "priority": 2})
+        self.client.post("/api/memo/bulk/", [{"title": "買い物", "content": "牛乳"}], format="json")
+        return list(Memo.objects.using("shard1").filter(user=self.user).order_by("pk"))
+
+    def test_memos_are_stored_on_user_shard(self):
+        memos = self.create_memos()
+        self.assertEqual(len(memos), 3)
+        self.assertFalse(Memo.objects.using("default").filter(user=self.user).exists())
+        self.assertEqual([memo.slug for memo in memos], ["kaigi", "kaigi-1", "kaimono"])
+        # シャードごとにidの範囲が違う
+        self.assertTrue(all(memo.pk >= sharding.SHARD_ID_SPAN for memo in memos))
+        res = self.client.get(reverse("memo:memo") + "?q=会議")
+        self.assertContains(res, "kaigi-1")
+        self.assertEqual(self.client.get(f"/api/memo/{memos[0].pk}/").data["slug"], "kaigi")
+        self.assertEqual(self.client.get("/api/memo/stats/").data["category"]["work"], 2)
+        self.assertEqual(stored_counts(self.user.pk), count_memos(self.user.pk))
+        self.client.delete(f"/api/memo/{memos[0].pk}/")
+        self.assertTrue(MemoTombstone.objects.using("shard1").filter(memo_id=memos[0].pk).exists())
+        res = self.client.get("/api/memo/changes/")
+        self.assertEqual([item["deleted"] for item in res.data["results"]], [False, False, True])
+
+    def test_move_user(self):
+        memos = self.create_memos()
+        self.client.delete(f"/api/memo/{memos[0].pk}/")
+        cursor = self.client.get("/api/memo/changes/").data["next_cursor"]
+        out = StringIO()
+        call_command("move_user_shard", "user", "shard2", "--grace", "0", stdout=out)
+        self.assertIn("2件のメモを shard1 から shard2 に移しました", out.getvalue())
+        self.assertEqual(sharding.shard_for(self.user), "shard2")
+        self.assertFalse(Memo.objects.using("shard1").filter(user=self.user).exists())
+        self.assertFalse(MemoCounter.objects.using("shard1").filter(user=self.user).exists())
+        moved = Memo.objects.using("shard2").get(pk=memos[1].pk)
+        self.assertEqual((moved.slug, moved.updated_at), (memos[1].slug, memos[1].updated_at))
+        self.assertEqual(stored_counts(self.user.pk), count_memos(self.user.pk))
+        # idも変更の取得の位置もそのまま使える
+        self.assertEqual(self.client.get(f"/api/memo/{memos[1].pk}/").status_code, 200)
+        self.assertEqual(self.client.get("/api/memo/changes/", {"cursor": cursor}).data["results"], [])
+        self.assertEqual(len(self.client.get("/api/memo/changes/").data["results"]), 3)
+        self.assertContains(self.client.get(reverse("memo:memo") + "?q=買い物"), "kaimono")
+        self.client.post("/api/memo/", {"title": "会議", "content": "内容"}, format="json")
+        self.assertEqual(Memo.objects.using("shard2").filter(user=self.user).count(), 3)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_move_user_without_shared_cache(self):
+        memos = self.create_memos()
+        with mock.patch("memo.sharding.time.sleep") as sleep:
+            sharding.move_user(self.user, "shard2", grace=0)
+        # 他のワーカーのキャッシュが切れるまで、元のシャードのメモを残す
+        sleep.assert_called_with(sharding.SHARD_CACHE_TIMEOUT)
+        self.assertEqual(sharding.shard_for_write(self.user), "shard2")
+        self.assertEqual(Memo.objects.using("shard2").filter(user=self.user).count(), len(memos))
+        self.assertFalse(Memo.objects.using("shard1").filter(user=self.user).exists())
+
+    def test_writes_are_rejected_while_moving(self):
+        self.create_memos()
+        sharding.assign(self.user, "shard1", moving=True)
+        res = self.client.post("/api/memo/", {"title": "会議", "content": "内容"}, format="json")
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res["Retry-After"], "5")
+        res = self.client.delete("/api/memo/bulk/", [1], format="json")
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(self.client.get(reverse("memo:memo")).status_code, 200)
+
+    def test_deleting_user_deletes_sharded_memos(self):
+        self.create_memos()
+        self.user.delete()
+        self.assertFalse(Memo.objects.using("shard1").exists())
+        self.assertFalse(MemoCounter.objects.using("shard1").exists())
@@ -0,0 +1,110 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.models import Memo, MemoCounter
+from memo.stats import count_memos, reconcile, stored_counts
+
+
+class TestMemoCounters(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.force_login(self.user)
+        Memo.objects.create(title="a", content="content", user=self.user, category="work", priority=1)
+        Memo.objects.create(title="b", content="content", user=self.user, category="work", priority=3)
+        Memo.objects.create(title="c", content="content", user=self.user, category="study")
+
+    def assertCountersMatch(self):
+        self.assertEqual(
+            {key: count for key, count in stored_counts(self.user.pk).get(self.user.pk, {}).items() if count},
+            count_memos(self.user.pk).get(self.user.pk, {}),
+        )
+
+    def test_stats_api(self):
+        res = self.client.get("/api/memo/stats/")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["total"], 3)
+        self.assertEqual(res.data["category"], {"work": 2, "personal": 0, "study": 1, "hobby": 0, "other": 0})
+        self.assertEqual(res.data["priority"], {1: 1, 2: 1, 3: 1})
+
+    def test_edit_moves_count(self):
+        memo = Memo.objects.get(title="a")
+        res = self.client.post(
+            reverse("memo:edit", kwargs={"slug": memo.slug}),
+            {"title": "a", "content": "content", "category": "hobby", "priority": 2},
+        )
+        self.assertEqual(res.status_code, 302)
+        self.assertCountersMatch()
+        # カテゴリー・重要度を変えない保存では件数を変更しない
+        memo = Memo.objects.get(title="a")
+        memo.content = "changed"
+        with CaptureQueriesContext(connection) as ctx:
+            memo.save()
+        self.assertFalse([q for q in ctx.captured_queries if "memo_memocounter" in q["sql"]])
+        self.assertCountersMatch()
+
+    def test_api_update_and_delete(self):
+        memo = Memo.objects.get(title="c")
+        self.client.patch(f"/api/memo/{memo.pk}/", {"category": "other", "priority": 3}, format="json")
+        self.assertCountersMatch()
+        self.client.delete(f"/api/memo/{memo.pk}/")
+        self.assertCountersMatch()
+        self.assertEqual(self.client.get("/api/memo/stats/").data["total"], 2)
+
+    def test_bulk_operations(self):
+        res = self.client.post(
+            "/api/memo/bulk/",
+            [{"title": "d", "content": "c", "category": "hobby"}, {"title": "e", "content": "c", "priority": 1}],
+            format="json",
+        )
+        ids = [result["data"]["id"] for result in res.data["results"]]
+        self.assertCountersMatch()
+        self.client.patch("/api/memo/bulk/", [{"id": ids[0], "category": "work"}], format="json")
+        self.assertCountersMatch()
+        self.client.delete("/api/memo/bulk/", ids, format="json")
+        self.assertCountersMatch()
+
+    def test_bulk_update_repeated_id(self):
+        memo = Memo.objects.create(title="d", content="content", user=self.user, category="personal")
+        res = self.client.patch(
+            "/api/memo/bulk/", [{"id": memo.pk, "category": "work"}, {"id": memo.pk, "category": "study"}], format="json"
+        )
+        self.assertEqual([result["status"] for result in res.data["results"]], [200, 400])
+        self.assertCountersMatch()
+        self.assertEqual(reconcile(self.user.pk, fix=False), [])
+
+    def test_list_page_shows_counts(self):
+        res = self.client.get(reverse("memo:memo"))
+        self.assertContains(res, "すべてのカテゴリー (3)")
+        self.assertContains(res, '<option value="work">仕事 (2)</option>', html=True)
+        # 表示しているカテゴリー以外のメモが増えても、件数が変わるので304にしない
+        url = reverse("memo:memo") + "?category=study"
+        etag = self.client.get(url)["ETag"]
+        Memo.objects.create(title="d", content="content", user=self.user, category="work")
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(res, '<option value="work">仕事 (3)</option>', html=True)
+
+    def test_reconcile_command(self):
+        MemoCounter.objects.filter(user=self.user, category="work", priority=1).update(count=5)
+        MemoCounter.objects.filter(user=self.user, category="study").delete()
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("reconcile_memo_counters", "--check", stdout=out)
+        self.assertIn("category=work priority=1 stored=5 actual=1", out.getvalue())
+        out = StringIO()
+        call_command("reconcile_memo_counters", "--user", "user", stdout=out)
+        self.assertIn("2件の件数を直しました", out.getvalue())
+        self.assertCountersMatch()
+        self.assertEqual(self.client.get("/api/memo/stats/").data["category"]["study"], 1)
+        out = StringIO()
+        call_command("reconcile_memo_counters", stdout=out)
+        self.assertIn("件数のずれはありません", out.getvalue())
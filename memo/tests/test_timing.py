@@ -0,0 +1,91 @@
+import re
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from memo.models import Memo
+from memo.timing import start_timings, stop_timings, timer
+
+
+def server_timing(res):
+    """Server-Timingヘッダーを {名前: ミリ秒} にする"""
+    return {
+        match.group(1): float(match.group(2))
+        for match in re.finditer(r"(\w+);dur=([0-9.]+)", res.headers["Server-Timing"])
+    }
+
+
+class TestTimer(TestCase):
+    def test_nested_timer_is_counted_once(self):
+        token = start_timings()
+        with timer("serializer"):
+            with timer("serializer"):
+                pass
+            with timer("slug"):
+                pass
+        timings = stop_timings(token)
+        self.assertEqual(set(timings.durations), {"serializer", "slug"})
+        self.assertGreaterEqual(timings.durations["serializer"], timings.durations["slug"])
+
+    def test_timer_without_request_does_nothing(self):
+        with timer("slug"):
+            pass
+
+
+@override_settings(MEMO_SERVER_TIMING=True, MEMO_SLOW_REQUEST_MS=10000)
+class TestServerTimingMiddleware(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.force_login(self.user)
+        self.memo = Memo.objects.create(title="会議", content="内容", user=self.user)
+
+    def test_list_page(self):
+        with self.assertLogs("memo.timing", "INFO") as logs:
+            res = self.client.get(reverse("memo:memo"))
+        timing = server_timing(res)
+        self.assertIn("total", timing)
+        self.assertIn("render", timing)
+        self.assertIn("db", timing)
+        self.assertRegex(res.headers["Server-Timing"], r'db;dur=[0-9.]+;desc="SQL \([1-9][0-9]* queries\)"')
+        self.assertIn("path=/ status=200", logs.output[0])
+        self.assertRegex(logs.output[0], r"db_queries=[1-9]")
+
+    def test_api_serializer_and_slug(self):
+        with self.assertLogs("memo.timing", "INFO"):
+            res = self.client.get("/api/memo/")
+        self.assertIn("serializer", server_timing(res))
+        with self.assertLogs("memo.timing", "INFO"):
+            res = self.client.post("/api/memo/", {"title": "買い物", "content": "牛乳"}, format="json")
+        self.assertEqual(res.status_code, 201)
+        timing = server_timing(res)
+        self.assertIn("serializer", timing)
+        self.assertIn("slug", timing)
+
+    @override_settings(MEMO_SLOW_REQUEST_MS=0)
+    def test_slow_request_logs_queries(self):
+        with self.assertLogs("memo.timing", "WARNING") as logs:
+            self.client.get(reverse("memo:detail", kwargs={"slug": self.memo.slug}))
+        self.assertIn("slow_request", logs.output[0])
+        self.assertIn("memo_memo", logs.output[0])
+
+    async def test_async_view(self):
+        await self.async_client.aforce_login(self.user)
+        with self.assertLogs("memo.timing", "INFO"):
+            res = await self.async_client.get("/async/")
+        timing = server_timing(res)
+        self.assertIn("render", timing)
+        self.assertIn("db", timing)
+        self.assertNotRegex(res.headers["Server-Timing"], r"\(0 queries\)")
+
+
+class TestServerTimingDisabled(TestCase):
+    def test_no_header(self):
+        user = get_user_model().objects.create_user(username="user", password="password")
+        self.client.force_login(user)
+        res = self.client.get(reverse("memo:memo"))
+        self.assertNotIn("Server-Timing", res.headers)
@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
@@ -76,6 +78,17 @@ class TestMyMemoList(TestCase):
         self.client.logout()
         res = self.client.get(reverse("memo:memo"))
         self.assertEqual(res.status_code, 302)
+
+    def test_get_content_preview(self):
+        # 一覧では内容すべてを読まずに先頭だけを表示する
+        Memo.objects.create(title="long", content="あ" * 60 + "末尾", user=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(reverse("memo:memo"))
+        self.assertContains(res, "あ" * 49 + "…")
+        self.assertNotContains(res, "末尾")
+        memo_queries = [q["sql"] for q in ctx.captured_queries if '"memo_memo"."content"' in q["sql"]]
+        self.assertTrue(memo_queries)
+        self.assertTrue(all("SUBSTR" in sql for sql in memo_queries))
         
 
 
@@ -0,0 +1,109 @@
+"""リクエストごとの処理時間の計測(ServerTimingMiddleware)
+
+計測中のリクエストの RequestTimings は contextvar に入れるので、timer() は計測していないときは何もしない。
+SQLはDBの接続ごとに execute_wrappers に record_query を追加して計測する。
+"""
+import heapq
+import time
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+# 遅いリクエストのログに出す、時間のかかったクエリの数
+SLOW_QUERY_COUNT = 5
+
+_current = ContextVar("memo_request_timings", default=None)
+
+
+class RequestTimings:
+    """1リクエストの区間ごとの合計時間(秒)と、SQLの件数・時間"""
+
+    def __init__(self):
+        self.durations = {}
+        self.active = set()
+        self.query_count = 0
+        self.query_time = 0.0
+        # (時間, SQL) の時間が長いものSLOW_QUERY_COUNT件
+        self.slow_queries = []
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def add_query(self, sql, seconds):
+        self.query_count += 1
+        self.query_time += seconds
+        if len(self.slow_queries) < SLOW_QUERY_COUNT:
+            heapq.heappush(self.slow_queries, (seconds, sql))
+        elif seconds > self.slow_queries[0][0]:
+            heapq.heapreplace(self.slow_queries, (seconds, sql))
+
+    def slowest_queries(self):
+        return sorted(self.slow_queries, reverse=True)
+
+
+def current_timings():
+    """計測中のリクエストの RequestTimings。計測していなければNone"""
+    return _current.get()
+
+
+def start_timings():
+    """計測を始める。戻り値は stop_timings に渡す"""
+    return _current.set(RequestTimings())
+
+
+def stop_timings(token):
+    timings = _current.get()
+    _current.reset(token)
+    return timings
+
+
+class timer:
+    """with timer("slug"): の中の時間を計測中のリクエストに加える
+
+    同じ名前の timer の中で呼ばれたとき(シリアライザのmany=Trueなど)は二重に数えない。
+    """
+    __slots__ = ("name", "timings", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.timings = None
+
+    def __enter__(self):
+        timings = _current.get()
+        if timings is not None and self.name not in timings.active:
+            timings.active.add(self.name)
+            self.timings = timings
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.name, time.perf_counter() - self.start)
+            self.timings.active.discard(self.name)
+            self.timings = None
+
+
+def record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, time.perf_counter() - start)
+
+
+def _add_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        # connection.execute_wrapper() は最後の要素を取り除くので、先頭に入れる
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def install_query_recorder():
+    """これから作る接続とこのスレッドの接続済みの接続でSQLを計測する"""
+    connection_created.connect(_add_query_recorder, dispatch_uid="memo.timing.record_query")
+    for connection in connections.all(initialized_only=True):
+        _add_query_recorder(connection)
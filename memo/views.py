@@ -1,10 +1,18 @@
 from django.views.generic import ListView, UpdateView, DeleteView, DetailView, CreateView
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.paginator import PageNotAnInteger, EmptyPage
+from django.core.paginator import Page, PageNotAnInteger, EmptyPage
+from django.conf import settings
+from django.http import Http404, HttpResponse
 
 from .models import Memo
 from .forms import MemoForm
+from .cache import get_or_compute
+from .conditional import conditional_response, html_variant, list_etag, memo_etag, set_validators
+from .pagination import paginate_keyset
+from .search import search_memos
+from .stats import user_stats
+from . import metrics
 
 
 class UserInjectMixin:
@@ -20,6 +28,8 @@ class UserInjectMixin:
 class MemoListView(LoginRequiredMixin, ListView):
     """メモ帳一覧を表示する。タイトルとメモ内容を表示"""
     template_name = "memo.html"
+    # GETのときはレプリカから読む(ReplicaMiddleware)
+    read_from_replica = True
     paginate_by = 9 
     paginate_orphans = 2 # 最終ページ2つだけなら前ページに含める
     # context_object_name = "memos"
@@ -27,16 +37,72 @@ class MemoListView(LoginRequiredMixin, ListView):
     
     def get_queryset(self):
         if self.request.user.is_authenticated:
-            qs = Memo.objects.filter(user=self.request.user)
-            category = self.request.GET.get("category")
-            if category:
-                qs = qs.filter(category=category)
+            qs = Memo.objects.for_user(self.request.user)
             # カテゴリごとでクエリセットを絞れる
-            return qs.order_by("-priority", "-updated_at", "-created_at")
+            qs = qs.in_category(self.request.GET.get("category"))
+            query = self.request.GET.get("q", "").strip()
+            # 一覧では内容の先頭だけを表示するので、内容すべては読まない
+            qs = qs.with_content_preview()
+            if query:
+                # 検索語があるときは関連度の高い順に並んだリストになる
+                return search_memos(qs, self.request.user, query)
+            return qs.ordered()
         else:
             return Memo.objects.none()
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("q", "").strip():
+            return super().get(request, *args, **kwargs)
+        # メモが変更されていなければ304を返す
+        category = request.GET.get("category")
+        # 絞り込みの選択肢にすべてのカテゴリーの件数を表示するので、件数が変わったら別のETagにする
+        self.stats = user_stats(request.user)
+        counts = sorted(self.stats["category"].items())
+        etag = list_etag(request.user, self.get_queryset(), *html_variant(request), counts, category=category)
+        response = conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return set_validators(response, etag=etag)
     
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        stats = getattr(self, "stats", None) or user_stats(self.request.user)
+        counts = stats["category"]
+        context["category_choices"] = [(value, label, counts.get(value, 0)) for value, label in Memo.CATEGORY]
+        context["memo_total"] = sum(counts.values())
+        return context
+
     def paginate_queryset(self, queryset, page_size):
+        if self.request.GET.get("q", "").strip():
+            # 検索結果はキャッシュしない
+            return self._paginate(queryset, page_size)
+        params = {name: self.request.GET.get(name) for name in ("category", "page", "cursor")}
+        params.update(page_size=page_size, cursor_pagination=settings.MEMO_CURSOR_PAGINATION)
+        # COUNTと1ページ分のメモだけをキャッシュし、Paginatorはキャッシュした件数から作り直す
+        count, number, object_list, page_obj = get_or_compute(
+            self.request.user.pk, "page", params, lambda: self._page_data(queryset, page_size)
+        )
+        if page_obj is not None:
+            return (None, page_obj, page_obj.object_list, page_obj.has_other_pages())
+        paginator = self.get_paginator(queryset, page_size, orphans=self.paginate_orphans)
+        paginator.count = count
+        page_obj = Page(object_list, number, paginator)
+        return (paginator, page_obj, page_obj.object_list, page_obj.has_other_pages())
+
+    def _page_data(self, queryset, page_size):
+        """キャッシュする値: (件数, ページ番号, メモのリスト, カーソルのときはKeysetPage)"""
+        paginator, page_obj, object_list, _ = self._paginate(queryset, page_size)
+        if paginator is None:
+            return (None, None, None, page_obj)
+        return (paginator.count, page_obj.number, list(object_list), None)
+
+    def _paginate(self, queryset, page_size):
+        if settings.MEMO_CURSOR_PAGINATION and not self.request.GET.get("q"):
+            # カーソルでページを取得する。COUNTを使わないのでpaginatorはない
+            page_obj = paginate_keyset(
+                queryset, self.request.GET.get("cursor"), page_size, orphans=self.paginate_orphans
+            )
+            return (None, page_obj, page_obj.object_list, page_obj.has_other_pages())
         # 存在しないページのとき１ページ目を返すように設定
         paginator = self.get_paginator(queryset, page_size, orphans=self.paginate_orphans)
         page = self.request.GET.get(self.page_kwarg) or 1
@@ -59,13 +125,22 @@ class MemoCreateView(LoginRequiredMixin, UserInjectMixin, CreateView):
 class MemoDetailView(LoginRequiredMixin, DetailView):
     model = Memo
     template_name = "detail.html"
+    read_from_replica = True
     context_object_name = "memo"
     slug_url_kwarg = "slug"
     slug_field = "slug"
     
     def get_queryset(self):
         # user=self.request.user で自分のオブジェクトしか見れなくなる。
-        return Memo.objects.filter(user=self.request.user)
+        return Memo.objects.for_user(self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        etag = memo_etag(self.object, *html_variant(request))
+        response = conditional_response(request, etag=etag, last_modified=self.object.updated_at)
+        if response is None:
+            response = self.render_to_response(self.get_context_data(object=self.object))
+        return set_validators(response, etag=etag, last_modified=self.object.updated_at)
 
 class MemoEditView(LoginRequiredMixin, UpdateView):
     model = Memo
@@ -77,7 +152,7 @@ class MemoEditView(LoginRequiredMixin, UpdateView):
         return reverse_lazy("memo:detail", kwargs={"slug": self.object.slug})
     
     def get_queryset(self):
-        return Memo.objects.filter(user=self.request.user)
+        return Memo.objects.for_user(self.request.user)
     
 
 class MemoDeleteView(LoginRequiredMixin,  DeleteView):
@@ -88,7 +163,14 @@ class MemoDeleteView(LoginRequiredMixin,  DeleteView):
     slug_url_kwarg = "slug"
 
     def get_queryset(self):
-        return Memo.objects.filter(user=self.request.user)
+        return Memo.objects.for_user(self.request.user)
 
 
     
+
+
+def metrics_view(request):
+    """/metrics Prometheusのテキスト形式のメトリクス(MEMO_METRICS=True のときだけ)"""
+    if not settings.MEMO_METRICS:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
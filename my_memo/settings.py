@@ -52,11 +52,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # MEMO_SERVER_TIMING=True のときだけ使う。ほかのミドルウェアのクエリも含めるので最初に置く
+    'memo.middleware.ServerTimingMiddleware',
+    # MEMO_METRICS=True のときだけ使う
+    'memo.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # DB_REPLICA_NAMES を設定したときだけ使う
+    'memo.middleware.ReplicaMiddleware',
+    # DB_SHARD_NAMES を設定したときだけ使う
+    'memo.middleware.ShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -98,6 +106,74 @@ DATABASES = {
     }
 }
 
+# PostgreSQLの接続の使い回し
+# DB_POOL=True: psycopgのコネクションプール(psycopg-pool)を使う。ワーカーのプロセスごとにプールを持つ
+# DB_POOL=False: DB_CONN_MAX_AGE 秒の間、リクエストをまたいで接続を使い回す(0ならリクエストごとに接続する)
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql" and env.bool("DB_POOL", default=False):
+    from psycopg_pool import ConnectionPool
+
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": env.int("DB_POOL_MIN_SIZE", default=2),
+            "max_size": env.int("DB_POOL_MAX_SIZE", default=10),
+            # 空きがないときに接続を待つ秒数
+            "timeout": env.float("DB_POOL_TIMEOUT", default=10.0),
+            # 使われていない接続を閉じるまでの秒数と、接続を作り直すまでの秒数
+            "max_idle": env.float("DB_POOL_MAX_IDLE", default=600.0),
+            "max_lifetime": env.float("DB_POOL_MAX_LIFETIME", default=3600.0),
+            # 取り出すときに接続が切れていないか確かめる
+            "check": ConnectionPool.check_connection,
+        },
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = env.int("DB_CONN_MAX_AGE", default=0)
+    # 使い回す接続は、リクエストの最初に切れていないか確かめる
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# 読み取り用のレプリカ。DB_REPLICA_NAMES にDB名(SQLiteはファイルのパス)をカンマ区切りで指定する
+# DB_REPLICA_HOSTS は同じ順番のホスト(省略したものはDB_HOST)。ユーザー、パスワード、ポートはプライマリと同じ
+DB_REPLICA_NAMES = env.list("DB_REPLICA_NAMES", default=[])
+DB_REPLICA_HOSTS = env.list("DB_REPLICA_HOSTS", default=[])
+MEMO_REPLICAS = []
+for _index, _name in enumerate(DB_REPLICA_NAMES, start=1):
+    DATABASES[f"replica{_index}"] = {
+        **DATABASES["default"],
+        "NAME": _name,
+        "HOST": DB_REPLICA_HOSTS[_index - 1] if _index <= len(DB_REPLICA_HOSTS) else DATABASES["default"]["HOST"],
+        # テストではプライマリのテスト用DBをそのまま使う
+        "TEST": {"MIRROR": "default"},
+    }
+    MEMO_REPLICAS.append(f"replica{_index}")
+
+# シャーディング。DB_SHARD_NAMES に default 以外のシャードのDB名をカンマ区切りで指定する(DB_SHARD_HOSTS はホスト)
+# メモは memo.models.UserShard に記録したシャードに保存する。移動は move_user_shard コマンドで行う
+DB_SHARD_NAMES = env.list("DB_SHARD_NAMES", default=[])
+DB_SHARD_HOSTS = env.list("DB_SHARD_HOSTS", default=[])
+MEMO_SHARDS = ["default"] if DB_SHARD_NAMES else []
+for _index, _name in enumerate(DB_SHARD_NAMES, start=1):
+    DATABASES[f"shard{_index}"] = {
+        **DATABASES["default"],
+        "NAME": _name,
+        "HOST": DB_SHARD_HOSTS[_index - 1] if _index <= len(DB_SHARD_HOSTS) else DATABASES["default"]["HOST"],
+    }
+    MEMO_SHARDS.append(f"shard{_index}")
+
+DATABASE_ROUTERS = (["memo.routers.ShardRouter"] if MEMO_SHARDS else []) + (
+    ["memo.routers.ReplicaRouter"] if MEMO_REPLICAS else []
+)
+
+# 書き込んだユーザーの読み込みをプライマリに向ける秒数。レプリカの遅延より長くする
+MEMO_REPLICA_STICKY_SECONDS = env.int("MEMO_REPLICA_STICKY_SECONDS", default=5)
+
+# キャッシュ。CACHE_URL で共有のキャッシュ(redis://127.0.0.1:6379/1 など)を指定する。未設定ならプロセスごとのメモリ
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+# すべてのワーカーから同じ値が見えるキャッシュか。プロセスごとのメモリでは、ほかのワーカーの変更が見えないので、
+# 一覧のキャッシュなどはデフォルトで使わない
+CACHE_SHARED = CACHES["default"]["BACKEND"] not in (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,6 +217,16 @@ STATIC_URL = 'static/'
 AUTH_USER_MODEL = "accounts.CustomUser"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+# True にするとセッション(cached_db)とログインしているユーザー(accounts.backends)をキャッシュから読み、
+# リクエストごとのセッションとユーザーのクエリをなくす。ログアウトや無効化がほかのワーカーに届かないので、
+# 共有のキャッシュ(CACHE_SHARED)がなければキャッシュしない
+AUTH_CACHE = env.bool("AUTH_CACHE", default=False)
+if AUTH_CACHE and CACHE_SHARED:
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+if AUTH_CACHE:
+    AUTHENTICATION_BACKENDS = ["accounts.backends.CachedModelBackend"]
+# ユーザーをキャッシュする秒数
+AUTH_USER_CACHE_TIMEOUT = env.int("AUTH_USER_CACHE_TIMEOUT", default=300)
 LOGIN_URL = "accounts:login"
 LOGIN_REDIRECT_URL = "memo:memo"
 LOGOUT_REDIRECT_URL = "accounts:login"
@@ -150,10 +236,51 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES":[
         "rest_framework.authentication.SessionAuthentication",
+        # 同期のクライアント用。Authorization: Token <トークン>(/api/tokens/ で発行する)
+        "accounts.authentication.ApiTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES":[
         "rest_framework.permissions.AllowAny",
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 5,
+}
+
+# APIのトークンの照合の結果を共有のキャッシュに保存する秒数(CACHE_SHARED でなければキャッシュしない)
+API_TOKEN_CACHE_TIMEOUT = env.int("API_TOKEN_CACHE_TIMEOUT", default=300)
+
+# True にするとメモ一覧とAPIの一覧をCOUNT/OFFSETなしのカーソルページネーションにする
+MEMO_CURSOR_PAGINATION = env.bool("MEMO_CURSOR_PAGINATION", default=False)
+
+# メモ一覧とAPIの一覧をキャッシュする秒数。0でキャッシュしない
+# 共有のキャッシュがなければ、ほかのワーカーで変更した古い一覧を返してしまうのでデフォルトは0
+MEMO_LIST_CACHE_TIMEOUT = env.int("MEMO_LIST_CACHE_TIMEOUT", default=300 if CACHE_SHARED else 0)
+
+# True にすると起動時にpykakasiの辞書を読み込む(gunicornのワーカーなど常駐するプロセス向け)
+# False のときはslugの生成や検索の索引で最初に使うときに読み込む
+MEMO_KAKASI_WARMUP = env.bool("MEMO_KAKASI_WARMUP", default=False)
+
+# True にするとリクエストごとのSQLの件数・時間、レンダリング、シリアライザ、slugの生成の時間を
+# Server-Timingヘッダーと memo.timing のログに出す
+MEMO_SERVER_TIMING = env.bool("MEMO_SERVER_TIMING", default=False)
+
+# これより遅いリクエスト(ミリ秒)は時間のかかったクエリと一緒にWARNINGのログに出す
+MEMO_SLOW_REQUEST_MS = env.int("MEMO_SLOW_REQUEST_MS", default=500)
+
+# True にすると /metrics でPrometheusのテキスト形式のメトリクスを出す
+MEMO_METRICS = env.bool("MEMO_METRICS", default=False)
+
+# 複数のワーカーで動かすときに、ワーカーごとのメトリクスを書き出すディレクトリ(起動のたびに空にする)
+# 空のときはプロセスのメモリ上の値だけを出す
+MEMO_METRICS_DIR = env("MEMO_METRICS_DIR", default="")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "memo": {"handlers": ["console"], "level": env("MEMO_LOG_LEVEL", default="INFO")},
+    },
 }
\ No newline at end of file
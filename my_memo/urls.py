@@ -2,15 +2,28 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
 
+from accounts import api_views as accounts_api_views
 from memo import api_views as memo_api_views
+from memo import async_api_views as memo_async_api_views
+from memo.views import metrics_view
 
 router = routers.DefaultRouter()
 router.register("memo", memo_api_views.MemoViewSet, basename="memo")
+router.register("tokens", accounts_api_views.ApiTokenViewSet, basename="token")
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("", include("memo.urls")),
+    # ASGIで動かすときの非同期版の画面とAPI
+    path("async/", include("memo.async_urls", namespace="async_memo")),
+    path("api/async/memo/", memo_async_api_views.AsyncMemoListAPIView.as_view(), name="async_memo_api_list"),
+    path(
+        "api/async/memo/<int:pk>/",
+        memo_async_api_views.AsyncMemoDetailAPIView.as_view(),
+        name="async_memo_api_detail",
+    ),
+    path("metrics", metrics_view, name="metrics"),
     path("accounts/", include("accounts.urls")),
     path("api/", include(router.urls)),
     path("api-auth/", include("rest_framework.urls")),